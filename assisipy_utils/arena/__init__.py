@@ -5,12 +5,26 @@ Rob Mills, BioISI, FCUL.
 A library of utilities relating to arena construction, manipulation, spawing,
 and rendering.
 
-This initialiser sets up the most useful parts of the interface.
+This initialiser sets up the most useful parts of the interface: those that
+the spawners need, which stay cheap to import.  The heavier optional modules
+are imported from their own submodules, e.g.
+
+    from assisipy_utils.arena.scene import Scene
+    from assisipy_utils.arena.cache import cached_arena
+    from assisipy_utils.arena.sdf import arena_sdf
+    from assisipy_utils.arena.occupancy import occupancy_from_logdir
+    from assisipy_utils.arena.layout import optimise_layout
 
 '''
 
 
 from constructors import StadiumArena, CircleArena, RoundedRectArena, RoundedRectBarrier
 from transforms import Transformation
-from minimal_arenas import gen_valid_bee_positions, read_reqs
-
+from polyset import PolySet
+from minimal_arenas import gen_valid_bee_positions, read_reqs, read_zone
+from spawning import SpawnBatch
+from placement import gen_spaced_bee_positions, casu_exclusions, read_casu_poses
+from popgen import gen_population, make_rng, new_seed, read_seed
+from specfile import read_spec, convert_spec
+from compute_area import arena_area, arena_perimeter, density, poly_areas, poly_perimeters
+from sharedmap import SharedOccupancyMap
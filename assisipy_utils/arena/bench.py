@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Micro-benchmarks for arena construction, transforms, placement
+           and rendering, with a comparison against a stored baseline.
+
+Each case is run at increasing sizes (segments per arc, or per corner for
+the rounded rectangles; numbers of agents or points), in a fresh child
+process so that the peak memory of one case does not hide that of the
+next.  Only numpy is needed, and matplotlib (Agg canvas) for the rendering
+case, which is skipped without it: no playground or display.
+
+Example usage:
+
+    assisi_arena_bench -o base.json                 # record a baseline
+    ... change code ...
+    assisi_arena_bench -o new.json -c base.json     # flag slowdowns
+
+The comparison exits with status 1 if any case is slower than `threshold`
+times its baseline (or uses `threshold` times the memory).
+
+'''
+
+from math import pi, cos
+import argparse
+import io
+import json
+import multiprocessing
+import pkgutil
+import platform
+import resource
+import sys
+import time
+from timeit import default_timer
+import numpy as np
+
+from constructors import StadiumArena, RoundedRectArena, RoundedRectBarrier, CircleArena
+from transforms import Point, Transformation, apply_transform_to_group, xy_from_seq
+from minimal_arenas import gen_valid_bee_positions
+
+ARC_STEPS = [9, 100, 1000, 10000]
+CORNER_STEPS = [10, 100, 1000, 10000] # (per corner)
+N_BEES    = [10, 1000, 100000, 1000000]
+N_POINTS  = [10, 1000, 100000]
+QUICK_MAX = 1000 # largest size used in --quick mode
+
+_CONSTRUCTORS = {
+    'stadium'      : StadiumArena,
+    'rounded_rect' : RoundedRectArena,
+    'barrier'      : RoundedRectBarrier,
+    'circle'       : CircleArena,
+}
+
+
+#{{{ cases
+# each case maps a size to a callable that runs the operation once; any
+# work done outside the callable (setup) is not timed.
+def _construct(cls):
+    def setup(steps):
+        return lambda: cls(arc_steps=steps)
+    return setup
+
+def _construct_corners(cls, corner_rad=1.5):
+    '''
+    as `_construct`, for the rounded rectangles, which ignore `arc_steps`:
+    their corners get `steps` segments each via the equivalent `arc_tol`
+    '''
+    def setup(steps):
+        half = pi / (4.0 * steps) # half the angle of each segment
+        tol = corner_rad * (1.0 - cos(half)) * (1 + 1e-6)
+        return lambda: cls(corner_rad=corner_rad, arc_tol=tol)
+    return setup
+
+def _transform_polyset(steps):
+    polys = CircleArena(arc_steps=steps).polys
+    T = Transformation(dx=3.0, dy=-2.0, theta=0.7)
+    return lambda: apply_transform_to_group(polys, T)
+
+def _transform_segs(steps):
+    segs = CircleArena(arc_steps=steps).segs
+    T = Transformation(dx=3.0, dy=-2.0, theta=0.7)
+    return lambda: apply_transform_to_group(segs, T)
+
+def _gen_positions(n):
+    va = ((-5.0, -3.0), (5.0, 3.0))
+    T = Transformation(dx=3.0, dy=-2.0, theta=0.7)
+    rng = np.random.RandomState(1)
+    return lambda: gen_valid_bee_positions(va, n=n, trans=T, rng=rng, as_array=True)
+
+def _xy_from_seq(n):
+    seq = [Point(float(i), float(-i), 0) for i in xrange(n)]
+    return lambda: xy_from_seq(seq)
+
+def _render(steps):
+    from rendering import render_job # (needs matplotlib)
+    A = CircleArena(arc_steps=steps)
+    # (rendered to memory, so no files are left behind)
+    job = {'fname': io.BytesIO(), 'arenas': [A], 'zone': True, 'dpi': 50,
+           'agents': A.sample_positions(100, rng=np.random.RandomState(1))}
+    def run():
+        job['fname'].seek(0)
+        render_job(job)
+    return run
+
+def cases():
+    ''' list of (name, sizes, setup) for all benchmark cases '''
+    C = []
+    for name in sorted(_CONSTRUCTORS):
+        cls = _CONSTRUCTORS[name]
+        if cls in (RoundedRectArena, RoundedRectBarrier):
+            C.append(('construct_' + name, CORNER_STEPS, _construct_corners(cls)))
+        else:
+            C.append(('construct_' + name, ARC_STEPS, _construct(cls)))
+    C += [
+        ('transform_polyset', ARC_STEPS, _transform_polyset),
+        ('transform_segs',    ARC_STEPS, _transform_segs),
+        ('gen_valid_bee_positions', N_BEES, _gen_positions),
+        ('xy_from_seq',       N_POINTS, _xy_from_seq),
+    ]
+    if _have_matplotlib():
+        C.append(('render',   ARC_STEPS, _render))
+    return C
+
+def _have_matplotlib():
+    return pkgutil.find_loader('matplotlib') is not None
+#}}}
+
+#{{{ measurement
+def _rss_kb():
+    ''' current resident set size, in kB (0 if not available) '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return 0
+
+def _measure(setup, size, min_time, repeat):
+    '''
+    run one case: returns (best, mean, runs, peak_kb), the times in
+    seconds. The callable is run at least `repeat` times, and until
+    `min_time` seconds have been spent.
+    '''
+    base = _rss_kb()
+    fn = setup(size)
+    times = []
+    t_total = 0.0
+    while len(times) < repeat or t_total < min_time:
+        t0 = default_timer()
+        fn()
+        dt = default_timer() - t0
+        times.append(dt)
+        t_total += dt
+        if len(times) >= 1000:
+            break
+    # ru_maxrss is in kB on linux (bytes on OS X)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return min(times), sum(times) / len(times), len(times), max(peak - base, 0)
+
+def _child(q, setup, size, min_time, repeat):
+    try:
+        q.put(('ok', _measure(setup, size, min_time, repeat)))
+    except Exception as e:
+        q.put(('err', repr(e)))
+
+def run_case(setup, size, min_time=0.2, repeat=3, isolate=True):
+    '''
+    measure `setup(size)`, in a child process if `isolate`. Returns a dict
+    with best/mean times, number of runs, and peak memory (kB above the
+    resident size at the start).
+    '''
+    if isolate:
+        q = multiprocessing.Queue()
+        p = multiprocessing.Process(target=_child,
+                                    args=(q, setup, size, min_time, repeat))
+        p.start()
+        status, res = q.get()
+        p.join()
+        if status != 'ok':
+            raise RuntimeError("[E] benchmark failed: {}".format(res))
+    else:
+        res = _measure(setup, size, min_time, repeat)
+    best, mean, runs, peak = res
+    return {'best_s': best, 'mean_s': mean, 'runs': runs, 'peak_kb': peak}
+
+def run_all(select=None, quick=False, min_time=0.2, repeat=3, isolate=True,
+            verb=True):
+    '''
+    run all cases (or those whose name contains one of the strings in
+    `select`), returning the results document.
+    '''
+    results = []
+    for name, sizes, setup in cases():
+        if select and not any(s in name for s in select):
+            continue
+        for size in sizes:
+            if quick and size > QUICK_MAX:
+                continue
+            r = run_case(setup, size, min_time=min_time, repeat=repeat,
+                         isolate=isolate)
+            r.update({'case': name, 'size': size})
+            results.append(r)
+            if verb:
+                print "{:28s} {:>8d}  best {:10.6f}s  mean {:10.6f}s  peak {:>8d}kB".format(
+                    name, size, r['best_s'], r['mean_s'], r['peak_kb'])
+    meta = {
+        'time'     : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python'   : platform.python_version(),
+        'numpy'    : np.__version__,
+        'platform' : platform.platform(),
+    }
+    return {'meta': meta, 'results': results}
+#}}}
+
+#{{{ comparison
+def compare(base, new, threshold=1.25, min_kb=4096):
+    '''
+    compare two results documents. Returns a list of (case, size, what,
+    old, new, ratio) for every slowdown beyond `threshold` (best times), or
+    memory increase beyond `threshold` (only if over `min_kb`).
+    '''
+    old = dict(((r['case'], r['size']), r) for r in base['results'])
+    flagged = []
+    for r in new['results']:
+        key = (r['case'], r['size'])
+        if key not in old:
+            continue
+        o = old[key]
+        if o['best_s'] > 0:
+            ratio = r['best_s'] / o['best_s']
+            if ratio > threshold:
+                flagged.append(key + ('time', o['best_s'], r['best_s'], ratio))
+        if r['peak_kb'] > min_kb and r['peak_kb'] > threshold * max(o['peak_kb'], min_kb):
+            ratio = r['peak_kb'] / float(max(o['peak_kb'], 1))
+            flagged.append(key + ('memory', o['peak_kb'], r['peak_kb'], ratio))
+    return flagged
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'benchmark arena construction, transforms, placement and rendering')
+    parser.add_argument('-o', '--out', type=str, default=None,
+                        help='write results as JSON to this file')
+    parser.add_argument('-c', '--compare', type=str, default=None,
+                        help='baseline JSON file to compare against')
+    parser.add_argument('-t', '--threshold', type=float, default=1.25,
+                        help='ratio above baseline that counts as a regression')
+    parser.add_argument('-k', '--select', type=str, nargs='*', default=None,
+                        help='only run cases whose name contains one of these')
+    parser.add_argument('-q', '--quick', action='store_true',
+                        help='skip the largest sizes')
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run all cases in this process')
+    args = parser.parse_args()
+
+    res = run_all(select=args.select, quick=args.quick, min_time=args.min_time,
+                  repeat=args.repeat, isolate=not args.no_isolate)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(res, f, indent=1, sort_keys=True)
+        print "[I] wrote results to {}".format(args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        flagged = compare(base, res, threshold=args.threshold)
+        for case, size, what, o, n, ratio in flagged:
+            print "[W] {} (size {}): {} {:.4g} -> {:.4g} ({:.2f}x)".format(
+                case, size, what, o, n, ratio)
+        if flagged:
+            print "[E] {} regression(s) against {}".format(len(flagged), args.compare)
+            sys.exit(1)
+        print "[I] no regressions against {}".format(args.compare)
+
+if __name__ == '__main__':
+    main()
+#}}}
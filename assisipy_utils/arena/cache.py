@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Cache of constructed arena geometry.
+
+Building an arena computes all of its wall segments; when the same arena
+is built again (by every spawner of every repeat, or by sweeps that render
+many variants) the result can be reused instead.  Entries are keyed on the
+arena class, its geometric constructor parameters, and the package
+version, and are held in memory (with least-recently-used eviction) and
+optionally in a directory, as `.npy` vertex/offset arrays (memory-mapped
+when read) plus a yaml file of the remaining attributes.
+
+Example usage:
+
+    A = cached_arena(StadiumArena, width=6.0, length=16.0, ww=0.5,
+                     label_stub='arena-1')
+    print default_cache()   # hits/misses
+
+The directory used by `cached_arena` is given by the environment variable
+ASSISI_ARENA_CACHE (no disk cache if unset).
+
+'''
+
+from collections import OrderedDict
+import hashlib
+import inspect
+import os
+import numpy as np
+
+from assisipy_utils import __version__
+from constructors import BaseArena
+from polyset import PolySet
+from zones import zone_from_dict
+
+# keyword arguments that do not affect the geometry
+_COSMETIC = ('color', 'label_stub', 'height')
+# attributes set by BaseArena.__init__ (or via the geometry/transform
+# properties); not cached
+_BASE_ATTRS = ('ww', 'color', 'label_stub', 'height', 'arc_tol', 'gap_tol',
+               '_trans', '_base', '_ctr', '_view', '_view_key', '_segs_cache')
+
+
+#{{{ keys
+def arena_key(cls, args=(), kwargs=None):
+    '''
+    content key for `cls(*args, **kwargs)`: all arguments are bound to
+    their parameter names (so defaults given explicitly or not agree), and
+    cosmetic keywords are dropped.
+    '''
+    kwargs = dict(kwargs or {})
+    bound = inspect.getcallargs(cls.__init__, None, *args, **kwargs)
+    bound.pop('self', None)
+    extra = bound.pop('kwargs', {})
+    for k in _COSMETIC:
+        extra.pop(k, None)
+    bound.update(extra)
+    desc = "{}.{}|{}|{}".format(cls.__module__, cls.__name__, __version__,
+                                repr(sorted(bound.items())))
+    return hashlib.sha1(desc).hexdigest()
+#}}}
+
+#{{{ ArenaCache
+class ArenaCache(object):
+    '''
+    memory (LRU, `maxsize` entries) and optional on-disk cache of arena
+    geometry.  Each entry is (PolySet, attribute dict).
+    '''
+    def __init__(self, maxsize=64, cache_dir=None):
+        self.maxsize   = maxsize
+        self.cache_dir = cache_dir
+        self._mem = OrderedDict()
+        self.hits = 0       # served from memory
+        self.disk_hits = 0  # served from cache_dir
+        self.misses = 0     # built from scratch
+
+    def __len__(self):
+        return len(self._mem)
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'entries': len(self._mem)}
+
+    def __str__(self):
+        return "ArenaCache: {hits} hits, {disk_hits} disk hits, {misses} misses, {entries} entries".format(**self.stats())
+
+    def __repr__(self):
+        return self.__str__()
+
+    def clear(self):
+        self._mem.clear()
+
+    #{{{ entries
+    def _remember(self, key, entry):
+        self._mem.pop(key, None)
+        self._mem[key] = entry # most recent last
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    def _stem(self, key):
+        return os.path.join(self.cache_dir, 'arena-{}'.format(key))
+
+    def _load(self, key):
+        stem = self._stem(key)
+        if not os.path.exists(stem + '.yaml'):
+            return None
+        import yaml
+        with open(stem + '.yaml') as f:
+            attrs = yaml.safe_load(f)
+        polys = PolySet(np.load(stem + '.verts.npy', mmap_mode='r'),
+                        np.load(stem + '.offsets.npy'))
+        for k, v in attrs.items():
+            if isinstance(v, dict) and 'kind' in v:
+                attrs[k] = zone_from_dict(v) # zone, interior
+            elif isinstance(v, list):
+                attrs[k] = tuple(v)
+        return polys, attrs
+
+    def _save(self, key, polys, attrs):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        meta = {}
+        for k, v in attrs.items():
+            if hasattr(v, 'to_dict'):
+                v = v.to_dict() # zone, interior
+            elif isinstance(v, tuple):
+                v = list(v)
+            meta[k] = v
+        import yaml
+        # write under a private name, then move into place
+        stem = self._stem(key)
+        tmp = '{}.{}'.format(stem, os.getpid())
+        np.save(tmp + '.verts.npy', polys.verts)
+        np.save(tmp + '.offsets.npy', polys.offsets)
+        with open(tmp + '.yaml', 'w') as f:
+            yaml.safe_dump(meta, f, default_flow_style=False)
+        os.rename(tmp + '.verts.npy', stem + '.verts.npy')
+        os.rename(tmp + '.offsets.npy', stem + '.offsets.npy')
+        os.rename(tmp + '.yaml', stem + '.yaml') # last: marks entry complete
+    #}}}
+
+    def build(self, cls, *args, **kwargs):
+        '''
+        return `cls(*args, **kwargs)`, reusing cached geometry if the same
+        arena has been built before.  The cosmetic keywords (color,
+        label_stub, height) are always applied to the returned instance.
+        '''
+        key = arena_key(cls, args, kwargs)
+        entry = self._mem.get(key)
+        if entry is not None:
+            self.hits += 1
+        elif self.cache_dir is not None:
+            entry = self._load(key)
+            if entry is not None:
+                self.disk_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            obj = cls(*args, **kwargs)
+            attrs = dict((k, v) for (k, v) in obj.__dict__.items()
+                         if k not in _BASE_ATTRS)
+            entry = (obj.base_polys, attrs)
+            if self.cache_dir is not None:
+                self._save(key, obj.base_polys, attrs)
+            self._remember(key, entry)
+            return obj
+
+        self._remember(key, entry)
+        # restore without recomputing: common attributes via the base
+        # class, then the geometry. (PolySet arrays are shared, but are never
+        # modified in place -- transforms create new ones.)
+        polys, attrs = entry
+        bound = inspect.getcallargs(cls.__init__, None, *args, **kwargs)
+        obj = cls.__new__(cls)
+        BaseArena.__init__(obj, ww=bound.get('ww', 1.0), **bound.get('kwargs', {}))
+        obj.__dict__.update(attrs)
+        obj.polys = polys
+        return obj
+#}}}
+
+#{{{ default cache
+_default = None
+
+def default_cache():
+    ''' the shared cache used by `cached_arena` '''
+    global _default
+    if _default is None:
+        _default = ArenaCache(cache_dir=os.environ.get('ASSISI_ARENA_CACHE'))
+    return _default
+
+def cached_arena(cls, *args, **kwargs):
+    ''' build an arena via the shared cache (see ArenaCache.build) '''
+    return default_cache().build(cls, *args, **kwargs)
+#}}}
@@ -1,11 +1,250 @@
 '''
-I want to add this to the constructors but until all are done, just leave
-this one stand alone
-
+Areas, perimeters and centroids of arena geometry.
 
+- for polygons (wall segments, or any PolySet), by the shoelace formula,
+  vectorised over all polygons at once;
+- for the interior of an arena: the ring that the inner faces of its
+  walls enclose, measured in the same way;
+- for the valid zone of an arena (the region that agents are drawn from),
+  the closed forms of the zone itself;
+- for whole arenas and scenes, and the resulting agent densities.
 
 '''
 
+import numpy as np
+
+from polyset import PolySet
+from zones import to_world
+
+
+#{{{ polygons
+def _next_index(polys):
+    ''' index of the next vertex in the same polygon, for every vertex '''
+    nxt = np.arange(1, len(polys.verts) + 1)
+    o = polys.offsets
+    nonempty = o[1:] > o[:-1]
+    nxt[o[1:][nonempty] - 1] = o[:-1][nonempty]
+    return nxt
+
+def _per_poly(vals, polys):
+    ''' sum `vals` (one per vertex) within each polygon '''
+    out = np.zeros(len(polys))
+    o = polys.offsets
+    nonempty = o[1:] > o[:-1]
+    if nonempty.any():
+        out[nonempty] = np.add.reduceat(vals, o[:-1][nonempty])
+    return out
+
+def _as_polyset(polys):
+    if isinstance(polys, PolySet):
+        return polys
+    return PolySet.from_segs(polys)
+
+def poly_signed_areas(polys):
+    '''
+    signed area of each polygon in `polys` (a PolySet, or list of lists of
+    Points): positive if anticlockwise. A repeated closing vertex is fine.
+    '''
+    polys = _as_polyset(polys)
+    if not len(polys):
+        return np.zeros(0)
+    v = polys.verts
+    w = v[_next_index(polys)]
+    cross = v[:, 0] * w[:, 1] - w[:, 0] * v[:, 1]
+    return 0.5 * _per_poly(cross, polys)
+
+def poly_areas(polys):
+    ''' area of each polygon '''
+    return np.abs(poly_signed_areas(polys))
+
+def poly_perimeters(polys):
+    ''' perimeter of each polygon '''
+    polys = _as_polyset(polys)
+    if not len(polys):
+        return np.zeros(0)
+    v = polys.verts
+    d = v[_next_index(polys)] - v
+    return _per_poly(np.hypot(d[:, 0], d[:, 1]), polys)
+
+def poly_centroids(polys):
+    ''' (M, 2) array of polygon centroids (area-weighted) '''
+    polys = _as_polyset(polys)
+    if not len(polys):
+        return np.zeros((0, 2))
+    v = polys.verts
+    w = v[_next_index(polys)]
+    cross = v[:, 0] * w[:, 1] - w[:, 0] * v[:, 1]
+    a6 = 3.0 * _per_poly(cross, polys)
+    a6[a6 == 0] = np.nan
+    cx = _per_poly((v[:, 0] + w[:, 0]) * cross, polys) / a6
+    cy = _per_poly((v[:, 1] + w[:, 1]) * cross, polys) / a6
+    return np.column_stack([cx, cy])
+#}}}
+
+#{{{ interior rings
+def _ray_hits(c, targets, a, b):
+    '''
+    for rays from `c` through each of `targets`, the index of the first of
+    the edges (a[j], b[j]) that each crosses (-1 if none)
+    '''
+    d = targets - c
+    e = b - a
+    w = a - c
+    denom = d[:, None, 0] * e[None, :, 1] - d[:, None, 1] * e[None, :, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[:, 0] * e[:, 1] - w[:, 1] * e[:, 0])[None, :] / denom
+        u = (w[None, :, 0] * d[:, None, 1] - w[None, :, 1] * d[:, None, 0]) / denom
+        # (open at the edge ends: a ray through a corner is decided by the
+        # rays aimed at the middle of each of the edges there)
+        hit = (denom != 0) & (t > 0) & (u > 1e-9) & (u < 1 - 1e-9)
+    t = np.where(hit, t, np.inf)
+    first = np.argmin(t, axis=1)
+    first[~hit.any(axis=1)] = -1
+    return first
+
+def _clip(ring, nrm, off):
+    ''' clip the convex `ring` to the half-plane nrm . p >= off '''
+    d = ring.dot(nrm) - off
+    nxt = np.roll(ring, -1, axis=0)
+    dn = np.roll(d, -1)
+    inside = d >= 0
+    cross = inside != (dn >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = np.where(cross, d / (d - dn), 0.0)
+    out = np.empty((2 * len(ring), 2))
+    out[0::2] = ring
+    out[1::2] = ring + f[:, None] * (nxt - ring)
+    keep = np.empty(2 * len(ring), dtype=bool)
+    keep[0::2] = inside
+    keep[1::2] = cross
+    return out[keep]
+
+def interior_ring(polys, ctr, margin=0.0, chunk=512):
+    '''
+    the region enclosed by the walls `polys` (a PolySet, in any frame),
+    seen from `ctr`, a point inside it: an (M, 2) anticlockwise ring, or
+    None if the walls do not enclose `ctr`. With `margin`, the region is
+    shrunk to the points at least that far from every wall.
+
+    The faces that bound the region are those met first by rays from
+    `ctr` towards the middle of every wall edge; the region is the
+    intersection of their half-planes, with corners where neighbouring
+    faces cross (e.g. the overlapping inner faces of arc segments).
+    This holds for convex enclosures, as all of the arena types are.
+    '''
+    polys = _as_polyset(polys)
+    if not len(polys):
+        return None
+    ctr = np.asarray(ctr, dtype=float)
+    a = polys.verts
+    b = a[_next_index(polys)]
+    mids = 0.5 * (a + b)
+    faces = np.unique(np.concatenate(
+        [_ray_hits(ctr, mids[i:i + chunk], a, b)
+         for i in xrange(0, len(mids), chunk)]))
+    faces = faces[faces >= 0]
+
+    lo, hi = a.min(axis=0), a.max(axis=0)
+    pad = 1.0 + (hi - lo).max()
+    ring = np.array([[lo[0] - pad, lo[1] - pad], [hi[0] + pad, lo[1] - pad],
+                     [hi[0] + pad, hi[1] + pad], [lo[0] - pad, hi[1] + pad]])
+    for j in faces:
+        e = b[j] - a[j]
+        nrm = np.array([-e[1], e[0]]) / np.hypot(e[0], e[1])
+        if nrm.dot(ctr - a[j]) < 0:
+            nrm = -nrm # (towards ctr)
+        ring = _clip(ring, nrm, nrm.dot(a[j]) + margin)
+        if not len(ring):
+            return None
+    # the faces must close the region, within the extent of the walls
+    tol = 1e-9 * pad
+    if (ring.min(axis=0) < lo - tol).any() or (ring.max(axis=0) > hi + tol).any():
+        return None
+    return ring
+
+def _interior(arena):
+    '''
+    the region inside the walls of `arena` as a PolySet of one ring, in
+    world coordinates. Arenas that do not enclose a region (e.g. barriers)
+    use the rectangle of `bl_bound`, `tr_bound`.
+    '''
+    (x0, y0), (x1, y1) = arena.bl_bound, arena.tr_bound
+    ctr = to_world(np.array([[0.5 * (x0 + x1), 0.5 * (y0 + y1)]]),
+                   arena.trans, arena._zone_ctr())[0]
+    ring = interior_ring(arena.polys, ctr)
+    if ring is None:
+        ring = to_world(np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=float),
+                        arena.trans, arena._zone_ctr())
+    return PolySet(ring)
+#}}}
+
+#{{{ arenas and scenes
+def _check_region(which):
+    if which not in ('interior', 'zone'):
+        raise ValueError("[E] region must be 'interior' or 'zone', not '{}'".format(which))
+
+def arena_area(arena, which='interior'):
+    '''
+    area of the region inside the walls of `arena` ('interior'; see
+    `_interior`), or of its valid zone ('zone'), from which agents are
+    drawn. Also accepts a Scene, for which the areas of all arenas are
+    summed.
+    '''
+    _check_region(which)
+    if hasattr(arena, 'arenas'):
+        return sum(arena_area(A, which) for A in arena.arenas)
+    if which == 'zone':
+        return float(arena.valid_zone().area())
+    return float(poly_areas(_interior(arena))[0])
+
+def arena_perimeter(arena, which='interior'):
+    ''' perimeter of the region (see `arena_area`) '''
+    _check_region(which)
+    if hasattr(arena, 'arenas'):
+        return sum(arena_perimeter(A, which) for A in arena.arenas)
+    if which == 'zone':
+        return float(arena.valid_zone().perimeter())
+    return float(poly_perimeters(_interior(arena))[0])
+
+def arena_centroid(arena, which='interior'):
+    '''
+    centroid of the region (see `arena_area`), in world coordinates; for a
+    Scene, the area-weighted centroid.
+    '''
+    _check_region(which)
+    if hasattr(arena, 'arenas'):
+        a = np.array([arena_area(A, which) for A in arena.arenas])
+        c = np.array([arena_centroid(A, which) for A in arena.arenas])
+        return tuple((c * a[:, None]).sum(axis=0) / a.sum())
+    if which == 'zone':
+        c = to_world(np.array([arena.valid_zone().centroid()]),
+                     arena.trans, arena._zone_ctr())
+    else:
+        c = poly_centroids(_interior(arena))
+    return (c[0, 0], c[0, 1])
+
+def wall_area(arena):
+    '''
+    total area of the wall segments of `arena` (or Scene). Note: the
+    segments of arcs overlap slightly on their inner side, so this is an
+    upper bound on the area covered.
+    '''
+    if hasattr(arena, 'arenas'):
+        return sum(wall_area(A) for A in arena.arenas)
+    return poly_areas(arena.polys).sum()
+
+def density(n_bees, arena, which='zone'):
+    '''
+    agents per unit area, for `n_bees` in `arena` (or Scene); by default
+    over the valid zone, the region the agents are drawn from
+    '''
+    return n_bees / arena_area(arena, which)
+
+def n_for_density(rho, arena, which='zone'):
+    ''' number of agents needed for density `rho` in `arena` (or Scene) '''
+    return int(round(rho * arena_area(arena, which)))
+#}}}
+
 def area_stadium(l, w):
     '''
     stadium-shaped arena.
@@ -19,4 +258,3 @@ def area_stadium(l, w):
     a3 = a2
     print "{:.3f} + {:.3f} + {:.3f}".format(a1, a2, a3)
     return a1+a2+a3
-
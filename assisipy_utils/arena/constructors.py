@@ -10,13 +10,17 @@ Abstract : Constructor classes of enclosures for agents.
 
 '''
 
-from math import pi
+from math import pi, cos
 
 from transforms import Point, Transformation
-from transforms import rotate_polygon, translate_seq, apply_transform_to_group, xy_from_seq
-
-from minimal_arenas import create_arc_with_width
-import yaml
+from transforms import rotate_polygon, translate_seq, apply_transform_to_group
+
+from minimal_arenas import create_arc_with_width, arc_steps_for_tol, merge_collinear_walls
+from polyset import PolySet
+from decompose import merge_convex
+from zones import RectZone, interior_zone, sample_in_zone, to_local, to_world
+from specfile import write_spec
+import compute_area
 import itertools
 
 
@@ -27,33 +31,146 @@ ORIGIN = (0, 0, 0)
 class BaseArena(object):
     inst_id = itertools.count().next
     def __init__(self, ww=1.0, **kwargs):
+        '''
+        common keyword arguments for all arenas:
+            color, label_stub, height -- passed on when spawning
+            arc_tol -- max chord error of arcs, to set arc segment counts
+            gap_tol -- max gap between arc segments on the outside of wall
+        '''
 
         self.ww = ww
 
         self.bl_bound = (0,0)
         self.tr_bound = (0,0)
+        self.zone     = None # exact valid zone, if the arena defines one
+        self.interior = None # region inside the walls (zone without margin)
         self.trans    = Transformation()
 
-        self.segs = []
+        self.polys = PolySet()
         self.color      = kwargs.get('color', (0.5, 0.5, 0.5))
         label_default   = "arena-{}".format(BaseArena.inst_id())
         self.label_stub = kwargs.get('label_stub', label_default)
         self.height     = kwargs.get('height', 1.0)
+        # level of detail: if either tolerance is given, the number of
+        # segments in each arc is the minimum that satisfies it (overriding
+        # `arc_steps`), and collinear/degenerate walls are merged/dropped.
+        self.arc_tol    = kwargs.get('arc_tol', None) # max chord error
+        self.gap_tol    = kwargs.get('gap_tol', None) # max outer wall gap
 
     # not much point in getter/setter is there
     def set_wall_color(self, clr):
         self.color = clr
 
-    def transform(self, trans):
-        ''' apply transform to segments, in place '''
-        self.trans = Transformation(dx=trans.dx, dy=trans.dy, theta=trans.theta)
-        self.segs  = apply_transform_to_group(self.segs, trans)
+    #{{{ geometry and transform
+    # the wall geometry is held untransformed, as a polyset.PolySet in
+    # `base_polys`, together with the (composed) transform `trans`.  `polys`
+    # is the transformed view, computed on demand and cached until the
+    # transform changes; `segs` provides the list of lists of Points form of
+    # it (also cached).  Assigning to `polys` or `segs` replaces the
+    # untransformed geometry (rather than editing it in place).
+    def _get_polys(self):
+        t = self._trans
+        key = (t.dx, t.dy, t.theta)
+        if key == (0.0, 0.0, 0.0):
+            return self._base
+        if self._view_key != key:
+            self._view = self._base.transformed(t)
+            self._view_key = key
+            self._segs_cache = None
+        return self._view
+
+    def _set_polys(self, polys):
+        self._base = polys
+        self._ctr = None
+        self._view = self._view_key = None
+        self._segs_cache = None
+
+    polys = property(_get_polys, _set_polys)
+
+    @property
+    def base_polys(self):
+        ''' the untransformed wall geometry '''
+        return self._base
+
+    def _get_segs(self):
+        polys = self.polys
+        if self._segs_cache is None or self._segs_cache[0] is not polys:
+            self._segs_cache = (polys, polys.to_segs())
+        return self._segs_cache[1]
+
+    def _set_segs(self, segs):
+        self.polys = PolySet.from_segs(segs)
+
+    segs = property(_get_segs, _set_segs)
+
+    def _get_trans(self):
+        return self._trans
+
+    def _set_trans(self, trans):
+        self._trans = Transformation(dx=trans.dx, dy=trans.dy, theta=trans.theta)
+
+    trans = property(_get_trans, _set_trans)
+
+    def set_transform(self, trans):
+        '''
+        place the arena by `trans`, relative to its untransformed geometry
+        (replacing any earlier transform). This is O(1): the vertices are
+        only computed when `polys`/`segs` are next accessed.
+        '''
+        self.trans = trans
 
-    def write_bounds_spec(self, fname, ):
+    def transform(self, trans):
+        '''
+        move the arena by `trans`, from where it currently is: rotate about
+        its centre, then translate.  Successive calls compose (the centre
+        moves with the arena), so `trans` always gives the full placement.
+        '''
+        t = self._trans
+        self.trans = Transformation(dx=t.dx + trans.dx, dy=t.dy + trans.dy,
+                                    theta=t.theta + trans.theta)
+
+    def _base_ctr(self):
+        ''' centre of the untransformed walls, about which they rotate '''
+        if self._ctr is None:
+            self._ctr = self._base.find_ctr()
+        return self._ctr
+
+    @property
+    def n_bodies(self):
+        ''' number of physical objects that `spawn` will create '''
+        return len(self._base)
+    #}}}
+
+    #{{{ level of detail
+    def _lod_enabled(self):
+        return self.arc_tol is not None or self.gap_tol is not None
+
+    def _arc_steps(self, radius, sweep, steps):
+        '''
+        number of segments for an arc; `steps` unless a tolerance was given
+        '''
+        if not self._lod_enabled():
+            return steps
+        return arc_steps_for_tol(radius, sweep, width=self.ww,
+                                 chord_tol=self.arc_tol, gap_tol=self.gap_tol)
+
+    def _simplify_walls(self):
+        ''' merge collinear walls, drop empty ones (only if LOD enabled) '''
+        if self._lod_enabled():
+            self.polys = merge_collinear_walls(self.polys)
+    #}}}
+
+    def write_bounds_spec(self, fname, seed=None, fmt=None):
         '''
         write in a consistent way the specification of an arena
-        to include the bounds and the transform.
+        to include the bounds and the transform.  If `seed` is given, it
+        is recorded so that populations can be regenerated (see popgen).
+
+        `fmt` is 'yaml' or 'npz' (binary, also holding the wall geometry);
+        by default, 'npz' if `fname` ends in .npz, else 'yaml'.
         '''
+        if fmt is None:
+            fmt = 'npz' if fname.endswith('.npz') else 'yaml'
         # construct spec dictionary
         bs = {
             'base_bl': self.bl_bound,
@@ -63,10 +180,13 @@ class BaseArena(object):
                 'dy' : self.trans.dy,
                 'theta' : self.trans.theta,
             },
+            'zone'   : self.valid_zone().to_dict(),
         }
-        # write it to yaml file
-        with open(fname, 'w') as f:
-            yaml.safe_dump(bs, f, default_flow_style=False)
+        if seed is not None:
+            bs['seed'] = int(seed)
+        if fmt == 'npz':
+            bs['walls'] = self.polys
+        write_spec(fname, bs, fmt=fmt)
 
 
 
@@ -74,11 +194,65 @@ class BaseArena(object):
         '''
         apply a transform to a COPY of segments, and return/
         '''
-        return apply_transform_to_group(self.segs, trans)
+        return apply_transform_to_group(self.polys, trans).to_segs()
 
     def get_valid_zone(self):
         return  (self.bl_bound, self.tr_bound)
 
+    def valid_zone(self):
+        '''
+        return the zone (in the untransformed frame) in which agents can be
+        placed: the exact curved interior if the arena defines one, otherwise
+        the rectangle given by `bl_bound`, `tr_bound`.
+        '''
+        if self.zone is not None:
+            return self.zone
+        return RectZone(self.bl_bound, self.tr_bound)
+
+    def _zone_ctr(self):
+        '''
+        centre of rotation for the zone: the same as for the walls. (This
+        is the centre of `bl_bound`/`tr_bound`, as used by
+        gen_valid_bee_positions, for all arenas that are symmetric.)
+        '''
+        if not len(self._base):
+            return (0.5 * (self.bl_bound[0] + self.tr_bound[0]),
+                    0.5 * (self.bl_bound[1] + self.tr_bound[1]))
+        ctr = self._base_ctr()
+        return (ctr.x, ctr.y)
+
+    def contains(self, points):
+        '''
+        hit test: return a boolean array indicating which of the `points`
+        (an (N, 2) array of world positions, or (N, 3) poses) lie inside the
+        valid zone, i.e. inside the walls by at least the `bee_len` margin.
+        '''
+        local = to_local(points, self.trans, self._zone_ctr())
+        return self.valid_zone().contains(local)
+
+    def sample_positions(self, n, rng=None, theta_rng=(0, 2*pi)):
+        '''
+        return an (n, 3) array of poses (x, y, yaw), drawn uniformly from
+        the valid zone and transformed as the arena is. `rng` is an optional
+        numpy RandomState/Generator.
+        '''
+        poses = sample_in_zone(self.valid_zone(), n, rng=rng, theta_rng=theta_rng)
+        return to_world(poses, self.trans, self._zone_ctr())
+
+    def area(self, which='interior'):
+        '''
+        exact area inside the walls ('interior'), or of the valid zone
+        ('zone'); see compute_area.arena_area.
+        '''
+        return compute_area.arena_area(self, which)
+
+    def perimeter(self, which='interior'):
+        return compute_area.arena_perimeter(self, which)
+
+    def density(self, n_bees, which='zone'):
+        ''' agents per unit area, for `n_bees` agents in this arena '''
+        return compute_area.density(n_bees, self, which)
+
     def get_valid_zone_rect(self):
         '''
         return parameters xy, xspan, yspan suitable for rendering a rectangle
@@ -94,18 +268,42 @@ class BaseArena(object):
                       height=height)
 
 
-    def spawn(self, simctrl, verb=False, offset=0):
+    def merged_polys(self, tol=0.1):
+        '''
+        return a PolySet in which neighbouring wall segments are unioned into
+        convex polygons, each departing from the original segments by at most
+        `tol` (see decompose.merge_convex).
+        '''
+        return merge_convex(self.polys, tol=tol)
+
+    def spawn_specs(self, offset=0, merge_tol=None):
+        '''
+        return the list of (label, polygon) pairs that `spawn` sends, with
+        polygon a list of (x, y) tuples. Arguments as for `spawn`.
+        '''
+        polys = self.polys
+        if merge_tol is not None:
+            polys = self.merged_polys(tol=merge_tol)
+        return [("{}-{:03d}".format(self.label_stub, i+offset), pts)
+                for i, pts in enumerate(polys.xy_seqs())]
+
+    def spawn(self, simctrl, verb=False, offset=0, merge_tol=None):
         '''
         spawn the arena in the ASSISI playground instance with handle `simctrl`.
         The segments obtain names with numerical suffix. Optional int argument
         `offset` increments the starting index.
+        If `merge_tol` is given, the segments are first merged into fewer
+        convex polygons (see `merged_polys`), and those are spawned instead.
         '''
+        specs = self.spawn_specs(offset=offset, merge_tol=merge_tol)
+        if verb and merge_tol is not None:
+            print "[I] merged {} segments into {} polygons".format(
+                self.n_bodies, len(specs))
 
-        for i, poly in enumerate(self.segs):
-            label = "{}-{:03d}".format(self.label_stub, i+offset)
-            pts = xy_from_seq(poly)
+        for i, (label, pts) in enumerate(specs):
             if verb:
-                print "[I] attempting to spawn segment {}".format(label)
+                print "[I] attempting to spawn segment {} ({} of {})".format(
+                    label, i+1, len(specs))
 
             self._spawn_polygon(simctrl, pts, label, height=self.height, color=self.color)
 
@@ -149,14 +347,18 @@ class StadiumArena(BaseArena):
         # centre of the RH arc is ...
         # c_r = [(ex+2)*l , 3*l / 2.0 ]
         # c_l = [(0,        3*l / 2.0 ]
+        arc_steps = self._arc_steps(arc_rad, pi, arc_steps)
+        self.arc_steps = arc_steps
         arc_r = create_arc_with_width(cx=+lms/2.0, cy=0,
                                     radius=arc_rad,
                                     theta_0=pi/2.0, theta_end=-pi/2,
-                                    steps=arc_steps, width=ww)
+                                    steps=arc_steps, width=ww,
+                                    as_polyset=True)
         arc_l = create_arc_with_width(cx=-lms/2.0, cy=0,
                                     radius=arc_rad,
                                     theta_0=pi/2.0, theta_end=3*pi/2.0,
-                                    steps=arc_steps, width=ww)
+                                    steps=arc_steps, width=ww,
+                                    as_polyset=True)
 
         # compile a list of segments
         segs = []
@@ -168,10 +370,8 @@ class StadiumArena(BaseArena):
             seg = translate_seq(seg, dx=xo, dy=yo) # now translate the segment
             segs.append(seg)
 
-        segs.extend(arc_r)
-        segs.extend(arc_l)
-
-        self.segs = segs
+        self.polys = PolySet.concat([PolySet.from_segs(segs), arc_r, arc_l])
+        self._simplify_walls()
 
 
         ### compute the bounds within which agent bees can be spawned ###
@@ -186,6 +386,12 @@ class StadiumArena(BaseArena):
         self.bl_bound = (s_x + poly_wl[0].x + k, s_y + poly_wl[3].y + k )
         self.tr_bound = (n_x + poly_wl[2].x - k, n_y + poly_wl[1].y - k )
 
+        # the exact zone: within the inner face of the (polygonal) end arcs,
+        # which is closest to the centre at the middle of each segment.
+        r_in = arc_rad * cos(pi / (2.0 * arc_steps)) - ww / 2.0
+        self.interior = interior_zone(lms / 2.0, 0.0, r_in)
+        self.zone = self.interior.shrunk(k)
+
 #}}}
 
 #{{{ RoundedRectArena
@@ -242,19 +448,26 @@ class RoundedRectArena(BaseArena):
 
         # now we need an arc for each corner
         ww2 = ww/2.0
+        # (note: corners use 10 steps unless a tolerance is given)
+        c_steps = self._arc_steps(corner_rad, pi/2.0, 10)
+        self.arc_steps = c_steps
         arc_tl = create_arc_with_width(cx=-lhz/2.0+ww2, cy=+lvt/2.0-ww2,
                                        radius=corner_rad, theta_0=pi/2.0,
-                                       theta_end=pi, width=ww)
+                                       theta_end=pi, width=ww, steps=c_steps,
+                                       as_polyset=True)
         arc_tr = create_arc_with_width(cx=+lhz/2.0-ww2, cy=+lvt/2.0-ww2,
                                        radius=corner_rad, theta_0=pi/2.0,
-                                       theta_end=0, width=ww)
+                                       theta_end=0, width=ww, steps=c_steps,
+                                       as_polyset=True)
         arc_bl = create_arc_with_width(cx=-lhz/2.0+ww2, cy=-lvt/2.0+ww2,
                                        radius=corner_rad, theta_0=pi,
-                                       theta_end=1.5*pi, width=ww)
+                                       theta_end=1.5*pi, width=ww, steps=c_steps,
+                                       as_polyset=True)
 
         arc_br = create_arc_with_width(cx=+lhz/2.0-ww2, cy=-lvt/2.0+ww2,
                                        radius=corner_rad, theta_0=0,
-                                       theta_end=-pi/2.0, width=ww)
+                                       theta_end=-pi/2.0, width=ww, steps=c_steps,
+                                       as_polyset=True)
 
         # compile a list of segments
         segs = []
@@ -266,9 +479,9 @@ class RoundedRectArena(BaseArena):
             seg = translate_seq(seg, dx=xo, dy=yo) # now translate the segment
             segs.append(seg)
 
-        segs += arc_tl + arc_tr + arc_bl + arc_br
-
-        self.segs = segs
+        self.polys = PolySet.concat(
+            [PolySet.from_segs(segs), arc_tl, arc_tr, arc_bl, arc_br])
+        self._simplify_walls()
 
         ### compute the bounds within which agent bees can be spawned ###
         # for simplicity, we assume that the valid zone is only between the
@@ -282,6 +495,12 @@ class RoundedRectArena(BaseArena):
         self.bl_bound = (s_x + poly_wh[0].x + k, s_y + poly_wh[3].y + k )
         self.tr_bound = (n_x + poly_wh[2].x - k, n_y + poly_wh[1].y - k )
 
+        # the exact zone: within the inner face of the corner arcs, centred
+        # at (+/-(lhz-ww)/2, +/-(lvt-ww)/2)
+        r_in = corner_rad * cos(pi / (4.0 * c_steps)) - ww2
+        self.interior = interior_zone(lhz/2.0 - ww2, lvt/2.0 - ww2, r_in)
+        self.zone = self.interior.shrunk(k)
+
 #}}}
 #{{{ RoundedRectBarrier
 class RoundedRectBarrier(BaseArena):
@@ -340,19 +559,26 @@ class RoundedRectBarrier(BaseArena):
 
         # now we need an arc for each corner
         ww2 = ww/2.0
+        # (note: corners use 10 steps unless a tolerance is given)
+        c_steps = self._arc_steps(corner_rad, pi/2.0, 10)
+        self.arc_steps = c_steps
         arc_tl = create_arc_with_width(cx=-lhz/2.0+ww2, cy=+lvt/2.0-ww2,
                                        radius=corner_rad, theta_0=pi/2.0,
-                                       theta_end=pi, width=ww)
+                                       theta_end=pi, width=ww, steps=c_steps,
+                                       as_polyset=True)
         arc_tr = create_arc_with_width(cx=+lhz/2.0-ww2, cy=+lvt/2.0-ww2,
                                        radius=corner_rad, theta_0=pi/2.0,
-                                       theta_end=0, width=ww)
+                                       theta_end=0, width=ww, steps=c_steps,
+                                       as_polyset=True)
         arc_bl = create_arc_with_width(cx=-lhz/2.0+ww2, cy=-lvt/2.0+ww2,
                                        radius=corner_rad, theta_0=pi,
-                                       theta_end=1.5*pi, width=ww)
+                                       theta_end=1.5*pi, width=ww, steps=c_steps,
+                                       as_polyset=True)
 
         arc_br = create_arc_with_width(cx=+lhz/2.0-ww2, cy=-lvt/2.0+ww2,
                                        radius=corner_rad, theta_0=0,
-                                       theta_end=-pi/2.0, width=ww)
+                                       theta_end=-pi/2.0, width=ww, steps=c_steps,
+                                       as_polyset=True)
 
         # compile a list of segments
         segs = []
@@ -364,12 +590,14 @@ class RoundedRectBarrier(BaseArena):
             seg = translate_seq(seg, dx=xo, dy=yo) # now translate the segment
             segs.append(seg)
 
-        if 'e' in edges and 'n' in edges: segs += arc_tr
-        if 'e' in edges and 's' in edges: segs += arc_br
-        if 'w' in edges and 'n' in edges: segs += arc_tl
-        if 'w' in edges and 's' in edges: segs += arc_bl
+        groups = [PolySet.from_segs(segs)]
+        if 'e' in edges and 'n' in edges: groups.append(arc_tr)
+        if 'e' in edges and 's' in edges: groups.append(arc_br)
+        if 'w' in edges and 'n' in edges: groups.append(arc_tl)
+        if 'w' in edges and 's' in edges: groups.append(arc_bl)
 
-        self.segs = segs
+        self.polys = PolySet.concat(groups)
+        self._simplify_walls()
 
         ### compute the bounds within which agent bees can be spawned ###
         # for simplicity, we assume that the valid zone is only between the
@@ -404,11 +632,15 @@ class CircleArena(BaseArena):
         arc_rad = self.radius - ww
 
         # can we do it with a single arc?
+        arc_steps = self._arc_steps(arc_rad, 2*pi, arc_steps)
+        self.arc_steps = arc_steps
         arc_t = create_arc_with_width(cx=0, cy=0, radius=arc_rad, theta_0=0,
                                       theta_end=2*pi,
-                                      steps=arc_steps, width=ww)
+                                      steps=arc_steps, width=ww,
+                                      as_polyset=True)
 
-        self.segs = arc_t
+        self.polys = arc_t
+        self._simplify_walls()
 
         ### compute the bounds within which agent bees can be spawned ###
         # for simplicity, we define a square inside the circle that is valid.
@@ -420,5 +652,10 @@ class CircleArena(BaseArena):
         self.bl_bound = (-_dim, -_dim)
         self.tr_bound = (+_dim, +_dim)
 
+        # the exact zone: inside the inner face of the polygonal wall
+        r_in = arc_rad * cos(pi / arc_steps) - ww / 2.0
+        self.interior = interior_zone(0.0, 0.0, r_in)
+        self.zone = self.interior.shrunk(k)
+
 
 #}}}
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Reduce the number of polygons needed to represent arena walls.
+
+Each wall segment becomes one physical object in the playground, so fewer,
+larger (convex) polygons mean fewer spawn messages and less per-step
+collision work.  Neighbouring segments are greedily unioned into their
+convex hull, provided that the hull does not depart from the original
+segments by more than a tolerance `tol` (cm).
+
+Note that the segments of an arc do not tile the ring exactly (adjacent
+pieces overlap on the inner side and leave a small wedge on the outer side)
+so a strictly exact merge of arc pieces is not possible; `tol` bounds the
+extra wall material that a merged piece may add.
+
+'''
+
+import numpy as np
+
+from polyset import PolySet
+
+
+#{{{ basic convex geometry
+def convex_hull(pts):
+    '''
+    convex hull of an (N, 2) array of points (Andrew's monotone chain).
+    Returned anticlockwise, without a repeated closing vertex.
+    '''
+    pts = np.unique(np.asarray(pts, dtype=float), axis=0) # sorted by x, y
+    if len(pts) < 3:
+        return pts
+
+    def cross(o, a, b):
+        return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in pts[::-1]:
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1])
+
+def signed_area(ring):
+    ''' signed area of a polygon (shoelace); positive if anticlockwise '''
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+def open_ring(poly):
+    ''' drop the repeated closing vertex of a polygon, if present '''
+    poly = np.asarray(poly, dtype=float)
+    if len(poly) > 1 and np.allclose(poly[0], poly[-1]):
+        return poly[:-1]
+    return poly
+
+def dist_to_convex(q, ring):
+    '''
+    distance from each of the query points `q` (N, 2) to the convex polygon
+    `ring` (0 for points inside it).
+    '''
+    ring = open_ring(ring)
+    if signed_area(ring) < 0:
+        ring = ring[::-1]
+    a = ring
+    b = np.roll(ring, -1, axis=0)
+    e = b - a                               # (E, 2)
+    w = q[:, None, :] - a[None, :, :]       # (N, E, 2)
+    # inside test: left of every (anticlockwise) edge
+    crs = e[None, :, 0] * w[..., 1] - e[None, :, 1] * w[..., 0]
+    inside = np.all(crs >= -1e-12, axis=1)
+    # distance to each edge
+    ee = (e * e).sum(axis=1)
+    ee[ee == 0] = 1.0
+    t = np.clip((w * e[None]).sum(axis=2) / ee[None], 0.0, 1.0)
+    d = w - t[..., None] * e[None]
+    dist = np.sqrt((d * d).sum(axis=2)).min(axis=1)
+    dist[inside] = 0.0
+    return dist
+#}}}
+
+#{{{ merging
+def _dist_to_union(q, members):
+    ''' distance from each of the points `q` to the nearest of `members` '''
+    d = np.full(len(q), np.inf)
+    for m in members:
+        d = np.minimum(d, dist_to_convex(q, m))
+    return d
+
+def hull_excess(hull, members, samples=8, eps=1e-6, limit=None):
+    '''
+    how far the convex polygon `hull` departs from the union of the
+    (convex) `members`: the largest distance from its outline to the
+    nearest member.
+
+    The distance is 1-Lipschitz along the outline, so between two points
+    a length L apart, where it is d0 and d1, it is at most (d0 + d1 + L)/2.
+    Starting from `samples` points per edge, the intervals whose bound
+    exceeds the largest distance found are bisected, until no interval can
+    hold a point more than `eps` further out.  The result is therefore
+    never below the true excess, and at most `eps` above it.  If `limit`
+    is given, the search stops as soon as the answer is known to be above
+    it (some distance found exceeds it) or not (no bound exceeds it).
+
+    (Points inside the hull could only be further from the members than
+    its outline is if the members enclosed a hole, which a run of
+    neighbouring wall segments does not.)
+    '''
+    a = hull
+    e = np.roll(hull, -1, axis=0) - a
+    # intervals along the outline: edge index, start and end fraction
+    t = np.linspace(0.0, 1.0, samples + 1)
+    edge = np.repeat(np.arange(len(a)), samples)
+    t0 = np.tile(t[:-1], len(a))
+    t1 = np.tile(t[1:], len(a))
+    pts = lambda ts: a[edge] + ts[:, None] * e[edge]
+    d0 = _dist_to_union(pts(t0), members)
+    d1 = _dist_to_union(pts(t1), members)
+    L = (t1 - t0) * np.hypot(e[edge, 0], e[edge, 1])
+    found = max(d0.max(), d1.max())
+    while True:
+        ub = 0.5 * (d0 + d1 + L)
+        bound = max(found, ub.max())
+        if limit is not None:
+            if found > limit:
+                return found # (over the limit, however much further)
+            if bound <= limit:
+                return bound
+        open_ = ub > found + eps
+        if not open_.any():
+            return bound
+        edge, t0, t1, d0, d1 = edge[open_], t0[open_], t1[open_], d0[open_], d1[open_]
+        tm = 0.5 * (t0 + t1)
+        dm = _dist_to_union(pts(tm), members)
+        found = max(found, dm.max())
+        edge = np.concatenate([edge, edge])
+        t0, t1 = np.concatenate([t0, tm]), np.concatenate([tm, t1])
+        d0, d1 = np.concatenate([d0, dm]), np.concatenate([dm, d1])
+        L = (t1 - t0) * np.hypot(e[edge, 0], e[edge, 1])
+
+def merge_convex(polys, tol=0.1, samples=8):
+    '''
+    greedily union the (convex) polygons in `polys` (a PolySet, or a list of
+    (k, 2) arrays) into as few convex polygons as possible, where each
+    merged polygon departs from the segments it replaces by at most `tol`
+    (see `hull_excess`: the bound holds on the whole outline, not only at
+    sampled points).
+
+    Polygons are considered in order, so neighbouring segments (as
+    generated by the arena constructors) are merged first. The winding of
+    each merged polygon follows that of its first member. Returns a
+    PolySet.
+    '''
+    groups = [] # each entry: [hull, members, anticlockwise, lo, hi]
+    for poly in polys:
+        ring = open_ring(poly)
+        lo, hi = ring.min(axis=0), ring.max(axis=0)
+        placed = False
+        # most recent group first, since that is the likeliest neighbour
+        for g in reversed(groups):
+            # cheap rejection: bounding boxes must (nearly) touch
+            if np.any(lo > g[4] + tol) or np.any(hi < g[3] - tol):
+                continue
+            cand = convex_hull(np.vstack([g[0], ring]))
+            if hull_excess(cand, g[1] + [ring], samples, limit=tol) <= tol:
+                g[0] = cand
+                g[1].append(ring)
+                g[3] = np.minimum(g[3], lo)
+                g[4] = np.maximum(g[4], hi)
+                placed = True
+                break
+        if not placed:
+            groups.append([ring, [ring], signed_area(ring) > 0, lo, hi])
+
+    out = []
+    for hull, members, ccw, _lo, _hi in groups:
+        if len(members) == 1:
+            out.append(members[0])
+            continue
+        if ccw != (signed_area(hull) > 0):
+            hull = hull[::-1]
+        out.append(hull)
+
+    return PolySet.from_arrays(out)
+#}}}
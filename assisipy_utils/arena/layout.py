@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Search for placements of several enclosures around a CASU grid.
+
+Given the CASU poses (from the project `.arena` file) and a set of
+enclosures -- each an arena type, its parameters, and the CASUs it must
+enclose -- find transforms such that every enclosure holds its own CASUs,
+keeps all other CASUs outside its walls, and does not overlap any other
+enclosure.  Among the valid layouts, the one with the largest smallest
+clearance is chosen.
+
+Each enclosure is modelled by its interior (a RoundedRectZone, exact for
+the stadium, circle and rounded-rect arenas) and the outer extent of its
+walls.  Clearances of many candidate transforms are evaluated in vectorised
+batches; candidates for each enclosure are refined (cross-entropy style)
+in parallel worker processes, and the per-enclosure shortlists are then
+combined by a beam search over the pairwise separations.
+
+Example usage:
+
+    casus = read_casu_poses('project.arena')
+    encs = [Enclosure('popln1', StadiumArena, ['casu-006', 'casu-003'], ww=0.5),
+            Enclosure('popln2', StadiumArena, ['casu-004', 'casu-001'], ww=0.5)]
+    L = optimise_layout(casus, encs, gap=0.5, seed=1)
+    write_layout(L, 'specs/')
+
+or from the command line, with the enclosures in a yaml file:
+
+    assisi_arena_layout project.arena layout.yaml -o specs/
+
+'''
+
+from math import pi
+import argparse
+import multiprocessing
+import os
+import numpy as np
+
+from constructors import StadiumArena, RoundedRectArena, CircleArena
+from transforms import Transformation
+from placement import read_casu_poses
+from popgen import new_seed, substream_seed
+from scene import Scene
+
+ARENA_TYPES = {
+    'stadium'      : StadiumArena,
+    'rounded_rect' : RoundedRectArena,
+    'circle'       : CircleArena,
+}
+
+
+#{{{ enclosures
+class Enclosure(object):
+    '''
+    an arena of class `cls` (constructed with `kwargs`) that must contain
+    the CASUs named in `casus`; `label` names the population it holds.
+    '''
+    def __init__(self, label, cls, casus, **kwargs):
+        if isinstance(cls, basestring):
+            cls = ARENA_TYPES[cls]
+        self.label  = label
+        self.cls    = cls
+        self.casus  = list(casus)
+        self.kwargs = kwargs
+        self.kwargs.setdefault('label_stub', 'arena-{}'.format(label))
+        self.arena  = cls(**self.kwargs)
+        if self.arena.interior is None:
+            raise ValueError("[E] {} has no enclosed interior".format(cls.__name__))
+
+    def shape(self):
+        '''
+        plain tuple describing the enclosure for the vectorised tests:
+        (ax, ay, r_in, r_out, zone centre, rotation centre), all in the
+        untransformed frame. r_out is the furthest any wall vertex lies from
+        the core rectangle of the interior.
+        '''
+        Z = self.arena.interior
+        v = self.arena.base_polys.verts
+        dx = np.maximum(np.abs(v[:, 0] - Z.cx) - Z.ax, 0.0)
+        dy = np.maximum(np.abs(v[:, 1] - Z.cy) - Z.ay, 0.0)
+        r_out = float(np.sqrt(dx * dx + dy * dy).max())
+        return (Z.ax, Z.ay, Z.r, r_out, (Z.cx, Z.cy), self.arena._zone_ctr())
+
+    def __str__(self):
+        return "Enclosure {} ({}) around {}".format(
+            self.label, self.cls.__name__, ", ".join(self.casus))
+
+    def __repr__(self):
+        return self.__str__()
+
+def _to_transformation(shape, cand):
+    '''
+    Transformation that puts the interior centre at (cand[0], cand[1]) with
+    rotation cand[2]
+    '''
+    _ax, _ay, _ri, _ro, (zx, zy), (c0x, c0y) = shape
+    c, s = np.cos(cand[2]), np.sin(cand[2])
+    ox, oy = zx - c0x, zy - c0y
+    return Transformation(dx=cand[0] - c0x - (c * ox - s * oy),
+                          dy=cand[1] - c0y - (s * ox + c * oy),
+                          theta=cand[2])
+#}}}
+
+#{{{ vectorised clearances
+def _core_dist(cands, shape, pts):
+    '''
+    distance from each of the (C, 2) points `pts` to the core rectangle of
+    the interior, for each of the (K, 3) candidates (x, y, theta of the
+    interior centre). Returns a (K, C) array.
+    '''
+    ax, ay = shape[0], shape[1]
+    c = np.cos(cands[:, 2])[:, None]
+    s = np.sin(cands[:, 2])[:, None]
+    px = pts[None, :, 0] - cands[:, 0:1]
+    py = pts[None, :, 1] - cands[:, 1:2]
+    qx = np.maximum(np.abs(c * px + s * py) - ax, 0.0)
+    qy = np.maximum(np.abs(-s * px + c * py) - ay, 0.0)
+    return np.sqrt(qx * qx + qy * qy)
+
+def casu_clearance(cands, shape, pts, inside, casu_r):
+    '''
+    smallest clearance, for each candidate, between the CASU discs (radius
+    `casu_r`) and the walls: for CASUs flagged `inside` to the inner face,
+    for the others to the outer face. Negative if any is violated.
+    '''
+    if not len(pts):
+        return np.full(len(cands), np.inf)
+    d = _core_dist(cands, shape, pts)
+    clr = np.where(inside[None, :], shape[2] - d, d - shape[3]) - casu_r
+    return clr.min(axis=1)
+
+def _corners(cands, ax, ay):
+    ''' (K, 4, 2) corners of the core rectangles '''
+    c = np.cos(cands[:, 2])[:, None]
+    s = np.sin(cands[:, 2])[:, None]
+    lx = np.array([ax, -ax, -ax, ax])[None, :]
+    ly = np.array([ay, ay, -ay, -ay])[None, :]
+    return np.stack([cands[:, 0:1] + c * lx - s * ly,
+                     cands[:, 1:2] + s * lx + c * ly], axis=-1)
+
+def _pt_rect_dist(p, cands, ax, ay):
+    ''' distance from points p (Ka, Kb, 4, 2) to rectangles (1, Kb) '''
+    c = np.cos(cands[:, 2])[None, :, None]
+    s = np.sin(cands[:, 2])[None, :, None]
+    px = p[..., 0] - cands[None, :, 0, None]
+    py = p[..., 1] - cands[None, :, 1, None]
+    qx = np.maximum(np.abs(c * px + s * py) - ax, 0.0)
+    qy = np.maximum(np.abs(-s * px + c * py) - ay, 0.0)
+    return np.sqrt(qx * qx + qy * qy)
+
+def pair_clearance(ca, sa, cb, sb):
+    '''
+    (Ka, Kb) array of the gaps between the outer faces of enclosure a at
+    each of the candidates `ca`, and enclosure b at each of `cb`.  The core
+    rectangles are compared exactly (SAT for intersection, corner distances
+    otherwise) and the wall extents subtracted.
+    '''
+    A = _corners(ca, sa[0], sa[1])[:, None, :, :].repeat(len(cb), axis=1)
+    B = _corners(cb, sb[0], sb[1])[None, :, :, :].repeat(len(ca), axis=0)
+    d = np.minimum(_pt_rect_dist(A, cb, sb[0], sb[1]).min(axis=-1),
+                   _pt_rect_dist(B.swapaxes(0, 1), ca, sa[0], sa[1]).min(axis=-1).T)
+    # separating axis test on the four rectangle axes
+    sep = np.zeros(d.shape, dtype=bool)
+    for th in (ca[:, 2][:, None], cb[:, 2][None, :]):
+        for ang in (th, th + pi / 2):
+            u = np.stack([np.cos(ang), np.sin(ang)], axis=-1)[..., None, :]
+            pa = (A * u).sum(axis=-1)
+            pb = (B * u).sum(axis=-1)
+            sep |= (pa.max(axis=-1) < pb.min(axis=-1)) | (pb.max(axis=-1) < pa.min(axis=-1))
+    d[~sep] = 0.0
+    return d - sa[3] - sb[3]
+#}}}
+
+#{{{ per-enclosure search
+def _refine(task):
+    '''
+    cross-entropy search for the candidates with the largest CASU
+    clearance for one enclosure. Returns (cands (keep, 3), clearance).
+    '''
+    (shape, pts, inside, casu_r, ctr, spread, n_cand, rounds, keep, seed) = task
+    rng = np.random.RandomState(seed)
+    ctr = np.asarray(ctr, dtype=float)
+    # start with uniform positions, half of them at the common angles
+    cands = np.empty((n_cand, 3))
+    cands[:, :2] = ctr + rng.uniform(-spread, spread, (n_cand, 2))
+    cands[:, 2] = rng.uniform(0, pi, n_cand)
+    cands[: n_cand // 2, 2] = rng.randint(0, 4, n_cand // 2) * (pi / 4)
+    clr = casu_clearance(cands, shape, pts, inside, casu_r)
+
+    n_elite = max(n_cand // 10, keep)
+    sig_xy, sig_th = spread / 2.0, pi / 8
+    for _ in xrange(rounds):
+        order = np.argsort(-clr)[:n_elite]
+        elite, e_clr = cands[order], clr[order]
+        pick = rng.randint(0, n_elite, n_cand - n_elite)
+        new = elite[pick].copy()
+        new[:, :2] += rng.normal(0, sig_xy, (len(new), 2))
+        new[:, 2] += rng.normal(0, sig_th, len(new))
+        # keep exact common angles available as candidates
+        snap = rng.uniform(size=len(new)) < 0.25
+        new[snap, 2] = np.round(new[snap, 2] / (pi / 4)) * (pi / 4)
+        n_clr = casu_clearance(new, shape, pts, inside, casu_r)
+        cands = np.vstack([elite, new])
+        clr = np.concatenate([e_clr, n_clr])
+        sig_xy *= 0.6
+        sig_th *= 0.6
+
+    cands[:, 2] = np.mod(cands[:, 2], pi) # interiors are symmetric under pi
+    order = np.argsort(-clr)[:keep]
+    return cands[order], clr[order]
+
+def _map(fn, tasks, processes):
+    if processes == 1 or len(tasks) <= 1:
+        return map(fn, tasks)
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(fn, tasks)
+    finally:
+        pool.close()
+        pool.join()
+#}}}
+
+#{{{ combining
+def _beam(own, pair, beam):
+    '''
+    choose one candidate per enclosure, maximising the smallest of the
+    enclosures' own clearances `own[e]` and pairwise clearances
+    `pair[(i, e)]` (i < e). Returns (indices, score).
+    '''
+    states = np.arange(len(own[0]))[:, None]
+    score = own[0].copy()
+    for e in xrange(1, len(own)):
+        s = np.minimum(score[:, None], own[e][None, :])
+        for i in xrange(e):
+            s = np.minimum(s, pair[(i, e)][states[:, i], :])
+        flat = np.argsort(-s, axis=None)[:beam]
+        si, ci = np.unravel_index(flat, s.shape)
+        states = np.hstack([states[si], ci[:, None]])
+        score = s[si, ci]
+    best = int(np.argmax(score))
+    return states[best], float(score[best])
+
+class Layout(object):
+    '''
+    result of `optimise_layout`: the enclosures, each with its arena placed,
+    the clearances and the CASUs used.
+    '''
+    def __init__(self, enclosures, clearances, score, casus, casu_radius, seed):
+        self.enclosures  = enclosures
+        self.clearances  = clearances # per enclosure, to the CASUs
+        self.score       = score      # smallest clearance overall
+        self.casus       = casus
+        self.casu_radius = casu_radius
+        self.seed        = seed
+
+    @property
+    def valid(self):
+        return self.score >= 0
+
+    @property
+    def arenas(self):
+        return [E.arena for E in self.enclosures]
+
+    def scene(self):
+        ''' a Scene of the placed arenas and all CASUs, e.g. for checks '''
+        S = Scene(casu_radius=self.casu_radius)
+        for A in self.arenas:
+            S.add_arena(A)
+        for name in sorted(self.casus):
+            S.add_casu(name, self.casus[name])
+        return S
+
+    def __str__(self):
+        s = ["Layout ({}, smallest clearance {:.3f}):".format(
+            "valid" if self.valid else "INVALID", self.score)]
+        for E, c in zip(self.enclosures, self.clearances):
+            s.append("  {:12s} {} (CASU clearance {:.3f})".format(
+                E.label, E.arena.trans, c))
+        return "\n".join(s)
+
+    def __repr__(self):
+        return self.__str__()
+
+def optimise_layout(casus, enclosures, casu_radius=1.0, gap=0.0, spread=None,
+                    n_cand=2048, rounds=8, restarts=4, keep=64, beam=256,
+                    processes=None, seed=None):
+    '''
+    place the `enclosures` (list of Enclosure) around the `casus` (dict of
+    name -> (x, y, yaw), as from `read_casu_poses`).
+
+    - the walls must clear CASUs (discs of `casu_radius`) and each other by
+      `gap`; the layout found maximises the smallest clearance.
+    - candidate centres are searched within `spread` of the centroid of
+      each enclosure's CASUs (default: the size of the enclosure).
+    - `restarts` independent searches per enclosure run in a pool of
+      `processes` workers; each keeps its best `keep` candidates.
+
+    The arenas of the enclosures are moved into place (set_transform), and
+    a Layout returned; check `Layout.valid`.
+    '''
+    if seed is None:
+        seed = new_seed()
+    names = sorted(casus)
+    pts = np.array([casus[n][:2] for n in names], dtype=float).reshape(-1, 2)
+    shapes = [E.shape() for E in enclosures]
+
+    tasks = []
+    for ei, (E, sh) in enumerate(zip(enclosures, shapes)):
+        missing = [c for c in E.casus if c not in casus]
+        if missing:
+            raise KeyError("[E] {}: unknown CASUs {}".format(E.label, missing))
+        inside = np.array([n in E.casus for n in names], dtype=bool)
+        ctr = pts[inside].mean(axis=0) if inside.any() else pts.mean(axis=0)
+        sp = spread
+        if sp is None:
+            sp = max(sh[0], sh[1]) + sh[2]
+        for k in xrange(restarts):
+            tasks.append((sh, pts, inside, casu_radius + gap, ctr, sp,
+                          n_cand, rounds, keep,
+                          substream_seed(seed, "{}:{}".format(E.label, k))))
+    res = _map(_refine, tasks, processes)
+
+    # pool the restarts of each enclosure
+    cands, own = [], []
+    for ei in xrange(len(enclosures)):
+        part = res[ei * restarts:(ei + 1) * restarts]
+        cands.append(np.vstack([c for (c, _) in part]))
+        own.append(np.concatenate([v for (_, v) in part]))
+    pair = {}
+    for e in xrange(len(enclosures)):
+        for i in xrange(e):
+            pair[(i, e)] = pair_clearance(cands[i], shapes[i],
+                                          cands[e], shapes[e]) - gap
+    idx, score = _beam(own, pair, beam)
+
+    clearances = []
+    for E, sh, c, o, k in zip(enclosures, shapes, cands, own, idx):
+        E.arena.set_transform(_to_transformation(sh, c[k]))
+        clearances.append(float(o[k]) + gap)
+    return Layout(enclosures, clearances, score, casus, casu_radius, seed)
+#}}}
+
+#{{{ output
+def write_layout(layout, out_dir='.', suffix='.arena', fmt=None):
+    '''
+    write a bounds spec for each population (`<label><suffix>` in
+    `out_dir`), recording the layout seed. Returns the files written.
+    '''
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    files = []
+    for E in layout.enclosures:
+        fname = os.path.join(out_dir, E.label + suffix)
+        E.arena.write_bounds_spec(fname, seed=layout.seed, fmt=fmt)
+        files.append(fname)
+    return files
+
+def read_enclosures(fname):
+    '''
+    read enclosure definitions from yaml: a list under `enclosures`, each
+    with `label`, `type` (stadium, rounded_rect, circle), `casus`, and
+    optional `args` for the arena constructor.
+    '''
+    import yaml
+    with open(fname) as f:
+        d = yaml.safe_load(f)
+    encs = [Enclosure(e['label'], e['type'], e['casus'], **(e.get('args') or {}))
+            for e in d['enclosures']]
+    return encs, d
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'find placements of enclosures around the CASUs of a deployment')
+    parser.add_argument('project', type=str, help='CASU deployment (.arena)')
+    parser.add_argument('enclosures', type=str, help='enclosure definitions (yaml)')
+    parser.add_argument('-o', '--out-dir', type=str, default='.')
+    parser.add_argument('-l', '--layer', type=str, default=None)
+    parser.add_argument('-r', '--casu-radius', type=float, default=None)
+    parser.add_argument('-g', '--gap', type=float, default=None)
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    encs, d = read_enclosures(args.enclosures)
+    casus = read_casu_poses(args.project, layer=args.layer)
+    r = args.casu_radius if args.casu_radius is not None else d.get('casu_radius', 1.0)
+    gap = args.gap if args.gap is not None else d.get('gap', 0.0)
+
+    L = optimise_layout(casus, encs, casu_radius=r, gap=gap,
+                        processes=args.processes, seed=args.seed)
+    print L
+    if not L.valid:
+        print "[E] no valid layout found; nothing written"
+        return 1
+    for a, b in L.scene().overlaps():
+        print "[W] overlap between {} and {}".format(a, b)
+    for fname in write_layout(L, args.out_dir):
+        print "[I] wrote {}".format(fname)
+
+if __name__ == '__main__':
+    main()
+#}}}
@@ -1,14 +1,26 @@
-from math import pi, sin, cos
+from math import pi, sin, cos, acos, asin, ceil
 import random
-import yaml
+import numpy as np
 
 from transforms import Point, Transformation
+from polyset import PolySet
+from zones import RectZone, zone_from_dict, sample_in_zone, to_world
+from specfile import read_spec
+from sharedmap import SharedOccupancyMap, sample_with_map
 from transforms import translate_point, find_ctr_seq, rotate_point_about_other
 from assisipy_utils.common.maths import linspace
 
 #{{{ arcs
 def create_arc_with_width(cx, cy, radius, theta_0=pi/2, theta_end=-pi/2,
-        steps=10, width=2.0):
+        steps=10, width=2.0, as_polyset=False):
+    '''
+    create a sequence of `steps` polygons that approximate an arc of width
+    `width`, centred on (cx, cy).  By default a list of lists of Points is
+    returned; if `as_polyset` is True, the polygons are computed in one
+    vectorised pass and returned as a polyset.PolySet.
+    '''
+    if as_polyset:
+        return _arc_polyset(cx, cy, radius, theta_0, theta_end, steps, width)
 
     thetas = linspace(theta_0, theta_end, steps+1)
     arc_ctrs = [pos_on_perim(cx, cy, theta, radius) for theta in thetas]
@@ -37,6 +49,222 @@ def create_arc_with_width(cx, cy, radius, theta_0=pi/2, theta_end=-pi/2,
     #print "width=", width
     return polys
 
+def _arc_polyset(cx, cy, radius, theta_0, theta_end, steps, width):
+    '''
+    vectorised equivalent of `create_arc_with_width`: identical vertices (in
+    the same order, r1, r2, l2, l1), but all segments are computed at once.
+    '''
+    thetas = np.linspace(theta_0, theta_end, steps+1)
+    ctrs = np.empty((steps+1, 2))
+    ctrs[:, 0] = cx + radius * np.cos(thetas)
+    ctrs[:, 1] = cy + radius * np.sin(thetas)
+    cb = ctrs[:-1]
+    ce = ctrs[1:]
+    d = ce - cb
+    l_recip = 1.0 / np.hypot(d[:, 0], d[:, 1])
+    # unit normal to each chord, matching parallel_pts_w_offset
+    nrm = np.empty_like(d)
+    nrm[:, 0] = +d[:, 1] * l_recip
+    nrm[:, 1] = -d[:, 0] * l_recip
+    off = nrm * (width / 2.0)
+
+    polys = np.empty((steps, 4, 2))
+    polys[:, 0] = cb + off # r1
+    polys[:, 1] = ce + off # r2
+    polys[:, 2] = ce - off # l2
+    polys[:, 3] = cb - off # l1
+    return PolySet.from_arrays(polys)
+
+def arc_steps_for_tol(radius, sweep, width=0.0, chord_tol=None, gap_tol=None,
+                      min_steps=1):
+    '''
+    compute the minimum number of segments for an arc of `radius` that
+    spans `sweep` radians, such that
+    - the chord error (sagitta; max radial deviation of the polygonal wall
+      from the true arc) is at most `chord_tol`, and
+    - the wedge-shaped gap left on the outside of the wall between
+      consecutive segments of width `width` is at most `gap_tol`.
+
+    Either tolerance can be None (ignored).  If both are None, `min_steps`
+    is returned.
+    '''
+    sweep = abs(sweep)
+    d_max = sweep # largest permitted angle per segment
+    if chord_tol is not None and chord_tol < radius:
+        d_max = min(d_max, 2.0 * acos(1.0 - float(chord_tol) / radius))
+    if gap_tol is not None and width > 0 and gap_tol < width:
+        d_max = min(d_max, 2.0 * asin(float(gap_tol) / width))
+    if d_max <= 0:
+        raise ValueError("[E] arc tolerance must be positive")
+
+    return max(int(min_steps), int(ceil(sweep / d_max - 1e-9)))
+
+def merge_collinear_walls(polys, tol=1e-6):
+    '''
+    simplify a PolySet of wall segments:
+    - drop degenerate segments (zero area, e.g. a straight wall of zero
+      length when the corner radius is equal to half of the arena width)
+    - merge rectangular segments that lie on the same line, with the same
+      thickness, and that touch or overlap end-to-end, into one rectangle.
+
+    Non-rectangular segments are passed through unchanged. Returns a new
+    PolySet.
+
+    The 4-vertex segments are classified in one vectorised pass. The
+    rectangles are grouped by line direction, offset and thickness (see
+    `_split_sorted`), and only merged within a group, by a sweep along the
+    line; so arc segments, whose directions all differ, are never
+    compared, and the merge is O(n log n).
+    '''
+    polys = PolySet.from_segs(polys)
+    n = len(polys)
+    o = polys.offsets
+    cnt = np.diff(o)
+    # (as _unique_ring: a repeated closing vertex is not counted)
+    closed = np.zeros(n, dtype=bool)
+    nz = cnt > 1
+    closed[nz] = np.all(np.isclose(polys.verts[o[:-1][nz]],
+                                   polys.verts[o[1:][nz] - 1]), axis=1)
+    quad = (cnt - closed) == 4
+
+    keep = []  # (index, polygon) of segments that are not candidates
+    for i in np.nonzero(~quad)[0]:
+        if _ring_area(_unique_ring(polys[i])) > tol:
+            keep.append((i, polys[i]))
+
+    iq = np.nonzero(quad)[0]
+    Q = polys.verts[o[iq][:, None] + np.arange(4)]
+    sarea, is_rect, ctr, u, h, t = _quad_rects(Q, tol)
+    ok = np.abs(sarea) > tol # else degenerate: no physical body required
+    for i in iq[ok & ~is_rect]:
+        keep.append((i, polys[i]))
+    sel = ok & is_rect
+    iq, ctr, u, h, t, ccw = iq[sel], ctr[sel], u[sel], h[sel], t[sel], sarea[sel] > 0
+
+    merged = [] # (index, polygon) of the rectangles, after merging
+    if len(iq):
+        # line of each rectangle: direction in [0, pi), offset along the
+        # normal, and thickness. Directions match if |u.u2| is within tol
+        # of 1, i.e. the angle between them is within sqrt(2 tol).
+        ang_tol = (2.0 * tol) ** 0.5
+        ang = np.arctan2(u[:, 1], u[:, 0]) % pi
+        ang[ang > pi - ang_tol] -= pi
+        nrm = np.column_stack((-np.sin(ang), np.cos(ang)))
+        off = np.einsum('ij,ij->i', nrm, ctr)
+        groups = [np.arange(len(iq))]
+        for vals, vtol in ((ang, ang_tol), (off, tol), (h, tol)):
+            groups = [g for grp in groups for g in _split_sorted(grp, vals, vtol)]
+        for grp in groups:
+            if len(grp) == 1:
+                merged.append((iq[grp[0]], polys[iq[grp[0]]]))
+                continue
+            for k, poly in _merge_on_line(ctr[grp], u[grp], h[grp[0]], t[grp],
+                                          ccw[grp], tol):
+                i = iq[grp[k]]
+                merged.append((i, polys[i] if poly is None else poly))
+        merged.sort(key=lambda m: m[0])
+    keep.sort(key=lambda m: m[0])
+
+    return PolySet.from_arrays([m[1] for m in merged] + [m[1] for m in keep])
+
+def _quad_rects(Q, tol):
+    '''
+    classify the 4-vertex polygons Q, an (m, 4, 2) array. Returns
+    (signed area, is a rectangle, mid-line origin, unit axis along the long
+    side, half-thickness, (t_min, t_max) along the axis), each with one
+    entry per polygon (only meaningful where it is a rectangle).
+    '''
+    m = len(Q)
+    x, y = Q[..., 0], Q[..., 1]
+    sarea = 0.5 * ((x * np.roll(y, -1, axis=1)).sum(axis=1) -
+                   (y * np.roll(x, -1, axis=1)).sum(axis=1))
+    e = np.roll(Q, -1, axis=1) - Q
+    L = np.hypot(e[..., 0], e[..., 1])
+    # all corners should be right angles
+    dots = np.abs((e * np.roll(e, -1, axis=1)).sum(axis=2))
+    L_next = np.roll(L, -1, axis=1)
+    with np.errstate(invalid='ignore'):
+        is_rect = (L.min(axis=1) > tol) & np.all(dots <= tol * L * L_next + tol, axis=1)
+    r = np.arange(m)
+    i = np.where(L[:, 0] >= L[:, 1], 0, 1) # index of a long edge
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = e[r, i] / L[r, i][:, None]
+    h = 0.5 * L[r, i + 1]
+    ctr = Q.mean(axis=1)
+    ts = ((Q - ctr[:, None, :]) * u[:, None, :]).sum(axis=2)
+    t = np.column_stack((ts.min(axis=1), ts.max(axis=1)))
+    return sarea, is_rect, ctr, u, h, t
+
+def _split_sorted(idx, vals, tol):
+    '''
+    split the indices `idx`, sorted by `vals`, into runs whose values are
+    all within `tol` of the first of the run (so a run cannot drift, as a
+    chain of small steps would)
+    '''
+    idx = idx[np.argsort(vals[idx], kind='mergesort')]
+    v = vals[idx].tolist()
+    cuts = []
+    v0 = v[0]
+    for k in xrange(1, len(v)):
+        if v[k] > v0 + tol:
+            cuts.append(k)
+            v0 = v[k]
+    return np.split(idx, cuts)
+
+def _merge_on_line(ctr, u, h, t, ccw, tol):
+    '''
+    merge the rectangles of one group (on one line, with half-thickness
+    `h`; see `merge_collinear_walls`) that touch or overlap, sweeping along
+    the axis of the first.  Returns a list of (row of the first rectangle
+    merged, polygon), where the polygon is None for a rectangle merged
+    with no other (to be kept unchanged).
+    '''
+    o, u0 = ctr[0], u[0]
+    # extent of each rectangle along the reference axis
+    a = (ctr - o).dot(u0)[:, None] + t * u.dot(u0)[:, None]
+    lo, hi = a.min(axis=1), a.max(axis=1)
+    order = np.argsort(lo, kind='mergesort')
+
+    runs = [[order[0]]]
+    t1 = hi[order[0]]
+    for k in order[1:]:
+        if lo[k] > t1 + tol:
+            runs.append([k]) # no contact
+            t1 = hi[k]
+        else:
+            runs[-1].append(k)
+            t1 = max(t1, hi[k])
+    out = []
+    nrm = np.array([-u0[1], u0[0]])
+    for run in runs:
+        first = min(run)
+        if len(run) == 1:
+            out.append((first, None))
+            continue
+        p0, p1 = o + lo[run[0]] * u0, o + hi[run].max() * u0
+        poly = np.array([p0 - h * nrm, p1 - h * nrm, p1 + h * nrm,
+                         p0 + h * nrm, p0 - h * nrm])
+        if ccw[first] != (_ring_signed_area(poly[:-1]) > 0):
+            poly = poly[::-1] # keep the winding of the original segment
+        out.append((first, poly))
+    return out
+
+def _unique_ring(poly):
+    ''' drop the repeated closing vertex of a polygon, if present '''
+    poly = np.asarray(poly)
+    if len(poly) > 1 and np.allclose(poly[0], poly[-1]):
+        return poly[:-1]
+    return poly
+
+def _ring_signed_area(pts):
+    ''' signed area of a polygon (shoelace); positive if anticlockwise '''
+    x, y = pts[:, 0], pts[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+def _ring_area(pts):
+    ''' absolute area of a polygon (shoelace) '''
+    return abs(_ring_signed_area(pts))
+
 def parallel_pts_w_offset(cb, ce, dw):
     ''' compute positions of points that are in line parallel to cb->ce, dw away'''
     l_recip = 1.0 / ( ( (cb.x - ce.x)**2 + (cb.y - ce.y)**2)**0.5) # divide once
@@ -57,10 +285,39 @@ def pos_on_perim(cx, cy, theta, radius):
 
 
 #{{{ add bees
-def gen_valid_bee_positions(valid_area, n=1, theta_rng=(0, 2*pi), trans=None):
+def gen_valid_bee_positions(valid_area, n=1, theta_rng=(0, 2*pi), trans=None,
+                            zone=None, rng=None, as_array=False, occupancy=None):
     '''
     return a list of (x, y, theta) tuples, for locations of bees that
-    are within the valid_area. '''
+    are within the valid_area.
+
+    If a `zone` is given (see zones.py, or `read_zone`), the positions are
+    drawn from that instead of the rectangle, by vectorised rejection
+    sampling using the numpy RandomState/Generator `rng`. The rotation is
+    still about the centre of `valid_area`. With `as_array`, an (n, 3)
+    array of poses is returned rather than a list of (Point, yaw).
+
+    If `occupancy` is given (a sharedmap.SharedOccupancyMap, or its file
+    stem), each position is reserved in it, so that spawners running
+    concurrently do not place agents on top of each other.
+    '''
+    if zone is not None or as_array or occupancy is not None:
+        if zone is None:
+            zone = RectZone(*valid_area)
+        ctr = (0.5 * (valid_area[0][0] + valid_area[1][0]),
+               0.5 * (valid_area[0][1] + valid_area[1][1]))
+        if occupancy is not None:
+            if isinstance(occupancy, basestring):
+                occupancy = SharedOccupancyMap(occupancy)
+            poses = sample_with_map(zone, n, occupancy, trans=trans, ctr=ctr,
+                                    rng=rng, theta_rng=theta_rng)
+        else:
+            poses = to_world(sample_in_zone(zone, n, rng=rng, theta_rng=theta_rng),
+                             trans, ctr)
+        if as_array:
+            return poses
+        return [(Point(x, y, 0), yaw) for (x, y, yaw) in poses.tolist()]
+
     # the area as given is untransformed - generate within this rectangle, uniformly
     # then transform all the points, and return them.
     xlims = valid_area[0][0], valid_area[1][0]
@@ -102,14 +359,26 @@ def gen_valid_bee_positions(valid_area, n=1, theta_rng=(0, 2*pi), trans=None):
 
 
 def read_reqs(fname):
-    with open(fname) as f:
-        _d = yaml.safe_load(f)
-        bl_bound = _d.get('base_bl')
-        tr_bound = _d.get('base_tr')
-        dx = _d.get('trans').get('dx')
-        dy = _d.get('trans').get('dy')
-        theta = _d.get('trans').get('theta')
+    ''' read bounds and transform from a spec (yaml or binary format) '''
+    _d = read_spec(fname)
+    bl_bound = _d.get('base_bl')
+    tr_bound = _d.get('base_tr')
+    dx = _d.get('trans').get('dx')
+    dy = _d.get('trans').get('dy')
+    theta = _d.get('trans').get('theta')
 
     trans = Transformation(dx, dy, theta)
 
     return (bl_bound, tr_bound, trans)
+
+def read_zone(fname):
+    '''
+    return the valid zone stored in a bounds spec written by
+    `BaseArena.write_bounds_spec`; older specs without a zone give the
+    rectangle between the bounds.
+    '''
+    _d = read_spec(fname)
+    zone = zone_from_dict(_d.get('zone'))
+    if zone is None:
+        zone = RectZone(_d.get('base_bl'), _d.get('base_tr'))
+    return zone
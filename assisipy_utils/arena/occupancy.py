@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Occupancy histograms and CASU dwell times from bee track logs.
+
+Track files (`bee_track-<name>.csv`: one sample per line, with time and
+position columns) are streamed in fixed-size chunks, so that tens of
+millions of samples can be processed without loading them all at once.
+Positions are mapped into the untransformed arena frame (using the
+Transformation from `read_reqs`) and binned into a 2D histogram; the time
+spent within a radius of each CASU is accumulated alongside.
+
+Whole logdirs can be processed with one worker process per file.
+
+Example usage:
+
+    occ = Occupancy.from_spec('valid.arena', res=0.5,
+                              casus=read_casu_poses('project.arena'))
+    occ = occupancy_from_logdir(logdir, occ, processes=4)
+    print occ.dwell
+
+'''
+
+import glob
+import itertools
+import multiprocessing
+import os
+import numpy as np
+
+from transforms import Transformation
+from zones import to_local, zone_from_dict
+from specfile import read_spec
+
+
+#{{{ reading tracks
+def iter_track_chunks(fname, chunk=1 << 18, cols=(0, 1, 2), delimiter=','):
+    '''
+    yield (k, 3) arrays of (t, x, y) from the track file `fname`, `chunk`
+    lines at a time. `cols` gives the columns of t, x and y. Comment lines
+    ('#') and a non-numeric header line are skipped.
+    '''
+    with open(fname) as f:
+        first = True
+        while True:
+            lines = list(itertools.islice(f, chunk))
+            if not lines:
+                break
+            if first:
+                first = False
+                # drop a header line, if present
+                while lines and not _numeric_line(lines[0], delimiter):
+                    lines.pop(0)
+            lines = [l for l in lines if l.strip() and not l.startswith('#')]
+            if not lines:
+                continue
+            yield _parse_lines(lines, delimiter)[:, list(cols)]
+
+def _parse_lines(lines, delimiter):
+    '''
+    parse numeric lines into a 2D array in one call (much faster than
+    loadtxt); falls back to loadtxt for irregular rows.
+    '''
+    ncol = len(lines[0].split(delimiter))
+    text = delimiter.join(l.strip() for l in lines)
+    flat = np.fromstring(text, sep=delimiter)
+    if len(flat) == ncol * len(lines):
+        return flat.reshape(len(lines), ncol)
+    return np.loadtxt(lines, delimiter=delimiter, ndmin=2)
+
+def _numeric_line(line, delimiter):
+    if line.startswith('#') or not line.strip():
+        return False
+    try:
+        float(line.split(delimiter)[0])
+        return True
+    except ValueError:
+        return False
+#}}}
+
+#{{{ Occupancy
+class Occupancy(object):
+    '''
+    occupancy counts over a grid in the arena frame, plus time spent within
+    `radius` of each CASU (positions given in world coordinates).
+    '''
+    def __init__(self, bl, tr, res=0.5, trans=None, ctr=None, casus=None,
+                 radius=2.0):
+        self.res = float(res)
+        nx = max(int(np.ceil((tr[0] - bl[0]) / self.res)), 1)
+        ny = max(int(np.ceil((tr[1] - bl[1]) / self.res)), 1)
+        self.xedges = bl[0] + self.res * np.arange(nx + 1)
+        self.yedges = bl[1] + self.res * np.arange(ny + 1)
+        self.trans = trans
+        if ctr is None:
+            ctr = (0.5 * (bl[0] + tr[0]), 0.5 * (bl[1] + tr[1]))
+        self.ctr = ctr
+        self.counts = np.zeros((nx, ny), dtype=np.int64)
+        self.n_samples = 0
+        casus = casus or {}
+        self.casu_names = sorted(casus)
+        self.casu_xy = np.array([casus[c][:2] for c in self.casu_names],
+                                dtype=float).reshape(-1, 2)
+        self.radius = float(radius)
+        self.dwell = dict((c, 0.0) for c in self.casu_names)
+
+    @classmethod
+    def from_spec(cls, fname, res=0.5, pad=1.0, casus=None, radius=2.0):
+        '''
+        grid over the valid zone of the bounds spec `fname` (plus `pad`),
+        in the arena frame of its transform
+        '''
+        spec = read_spec(fname)
+        bl, tr = spec['base_bl'], spec['base_tr']
+        ctr = (0.5 * (bl[0] + tr[0]), 0.5 * (bl[1] + tr[1]))
+        zone = zone_from_dict(spec.get('zone'))
+        if zone is not None:
+            bl, tr = zone.bbox()
+        t = spec['trans']
+        trans = Transformation(t['dx'], t['dy'], t['theta'])
+        return cls((bl[0] - pad, bl[1] - pad), (tr[0] + pad, tr[1] + pad),
+                   res=res, trans=trans, ctr=ctr, casus=casus, radius=radius)
+
+    def empty_copy(self):
+        ''' a new Occupancy with the same grid and CASUs, and no samples '''
+        other = Occupancy.__new__(Occupancy)
+        other.__dict__.update(self.__dict__)
+        other.counts = np.zeros_like(self.counts)
+        other.n_samples = 0
+        other.dwell = dict((c, 0.0) for c in self.casu_names)
+        return other
+
+    def add_samples(self, txy, dt=None):
+        '''
+        accumulate (k, 3) samples (t, x, y) in world coordinates; `dt` is
+        the duration of each sample (by default, from the time column)
+        '''
+        if not len(txy):
+            return
+        local = to_local(txy[:, 1:3], self.trans, self.ctr)
+        h, _, _ = np.histogram2d(local[:, 0], local[:, 1],
+                                 bins=(self.xedges, self.yedges))
+        self.counts += h.astype(np.int64)
+        self.n_samples += len(txy)
+        if len(self.casu_names):
+            if dt is None:
+                dt = _sample_durations(txy[:, 0])
+            d2 = ((txy[:, None, 1:3] - self.casu_xy[None, :, :])**2).sum(axis=2)
+            near = d2 <= self.radius ** 2
+            t_near = (near * dt[:, None]).sum(axis=0)
+            for c, tn in zip(self.casu_names, t_near):
+                self.dwell[c] += float(tn)
+
+    def add_file(self, fname, chunk=1 << 18, **kwargs):
+        '''
+        stream the track file `fname` into the histogram. Sample durations
+        run across chunk boundaries; the last sample takes the previous dt.
+        '''
+        prev = None
+        for block in iter_track_chunks(fname, chunk=chunk, **kwargs):
+            if prev is not None:
+                block = np.vstack([prev, block])
+            # each sample lasts until the next; hold the last one back
+            dt = np.diff(block[:, 0])
+            self.add_samples(block[:-1], dt=dt)
+            prev = block[-1:]
+            last_dt = dt[-1] if len(dt) else 0.0
+        if prev is not None:
+            self.add_samples(prev, dt=np.array([last_dt]))
+        return self
+
+    def merge(self, other):
+        ''' add the counts and dwell times of `other` (same grid) '''
+        self.counts += other.counts
+        self.n_samples += other.n_samples
+        for c, v in other.dwell.items():
+            self.dwell[c] = self.dwell.get(c, 0.0) + v
+        return self
+
+    def density(self):
+        ''' fraction of samples in each bin '''
+        return self.counts / float(max(self.n_samples, 1))
+
+    def extent(self):
+        ''' (left, right, bottom, top), e.g. for imshow of `counts.T` '''
+        return (self.xedges[0], self.xedges[-1], self.yedges[0], self.yedges[-1])
+
+def _sample_durations(t):
+    dt = np.empty(len(t))
+    dt[:-1] = np.diff(t)
+    dt[-1] = dt[-2] if len(t) > 1 else 0.0
+    return dt
+#}}}
+
+#{{{ logdirs
+def _occ_worker(args):
+    template, fname = args
+    return template.empty_copy().add_file(fname)
+
+def occupancy_from_logdir(logdir, template, pattern='bee_track-*.csv',
+                          processes=None):
+    '''
+    accumulate all track files in `logdir` matching `pattern` into a copy
+    of the (empty) Occupancy `template`, using a pool of `processes` worker
+    processes (one file per task; 1 = in this process).
+    '''
+    files = sorted(glob.glob(os.path.join(logdir, pattern)))
+    total = template.empty_copy()
+    tasks = [(template.empty_copy(), f) for f in files]
+    if processes == 1 or len(files) <= 1:
+        parts = map(_occ_worker, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            parts = pool.map(_occ_worker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    for p in parts:
+        total.merge(p)
+    return total
+#}}}
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Placement of agents with a minimum separation.
+
+Independent uniform positions (as from `gen_valid_bee_positions`) put
+agents on top of each other once the population is dense, and the
+playground then spends its first steps resolving the collisions.  Here
+positions are drawn by dart throwing (Poisson-disk sampling): candidates
+are accepted only if no agent already placed is closer than `min_sep`.
+Neighbours are found via a uniform grid with cells of side min_sep/sqrt(2),
+so each cell holds at most one agent and each test only inspects a 5x5
+block of cells -- the expected cost is O(n).
+
+Discs around CASUs (or anything else) can be excluded; CASU poses are read
+from the deployment `.arena` file.
+
+'''
+
+from math import pi, sqrt
+import numpy as np
+
+from zones import RectZone, sample_in_zone, to_local, to_world
+from transforms import Point
+
+
+#{{{ exclusions
+def read_casu_poses(fname, layer=None):
+    '''
+    read the CASU poses from a deployment `.arena` file, optionally only
+    those in `layer`. Returns a dict of name -> (x, y, yaw).
+    '''
+    import yaml
+    with open(fname) as f:
+        dep = yaml.safe_load(f)
+    poses = {}
+    for _layer, casus in dep.items():
+        if layer is not None and _layer != layer:
+            continue
+        for name, spec in (casus or {}).items():
+            p = spec.get('pose', {})
+            poses[name] = (float(p.get('x', 0)), float(p.get('y', 0)),
+                           float(p.get('yaw', 0)))
+    return poses
+
+def casu_exclusions(fname, radius=1.5, layer=None):
+    '''
+    return an (N, 3) array of exclusion discs (x, y, r), one of radius
+    `radius` about each CASU in the deployment file `fname`.
+    '''
+    poses = read_casu_poses(fname, layer=layer)
+    excl = np.zeros((len(poses), 3))
+    for i, name in enumerate(sorted(poses)):
+        excl[i] = poses[name][0], poses[name][1], radius
+    return excl
+#}}}
+
+#{{{ spatial hash
+class _GridHash(object):
+    '''
+    uniform grid over a bounding box; each cell holds the index of at most
+    one point (cell side is min_sep/sqrt(2), so two points in one cell
+    would be too close anyway).
+    '''
+    def __init__(self, bl, tr, min_sep):
+        self.cell = min_sep / sqrt(2.0)
+        self.min_sep2 = min_sep * min_sep
+        self.x0, self.y0 = bl
+        nx = int((tr[0] - bl[0]) / self.cell) + 1
+        ny = int((tr[1] - bl[1]) / self.cell) + 1
+        self.grid = np.full((nx, ny), -1, dtype=np.intp)
+        self.pts = []
+
+    def try_add(self, x, y):
+        ''' add (x, y) if no existing point is closer than min_sep '''
+        i = int((x - self.x0) / self.cell)
+        j = int((y - self.y0) / self.cell)
+        g = self.grid
+        if g[i, j] >= 0:
+            return False
+        for k in g[max(i-2, 0):i+3, max(j-2, 0):j+3].ravel():
+            if k >= 0:
+                px, py = self.pts[k]
+                if (px - x)**2 + (py - y)**2 < self.min_sep2:
+                    return False
+        g[i, j] = len(self.pts)
+        self.pts.append((x, y))
+        return True
+#}}}
+
+#{{{ sampling
+def sample_spaced_in_zone(zone, n, min_sep, rng=None, theta_rng=(0, 2*pi),
+                          exclusions=None, max_attempts=30):
+    '''
+    draw `n` poses (x, y, yaw) within `zone`, at least `min_sep` apart,
+    and outside of all `exclusions` (a sequence of discs (x, y, r), in the
+    zone's frame).  Candidates are generated in blocks (see
+    zones.sample_in_zone); if more than `max_attempts` * n are used up, the
+    zone is considered too full and a RuntimeError is raised.
+
+    Returns an (n, 3) array.
+    '''
+    if rng is None:
+        rng = np.random
+    n = int(n)
+    out = np.empty((n, 3))
+    if n == 0:
+        return out
+    if exclusions is not None and len(exclusions):
+        exclusions = np.asarray(exclusions, dtype=float).reshape(-1, 3)
+    else:
+        exclusions = None
+
+    bl, tr = zone.bbox()
+    gh = _GridHash(bl, tr, float(min_sep))
+    budget = max_attempts * n
+    used = 0
+    while len(gh.pts) < n:
+        if used >= budget:
+            raise RuntimeError(
+                "[E] placed only {} of {} agents {} apart in {}".format(
+                    len(gh.pts), n, min_sep, zone))
+        m = min(max(2 * (n - len(gh.pts)), 64), budget - used)
+        used += m
+        cand = sample_in_zone(zone, m, rng=rng)[:, :2]
+        if exclusions is not None:
+            d2 = ((cand[:, None, :] - exclusions[None, :, :2])**2).sum(axis=2)
+            cand = cand[np.all(d2 >= exclusions[None, :, 2]**2, axis=1)]
+        for x, y in cand.tolist():
+            if gh.try_add(x, y) and len(gh.pts) >= n:
+                break
+
+    out[:, :2] = gh.pts
+    out[:, 2] = rng.uniform(theta_rng[0], theta_rng[1], n)
+    return out
+
+def gen_spaced_bee_positions(valid_area, n=1, min_sep=1.5, theta_rng=(0, 2*pi),
+                             trans=None, zone=None, exclusions=None, rng=None,
+                             as_array=False):
+    '''
+    as `gen_valid_bee_positions`, but with agents at least `min_sep` apart
+    (e.g. `bee_len`), and kept out of the `exclusions`, discs (x, y, r)
+    given in WORLD coordinates (see `casu_exclusions`).
+
+    `valid_area` and `trans` are as returned by `read_reqs`, and `zone` as
+    returned by `read_zone` (by default, the `valid_area` rectangle).
+    '''
+    if zone is None:
+        zone = RectZone(*valid_area)
+    ctr = (0.5 * (valid_area[0][0] + valid_area[1][0]),
+           0.5 * (valid_area[0][1] + valid_area[1][1]))
+    if exclusions is not None and len(exclusions):
+        # bring the discs into the untransformed frame of the zone
+        exclusions = np.array(exclusions, dtype=float).reshape(-1, 3)
+        exclusions[:, :2] = to_local(exclusions[:, :2], trans, ctr)
+
+    poses = sample_spaced_in_zone(zone, n, min_sep, rng=rng,
+                                  theta_rng=theta_rng, exclusions=exclusions)
+    poses = to_world(poses, trans, ctr)
+    if as_array:
+        return poses
+    return [(Point(x, y, 0), yaw) for (x, y, yaw) in poses.tolist()]
+#}}}
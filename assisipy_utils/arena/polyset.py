@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Array-backed storage for groups of polygons (e.g. arena walls).
+
+All vertices of all polygons are held in one (N, 2) float array, and the
+polygon boundaries are given by an offsets array of length M+1 (polygon `i`
+is `verts[offsets[i]:offsets[i+1]]`). Transformations are then applied to
+every vertex in a single matrix operation, rather than point by point.
+
+Conversion to/from the list-of-lists-of-`Point` form used in the rest of
+the library is provided, so existing callers are unaffected.
+
+'''
+
+import numpy as np
+
+from transforms import Point
+
+
+#{{{ PolySet
+class PolySet(object):
+    '''
+    a group of polygons, stored as a flat (N, 2) vertex array plus offsets.
+    '''
+    def __init__(self, verts=None, offsets=None):
+        if verts is None:
+            verts = np.zeros((0, 2))
+        self.verts = np.asarray(verts, dtype=float).reshape(-1, 2)
+        if offsets is None:
+            offsets = [0, len(self.verts)] if len(self.verts) else [0]
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+
+    #{{{ constructors / conversion
+    @classmethod
+    def from_segs(cls, segs):
+        '''
+        build from a list of polygons, where each polygon is a sequence of
+        `Point` instances (or of (x, y) pairs).
+        '''
+        if isinstance(segs, PolySet):
+            return segs.copy()
+        lens = [len(seg) for seg in segs]
+        offsets = np.zeros(len(lens) + 1, dtype=np.intp)
+        np.cumsum(lens, out=offsets[1:])
+        verts = np.empty((offsets[-1], 2))
+        i = 0
+        for seg in segs:
+            for p in seg:
+                if hasattr(p, 'x'):
+                    verts[i, 0] = p.x
+                    verts[i, 1] = p.y
+                else:
+                    verts[i, 0] = p[0]
+                    verts[i, 1] = p[1]
+                i += 1
+        return cls(verts, offsets)
+
+    @classmethod
+    def from_arrays(cls, polys):
+        '''
+        build from a sequence of (k, 2) arrays, or from a single (M, k, 2)
+        array of M polygons with k vertices each.
+        '''
+        if isinstance(polys, np.ndarray) and polys.ndim == 3:
+            m, k = polys.shape[0], polys.shape[1]
+            offsets = np.arange(m + 1, dtype=np.intp) * k
+            return cls(polys.reshape(-1, 2), offsets)
+        polys = [np.asarray(p, dtype=float).reshape(-1, 2) for p in polys]
+        offsets = np.zeros(len(polys) + 1, dtype=np.intp)
+        np.cumsum([len(p) for p in polys], out=offsets[1:])
+        if len(polys):
+            verts = np.concatenate(polys, axis=0)
+        else:
+            verts = np.zeros((0, 2))
+        return cls(verts, offsets)
+
+    @classmethod
+    def concat(cls, groups):
+        ''' join several PolySet instances into one (in order) '''
+        groups = [g for g in groups if len(g)]
+        if not len(groups):
+            return cls()
+        verts = np.concatenate([g.verts for g in groups], axis=0)
+        offsets = [np.zeros(1, dtype=np.intp)]
+        base = 0
+        for g in groups:
+            offsets.append(g.offsets[1:] - g.offsets[0] + base)
+            base += g.offsets[-1] - g.offsets[0]
+        return cls(verts, np.concatenate(offsets))
+
+    def to_segs(self):
+        ''' return the list of lists of `Point` that existing callers expect '''
+        xy = self.verts.tolist()
+        o = self.offsets.tolist()
+        return [[Point(x, y, 0) for (x, y) in xy[o[i]:o[i+1]]]
+                for i in xrange(len(o) - 1)]
+
+    def xy_seqs(self):
+        ''' return a list of lists of (x, y) tuples, one per polygon '''
+        xy = [tuple(p) for p in self.verts.tolist()]
+        o = self.offsets.tolist()
+        return [xy[o[i]:o[i+1]] for i in xrange(len(o) - 1)]
+
+    def copy(self):
+        return PolySet(self.verts.copy(), self.offsets.copy())
+    #}}}
+
+    #{{{ container interface
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        ''' return polygon `i` as a (k, 2) view of the vertex array '''
+        n = len(self)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("polygon index out of range")
+        return self.verts[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return "PolySet with {} polygons, {} vertices".format(
+            len(self), len(self.verts))
+
+    def __repr__(self):
+        return self.__str__()
+    #}}}
+
+    #{{{ geometry
+    def bounds(self):
+        ''' return ((min_x, min_y), (max_x, max_y)) over all vertices '''
+        if not len(self.verts):
+            return (0.0, 0.0), (0.0, 0.0)
+        lo = self.verts.min(axis=0)
+        hi = self.verts.max(axis=0)
+        return (lo[0], lo[1]), (hi[0], hi[1])
+
+    def find_ctr(self):
+        '''
+        centre of the extremes of all vertices (the same convention as
+        `transforms.find_ctr_seq`, returned as a Point)
+        '''
+        if not len(self.verts):
+            return Point()
+        (x0, y0), (x1, y1) = self.bounds()
+        return Point(x1 - 0.5 * (x1 - x0), y1 - 0.5 * (y1 - y0), 0)
+
+    def translated(self, dx=0, dy=0):
+        ''' return a translated copy '''
+        return PolySet(self.verts + (dx, dy), self.offsets.copy())
+
+    def rotated(self, theta, ctr=None):
+        '''
+        return a copy rotated by theta radians about the point `ctr` (by
+        default, about the centre of the group)
+        '''
+        if ctr is None:
+            ctr = self.find_ctr()
+        c, s = np.cos(theta), np.sin(theta)
+        R = np.array([[c, s], [-s, c]]) # row-vector form of the rotation
+        o = np.array([ctr.x, ctr.y])
+        return PolySet((self.verts - o).dot(R) + o, self.offsets.copy())
+
+    def transformed(self, trans):
+        '''
+        return a copy with the Transformation `trans` applied, as per
+        `transforms.apply_transform_to_group`: rotate about the centre of the
+        group, then translate.  All vertices are handled in one operation.
+        '''
+        ctr = self.find_ctr()
+        R = trans.rot_matrix().T # row-vector form, with the cached cos/sin
+        o = np.array([ctr.x, ctr.y])
+        verts = (self.verts - o).dot(R) + (o + (trans.dx, trans.dy))
+        return PolySet(verts, self.offsets.copy())
+    #}}}
+
+#}}}
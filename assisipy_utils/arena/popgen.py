@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Reproducible generation of agent populations.
+
+Poses for a whole population are created in one vectorised call, from an
+explicit numpy random generator rather than the global `random` module.
+Each population label gets its own independent substream, derived from
+one experiment seed, so spawners running in separate processes (in any
+order) generate exactly the same populations as long as they share the
+seed.  The seed can be recorded in the bounds spec
+(`BaseArena.write_bounds_spec(fname, seed=...)`) and read back with
+`read_seed`, so that a repeat can be regenerated exactly.
+
+Example usage:
+
+    seed = read_seed('valid.arena')
+    bl, tr, trans = read_reqs('valid.arena')
+    poses = gen_population((bl, tr), 20, 'popln1', seed=seed, trans=trans)
+
+'''
+
+from math import pi
+import hashlib
+import os
+import numpy as np
+
+from zones import RectZone, sample_in_zone, to_world
+from placement import gen_spaced_bee_positions
+from sharedmap import sample_with_map
+from specfile import read_spec
+
+
+#{{{ random streams
+def new_seed():
+    ''' return a fresh 32-bit seed from the OS entropy source '''
+    return int(hashlib.sha1(os.urandom(16)).hexdigest()[:8], 16)
+
+def make_rng(seed=None):
+    '''
+    return a numpy random generator: `seed` may already be a generator
+    (returned as is), an int, or None (seeded from the OS).  This is always
+    a `numpy.random.RandomState`, whose stream numpy keeps stable across
+    versions, so a recorded seed gives the same poses on any install.
+    '''
+    if hasattr(seed, 'uniform'):
+        return seed
+    return np.random.RandomState(seed)
+
+def substream_seed(seed, label):
+    '''
+    derive a 32-bit seed for the population `label` from the experiment
+    `seed`; distinct labels give independent streams.
+    '''
+    h = hashlib.sha1("{}:{}".format(int(seed), label)).hexdigest()
+    return int(h[:8], 16)
+
+def substream(seed, label):
+    ''' random generator for population `label`, derived from `seed` '''
+    if seed is None:
+        return make_rng(None)
+    return make_rng(substream_seed(seed, label))
+#}}}
+
+#{{{ populations
+def gen_population(valid_area, n, label, seed=None, trans=None, zone=None,
+                   theta_rng=(0, 2*pi), min_sep=None, exclusions=None,
+                   occupancy=None):
+    '''
+    generate poses for a population of `n` agents, as an (n, 3) array of
+    (x, y, yaw) in world coordinates.
+
+    - `valid_area`, `trans` as returned by `read_reqs`; `zone` as returned
+      by `read_zone` (default: the `valid_area` rectangle)
+    - the positions are drawn from the substream of `seed` for `label`;
+      `seed` may also be a numpy generator, used directly.
+    - agents are kept out of the `exclusions`, discs (x, y, r) in world
+      coordinates (see placement.casu_exclusions).
+    - if `min_sep` is given, agents are spaced (see
+      placement.gen_spaced_bee_positions).
+    - if `occupancy` is given (a sharedmap.SharedOccupancyMap), agents
+      are spaced by its min_sep, also from all agents already reserved in
+      it by other spawners. (The poses then depend on the order in which
+      the spawners run.)
+    '''
+    if hasattr(seed, 'uniform'):
+        rng = seed
+    else:
+        rng = substream(seed, label)
+    if zone is None:
+        zone = RectZone(*valid_area)
+
+    ctr = (0.5 * (valid_area[0][0] + valid_area[1][0]),
+           0.5 * (valid_area[0][1] + valid_area[1][1]))
+    if occupancy is not None:
+        return sample_with_map(zone, n, occupancy, trans=trans, ctr=ctr,
+                               rng=rng, theta_rng=theta_rng,
+                               exclusions=exclusions)
+    if min_sep is not None:
+        return gen_spaced_bee_positions(
+            valid_area, n, min_sep=min_sep, theta_rng=theta_rng, trans=trans,
+            zone=zone, exclusions=exclusions, rng=rng, as_array=True)
+
+    if exclusions is not None and len(exclusions):
+        return sample_clear(zone, n, exclusions, trans=trans, ctr=ctr,
+                            rng=rng, theta_rng=theta_rng)
+    poses = sample_in_zone(zone, n, rng=rng, theta_rng=theta_rng)
+    return to_world(poses, trans, ctr)
+
+def sample_clear(zone, n, exclusions, trans=None, ctr=(0.0, 0.0), rng=None,
+                 theta_rng=(0, 2*pi), max_attempts=30):
+    '''
+    draw `n` poses within `zone` (as `sample_in_zone`, placed into the world
+    by `trans` about `ctr`) that lie outside all `exclusions`, discs
+    (x, y, r) in world coordinates.  Rejected poses are redrawn; if more
+    than `max_attempts` * n candidates are used up, a RuntimeError is raised.
+
+    Returns an (n, 3) array of world poses.
+    '''
+    n = int(n)
+    out = np.empty((n, 3))
+    if n == 0:
+        return out
+    exclusions = np.asarray(exclusions, dtype=float).reshape(-1, 3)
+    got = 0
+    budget = max_attempts * n
+    used = 0
+    while got < n:
+        if used >= budget:
+            raise RuntimeError(
+                "[E] placed only {} of {} agents clear of the exclusions".format(got, n))
+        m = min(max(2 * (n - got), 64), budget - used)
+        used += m
+        cand = to_world(sample_in_zone(zone, m, rng=rng, theta_rng=theta_rng),
+                        trans, ctr)
+        d2 = ((cand[:, None, :2] - exclusions[None, :, :2])**2).sum(axis=2)
+        cand = cand[np.all(d2 >= exclusions[None, :, 2]**2, axis=1)]
+        k = min(len(cand), n - got)
+        out[got:got+k] = cand[:k]
+        got += k
+    return out
+
+def read_seed(fname):
+    ''' return the seed recorded in a bounds spec, or None '''
+    return read_spec(fname).get('seed')
+#}}}
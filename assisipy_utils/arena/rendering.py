@@ -13,8 +13,15 @@ Abstract : Simple library to enable/aid rendering of arena elements in
 
 
 from matplotlib.patches import Polygon, Rectangle
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import matplotlib.pyplot as plt
+import multiprocessing
+import numpy as np
 from transforms import Point, translate_group, rotate_group_about_ctr
+from polyset import PolySet
+from zones import to_world
 
 
 def poly_from_seq(seq, **kwargs):
@@ -63,3 +70,152 @@ def trans_valid_area_to_rect(bounds, trans, **kwargs):
             )
     return poly_from_seq(seq_tr[0], **kwargs)
 
+
+#{{{ batched rendering
+class ArenaRenderer(object):
+    '''
+    draw any number of arenas as ONE PolyCollection (plus one for their
+    valid zones), CASUs as one scatter and agents as another. Each element
+    can then be updated in place for animation (`update_walls`,
+    `update_casus`, `update_agents`), without creating new artists.
+
+    Example usage:
+
+        R = ArenaRenderer(ax)
+        R.add_arena(A1); R.add_arena(A2, fc='r')
+        R.draw()
+        R.set_casus(casu_poses)
+        for frame in frames:
+            R.update_agents(frame[:, :2])
+    '''
+    def __init__(self, ax=None):
+        if ax is None:
+            ax = plt.gca()
+        self.ax = ax
+        self.verts = []   # one (k, 2) array per wall segment
+        self.fcs = []
+        self.zone_verts = []
+        self.walls = None # PolyCollection handles, once drawn
+        self.zones = None
+        self.casus = None # scatter handles
+        self.agents = None
+
+    def add_arena(self, arena, fc=None, zone=False):
+        '''
+        queue the walls of `arena` (a BaseArena, a PolySet, or a list of
+        lists of Points); with `zone`, also the outline of its valid zone.
+        '''
+        if hasattr(arena, 'polys'):
+            polys = arena.polys
+            if fc is None:
+                fc = arena.color
+            if zone:
+                self.zone_verts.append(to_world(arena.valid_zone().outline(),
+                                                arena.trans, arena._zone_ctr()))
+        else:
+            polys = PolySet.from_segs(arena)
+        if fc is None:
+            fc = 'b'
+        self.verts.extend(np.asarray(p) for p in polys)
+        self.fcs.extend([fc] * len(polys))
+
+    def draw(self, ec='k', zone_ec='g'):
+        ''' add the collections to the axes; returns the walls collection '''
+        self.walls = PolyCollection(self.verts, facecolors=self.fcs, edgecolors=ec)
+        self.ax.add_collection(self.walls)
+        if len(self.zone_verts):
+            self.zones = PolyCollection(self.zone_verts, facecolors='none',
+                                        edgecolors=zone_ec, linestyles='dashed')
+            self.ax.add_collection(self.zones)
+        self.ax.autoscale_view()
+        return self.walls
+
+    def update_walls(self, verts):
+        ''' replace all wall polygons (e.g. after transforms) '''
+        if hasattr(verts, 'offsets'):
+            verts = list(verts)
+        self.walls.set_verts(verts)
+
+    def set_casus(self, casu_poses, fc='w', mew=3, s=400):
+        '''
+        scatter all CASUs at once; `casu_poses` is a sequence of (Point, yaw)
+        as for `render_CASUs`, or an (N, 2+) array.
+        '''
+        self.casus = self.ax.scatter(*_xy_cols(casu_poses), marker='h', s=s,
+                                     c=fc, linewidth=mew)
+        return self.casus
+
+    def update_casus(self, casu_poses):
+        self.casus.set_offsets(np.column_stack(_xy_cols(casu_poses)))
+
+    def set_agents(self, xy, c='k', s=10, **kwargs):
+        ''' scatter all agents at once, from an (N, 2+) array '''
+        self.agents = self.ax.scatter(*_xy_cols(xy), c=c, s=s, **kwargs)
+        return self.agents
+
+    def update_agents(self, xy):
+        self.agents.set_offsets(np.column_stack(_xy_cols(xy)))
+
+def _xy_cols(poses):
+    ''' x and y columns from (Point, yaw) pairs or an (N, 2+) array '''
+    if len(poses) and hasattr(poses[0], '__len__') and hasattr(poses[0][0], 'x'):
+        return ([p.x for (p, yaw) in poses], [p.y for (p, yaw) in poses])
+    xy = np.asarray(poses, dtype=float).reshape(len(poses), -1)
+    return xy[:, 0], xy[:, 1]
+
+def render_arenas(arenas, ax=None, fc=None, zone=False):
+    ''' draw all `arenas` as one collection; returns the ArenaRenderer '''
+    R = ArenaRenderer(ax)
+    for A in arenas:
+        R.add_arena(A, fc=fc, zone=zone)
+    R.draw()
+    return R
+#}}}
+
+#{{{ headless batch mode
+def render_job(job):
+    '''
+    render one figure to file without any GUI (Agg canvas). `job` is a dict:
+        fname  -- output file (required)
+        arenas -- list of arenas (or PolySets)
+        casus  -- CASU poses, as for ArenaRenderer.set_casus
+        agents -- (N, 2+) array of agent positions
+        zone   -- if True, draw valid zones
+        xlim, ylim, figsize, dpi, title -- optional
+    '''
+    fig = Figure(figsize=job.get('figsize', (6, 6)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    R = ArenaRenderer(ax)
+    for A in job.get('arenas', []):
+        R.add_arena(A, zone=job.get('zone', False))
+    R.draw()
+    if job.get('casus') is not None:
+        R.set_casus(job['casus'])
+    if job.get('agents') is not None:
+        R.set_agents(job['agents'])
+    if 'xlim' in job:
+        ax.set_xlim(*job['xlim'])
+    if 'ylim' in job:
+        ax.set_ylim(*job['ylim'])
+    if 'title' in job:
+        ax.set_title(job['title'])
+    ax.set_aspect('equal')
+    fig.savefig(job['fname'], dpi=job.get('dpi', 100))
+    return job['fname']
+
+def render_batch(jobs, processes=None):
+    '''
+    render many figures (see `render_job`) in a pool of `processes` worker
+    processes (default: one per CPU; 1 renders in this process).
+    Returns the list of files written.
+    '''
+    if processes == 1:
+        return [render_job(job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(render_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+#}}}
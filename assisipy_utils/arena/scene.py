@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : A scene of several arenas and CASUs, with a bounding-box index.
+
+A `Scene` collects arenas (already transformed into place) and CASUs, and
+indexes every wall segment and CASU footprint in an axis-aligned bounding
+box tree.  Checking a layout for overlapping walls/CASUs then costs
+O(n log n) rather than testing every pair, and point queries (which arena
+contains a point, how far is the nearest wall) only visit nearby objects.
+
+The whole scene can be spawned in one burst (via SpawnBatch), and its
+bounds written to one combined spec.
+
+Example usage:
+
+    S = Scene()
+    S.add_arena(A1)
+    S.add_arena(A2)
+    S.add_casus_from_file('project.arena')
+    for a, b in S.overlaps():
+        print "[W] overlap between {} and {}".format(a, b)
+    S.write_bounds_spec('scene.arena')
+    S.spawn_all(sim.Control())
+
+'''
+
+import numpy as np
+
+from decompose import open_ring, signed_area
+from sdf import signed_dist_to_convex
+from placement import read_casu_poses
+from spawning import SpawnBatch
+
+
+#{{{ AABB tree
+class AABBTree(object):
+    '''
+    static bounding-box tree over boxes (lo, hi), built by recursive median
+    splits along the longest axis.
+    '''
+    LEAF_SIZE = 4
+
+    def __init__(self, lo, hi):
+        self.lo = np.asarray(lo, dtype=float).reshape(-1, 2)
+        self.hi = np.asarray(hi, dtype=float).reshape(-1, 2)
+        # nodes: [lo, hi, left, right, items]; items is None for inner nodes
+        self.nodes = []
+        if len(self.lo):
+            self._build(np.arange(len(self.lo)))
+
+    def __len__(self):
+        return len(self.lo)
+
+    def _build(self, idx):
+        lo = self.lo[idx].min(axis=0)
+        hi = self.hi[idx].max(axis=0)
+        node = len(self.nodes)
+        self.nodes.append([lo, hi, -1, -1, None])
+        if len(idx) <= self.LEAF_SIZE:
+            self.nodes[node][4] = idx
+            return node
+        axis = int(np.argmax(hi - lo))
+        mid = 0.5 * (self.lo[idx, axis] + self.hi[idx, axis])
+        order = idx[np.argsort(mid, kind='mergesort')]
+        half = len(order) // 2
+        self.nodes[node][2] = self._build(order[:half])
+        self.nodes[node][3] = self._build(order[half:])
+        return node
+
+    def query(self, lo, hi):
+        ''' indices of all boxes that overlap the box (lo, hi) '''
+        out = []
+        if not self.nodes:
+            return out
+        stack = [0]
+        while stack:
+            nlo, nhi, left, right, items = self.nodes[stack.pop()]
+            if (nlo[0] > hi[0] or nlo[1] > hi[1] or
+                    nhi[0] < lo[0] or nhi[1] < lo[1]):
+                continue
+            if items is None:
+                stack.append(left)
+                stack.append(right)
+                continue
+            for i in items:
+                if not (self.lo[i, 0] > hi[0] or self.lo[i, 1] > hi[1] or
+                        self.hi[i, 0] < lo[0] or self.hi[i, 1] < lo[1]):
+                    out.append(int(i))
+        return out
+
+    def nearest(self, p, dist_fn):
+        '''
+        branch-and-bound search for the item nearest to point `p`, where
+        `dist_fn(i, p)` gives the exact distance to item i (it must not be
+        smaller than the distance to the item's box). Returns (i, dist).
+        '''
+        best, best_d = -1, np.inf
+        if not self.nodes:
+            return best, best_d
+        px, py = p[0], p[1]
+        def box_d(lo, hi):
+            dx = max(lo[0] - px, 0.0, px - hi[0])
+            dy = max(lo[1] - py, 0.0, py - hi[1])
+            return (dx * dx + dy * dy) ** 0.5
+        stack = [(0.0, 0)]
+        while stack:
+            d, n = stack.pop()
+            if d > best_d:
+                continue
+            nlo, nhi, left, right, items = self.nodes[n]
+            if items is None:
+                dl = box_d(self.nodes[left][0], self.nodes[left][1])
+                dr = box_d(self.nodes[right][0], self.nodes[right][1])
+                # visit the nearer child first (pushed last)
+                if dl < dr:
+                    stack.append((dr, right))
+                    stack.append((dl, left))
+                else:
+                    stack.append((dl, left))
+                    stack.append((dr, right))
+                continue
+            for i in items:
+                if box_d(self.lo[i], self.hi[i]) > best_d:
+                    continue
+                di = dist_fn(i, p)
+                if di < best_d:
+                    best, best_d = int(i), di
+        return best, best_d
+#}}}
+
+#{{{ exact tests
+def _convex_overlap(a, b, tol=0.0):
+    ''' separating-axis test for two convex polygons; True if they overlap '''
+    for ring in (a, b):
+        e = np.roll(ring, -1, axis=0) - ring
+        nrm = np.column_stack([-e[:, 1], e[:, 0]])
+        ln = np.hypot(nrm[:, 0], nrm[:, 1])
+        keep = ln > 0
+        nrm = nrm[keep] / ln[keep, None]
+        pa = a.dot(nrm.T)
+        pb = b.dot(nrm.T)
+        gap = np.maximum(pb.min(axis=0) - pa.max(axis=0),
+                         pa.min(axis=0) - pb.max(axis=0))
+        if np.any(gap >= -tol):
+            return False
+    return True
+#}}}
+
+#{{{ Scene
+class Scene(object):
+    '''
+    a set of arenas (with their transforms already applied) and CASUs.
+    '''
+    def __init__(self, casu_radius=1.0):
+        self.arenas = []
+        self.casus  = [] # (name, (x, y, yaw), radius)
+        self.casu_radius = casu_radius
+        self._tree = None
+
+    #{{{ contents
+    def add_arena(self, arena):
+        self.arenas.append(arena)
+        self._tree = None
+
+    def add_casu(self, name, pose, radius=None):
+        if radius is None:
+            radius = self.casu_radius
+        self.casus.append((name, tuple(float(v) for v in pose), float(radius)))
+        self._tree = None
+
+    def add_casus_from_file(self, fname, layer=None, radius=None):
+        ''' add all CASUs listed in a deployment `.arena` file '''
+        poses = read_casu_poses(fname, layer=layer)
+        for name in sorted(poses):
+            self.add_casu(name, poses[name], radius=radius)
+
+    def _items(self):
+        '''
+        (re)build the index: one item per wall segment, and one per CASU.
+        Each item is (kind, owner, ring): kind 'wall' (owner = arena index)
+        or 'casu' (owner = casu index, ring = None).
+        '''
+        items, lo, hi = [], [], []
+        for ai, A in enumerate(self.arenas):
+            for poly in A.polys:
+                ring = open_ring(poly)
+                if signed_area(ring) < 0:
+                    ring = ring[::-1]
+                items.append(('wall', ai, ring))
+                lo.append(ring.min(axis=0))
+                hi.append(ring.max(axis=0))
+        for ci, (name, pose, r) in enumerate(self.casus):
+            items.append(('casu', ci, None))
+            lo.append((pose[0] - r, pose[1] - r))
+            hi.append((pose[0] + r, pose[1] + r))
+        self._item_list = items
+        self._tree = AABBTree(lo, hi)
+        return self._tree
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._items()
+        return self._tree
+
+    def _name(self, item):
+        kind, owner, _ring = item
+        if kind == 'wall':
+            return self.arenas[owner].label_stub
+        return self.casus[owner][0]
+    #}}}
+
+    #{{{ queries
+    def overlaps(self, tol=0.0):
+        '''
+        return the sorted list of pairs of names (arena label_stub or CASU
+        name) whose walls/footprints overlap by more than `tol`.  Walls of
+        the same arena are not tested against each other.
+        '''
+        tree = self.tree
+        items = self._item_list
+        pairs = set()
+        for i, (kind, owner, ring) in enumerate(items):
+            for j in tree.query(tree.lo[i], tree.hi[i]):
+                if j <= i:
+                    continue
+                kj, oj, rj = items[j]
+                if kind == kj == 'wall' and owner == oj:
+                    continue
+                key = tuple(sorted((self._name(items[i]), self._name(items[j]))))
+                if key in pairs:
+                    continue
+                if self._item_overlap(items[i], items[j], tol):
+                    pairs.add(key)
+        return sorted(pairs)
+
+    def _item_overlap(self, a, b, tol):
+        if a[0] == 'casu' and b[0] == 'casu':
+            pa, ra = self.casus[a[1]][1:]
+            pb, rb = self.casus[b[1]][1:]
+            return np.hypot(pa[0] - pb[0], pa[1] - pb[1]) < ra + rb - tol
+        if a[0] == 'casu':
+            a, b = b, a
+        if b[0] == 'casu':
+            pose, r = self.casus[b[1]][1:]
+            q = np.array([[pose[0], pose[1]]])
+            return signed_dist_to_convex(q, a[2])[0] < r - tol
+        return _convex_overlap(a[2], b[2], tol)
+
+    def arena_at(self, points):
+        '''
+        for each of the (N, 2) world positions, the index of the first arena
+        whose valid zone contains it, or -1.
+        '''
+        pts = np.asarray(points, dtype=float).reshape(-1, 2)
+        out = np.full(len(pts), -1, dtype=int)
+        for ai, A in enumerate(self.arenas):
+            (x0, y0), (x1, y1) = A.polys.bounds()
+            cand = np.flatnonzero((out < 0) &
+                                  (pts[:, 0] >= x0) & (pts[:, 0] <= x1) &
+                                  (pts[:, 1] >= y0) & (pts[:, 1] <= y1))
+            if len(cand):
+                out[cand[A.contains(pts[cand])]] = ai
+        return out
+
+    def contains(self, points):
+        ''' boolean array: is each point inside the valid zone of an arena '''
+        return self.arena_at(points) >= 0
+
+    def nearest_wall(self, p):
+        '''
+        return (arena index, signed distance) of the wall nearest to the
+        point `p`; distance is negative inside a wall.
+        '''
+        tree = self.tree
+        items = self._item_list
+        q = np.array([[p[0], p[1]]], dtype=float)
+        def dist(i, _p):
+            kind, owner, ring = items[i]
+            if kind != 'wall':
+                return np.inf
+            return signed_dist_to_convex(q, ring)[0]
+        i, d = tree.nearest(p, dist)
+        if i < 0:
+            return -1, np.inf
+        return items[i][1], d
+    #}}}
+
+    #{{{ output
+    def write_bounds_spec(self, fname, seed=None):
+        '''
+        write one spec for the whole scene: for each arena (by label_stub)
+        the bounds, transform and zone as in BaseArena.write_bounds_spec,
+        plus the CASU poses.
+        '''
+        spec = {'arenas': {}, 'casus': {}}
+        for A in self.arenas:
+            spec['arenas'][A.label_stub] = {
+                'base_bl': list(A.bl_bound),
+                'base_tr': list(A.tr_bound),
+                'trans'  : {'dx': A.trans.dx, 'dy': A.trans.dy,
+                            'theta': A.trans.theta},
+                'zone'   : A.valid_zone().to_dict(),
+            }
+        for name, pose, r in self.casus:
+            spec['casus'][name] = {'x': pose[0], 'y': pose[1], 'yaw': pose[2]}
+        if seed is not None:
+            spec['seed'] = int(seed)
+        import yaml
+        with open(fname, 'w') as f:
+            yaml.safe_dump(spec, f, default_flow_style=False)
+
+    def spawn_all(self, simctrl, merge_tol=None, **kwargs):
+        '''
+        spawn all CASUs and arenas in one burst; further keyword arguments
+        are passed to SpawnBatch.send. Returns the SpawnReport.
+        '''
+        batch = SpawnBatch()
+        batch.add_casus([(name, pose) for (name, pose, r) in self.casus])
+        for A in self.arenas:
+            batch.add_arena(A, merge_tol=merge_tol)
+        return batch.send(simctrl, **kwargs)
+    #}}}
+#}}}
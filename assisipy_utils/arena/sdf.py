@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Signed distance grids for arena walls.
+
+The walls of an arena (after its transform) are rasterised into a grid of
+signed distances to the nearest wall: positive in free space, negative
+inside a wall.  Looking up the distance for any number of query points is
+then a bilinear interpolation -- O(1) per point, independent of the
+number of wall segments.
+
+Grids are stored as a `.npy` array plus a small yaml sidecar (origin,
+resolution), so they can be memory-mapped by many processes, and are
+cached on disk keyed by the wall geometry.
+
+Example usage:
+
+    g = arena_sdf(A, res=0.1, cache_dir='/tmp/sdf')
+    d = g.lookup(tracks[:, :2]) # distance to wall for each point
+
+'''
+
+import hashlib
+import os
+import numpy as np
+
+from decompose import open_ring, signed_area
+
+
+#{{{ distance to convex polygons
+def signed_dist_to_convex(q, ring):
+    '''
+    signed distance from each of the points `q` (N, 2) to the convex
+    polygon `ring`: positive outside, negative inside (depth below the
+    nearest edge).
+    '''
+    ring = open_ring(ring)
+    if signed_area(ring) < 0:
+        ring = ring[::-1]
+    a = ring
+    e = np.roll(ring, -1, axis=0) - a       # (E, 2)
+    ee = (e * e).sum(axis=1)
+    ee[ee == 0] = 1.0
+    w = q[:, None, :] - a[None, :, :]       # (N, E, 2)
+    # distance to each edge, as a segment
+    t = np.clip((w * e[None]).sum(axis=2) / ee[None], 0.0, 1.0)
+    d = w - t[..., None] * e[None]
+    dist = np.sqrt((d * d).sum(axis=2)).min(axis=1)
+    # inside: left of every (anticlockwise) edge; depth is to nearest line
+    crs = (e[None, :, 0] * w[..., 1] - e[None, :, 1] * w[..., 0]) / np.sqrt(ee)[None]
+    inside = np.all(crs >= 0, axis=1)
+    dist[inside] = -crs[inside].min(axis=1)
+    return dist
+
+def wall_distance(q, polys, chunk=1 << 16):
+    '''
+    signed distance from each point in `q` (N, 2) to the union of the
+    (convex) wall polygons `polys` (a PolySet or sequence of arrays).
+    Evaluated in chunks of `chunk` points to bound the memory used.
+    '''
+    q = np.asarray(q, dtype=float).reshape(-1, 2)
+    out = np.full(len(q), np.inf)
+    rings = [np.asarray(p, dtype=float) for p in polys]
+    for s in xrange(0, len(q), chunk):
+        qc = q[s:s+chunk]
+        oc = out[s:s+chunk]
+        for ring in rings:
+            np.minimum(oc, signed_dist_to_convex(qc, ring), out=oc)
+    return out
+#}}}
+
+#{{{ DistanceGrid
+class DistanceGrid(object):
+    '''
+    signed distance samples `data[j, i]` at world position
+    (x0 + i*res, y0 + j*res).
+    '''
+    def __init__(self, data, origin, res):
+        self.data = data
+        self.x0, self.y0 = float(origin[0]), float(origin[1])
+        self.res = float(res)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def bounds(self):
+        ''' return ((min_x, min_y), (max_x, max_y)) covered by the grid '''
+        ny, nx = self.data.shape
+        return ((self.x0, self.y0),
+                (self.x0 + (nx-1) * self.res, self.y0 + (ny-1) * self.res))
+
+    def lookup(self, xy):
+        '''
+        bilinear interpolation of the distance at each of the points `xy`
+        ((N, 2), or (N, 3) poses).  Points beyond the grid take the value
+        at the nearest edge of the grid.
+        '''
+        xy = np.asarray(xy, dtype=float)
+        ny, nx = self.data.shape
+        fx = np.clip((xy[..., 0] - self.x0) / self.res, 0, nx - 1)
+        fy = np.clip((xy[..., 1] - self.y0) / self.res, 0, ny - 1)
+        i = np.minimum(fx.astype(np.intp), nx - 2)
+        j = np.minimum(fy.astype(np.intp), ny - 2)
+        tx = fx - i
+        ty = fy - j
+        g = self.data
+        v00 = g[j, i]
+        v01 = g[j, i+1]
+        v10 = g[j+1, i]
+        v11 = g[j+1, i+1]
+        return ((v00 * (1 - tx) + v01 * tx) * (1 - ty) +
+                (v10 * (1 - tx) + v11 * tx) * ty)
+
+    #{{{ storage
+    def save(self, stem):
+        '''
+        write `<stem>.npy` (the grid) and `<stem>.yaml` (origin and
+        resolution).
+        '''
+        np.save(stem + '.npy', np.ascontiguousarray(self.data))
+        import yaml
+        meta = {'origin': [self.x0, self.y0], 'res': self.res,
+                'shape': list(self.data.shape)}
+        with open(stem + '.yaml', 'w') as f:
+            yaml.safe_dump(meta, f, default_flow_style=False)
+
+    @classmethod
+    def load(cls, stem, mmap=True):
+        '''
+        read a grid written by `save`; by default the array is memory-mapped
+        read-only, so it is shared between processes and loaded lazily.
+        '''
+        import yaml
+        with open(stem + '.yaml') as f:
+            meta = yaml.safe_load(f)
+        data = np.load(stem + '.npy', mmap_mode='r' if mmap else None)
+        return cls(data, meta['origin'], meta['res'])
+    #}}}
+#}}}
+
+#{{{ construction / cache
+def compute_sdf(polys, res=0.1, pad=1.0, bounds=None):
+    '''
+    rasterise the walls `polys` into a DistanceGrid with cells of `res`,
+    covering `bounds` ((min_x, min_y), (max_x, max_y); by default the
+    extent of the walls) plus `pad` on each side.
+    '''
+    if bounds is None:
+        bounds = polys.bounds()
+    (x0, y0), (x1, y1) = bounds
+    x0, y0, x1, y1 = x0 - pad, y0 - pad, x1 + pad, y1 + pad
+    nx = max(int(np.ceil((x1 - x0) / res)) + 1, 2)
+    ny = max(int(np.ceil((y1 - y0) / res)) + 1, 2)
+    gx, gy = np.meshgrid(x0 + res * np.arange(nx), y0 + res * np.arange(ny))
+    q = np.column_stack([gx.ravel(), gy.ravel()])
+    data = wall_distance(q, polys).reshape(ny, nx).astype(np.float32)
+    return DistanceGrid(data, (x0, y0), res)
+
+def sdf_key(polys, res, pad):
+    ''' cache key: a digest of the wall geometry and grid parameters '''
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(polys.verts, dtype=np.float64).tostring())
+    h.update(np.ascontiguousarray(polys.offsets, dtype=np.int64).tostring())
+    h.update("{!r}:{!r}".format(float(res), float(pad)))
+    return h.hexdigest()
+
+_sdf_cache = {}
+
+def arena_sdf(arena, res=0.1, pad=1.0, cache_dir=None):
+    '''
+    return the DistanceGrid for the walls of `arena` (a BaseArena, as
+    transformed).  Grids are cached in memory, and also in `cache_dir`
+    (if given) as `sdf-<key>.npy/.yaml`, which are memory-mapped on reuse.
+    '''
+    polys = arena.polys
+    key = sdf_key(polys, res, pad)
+    if key in _sdf_cache:
+        return _sdf_cache[key]
+    if cache_dir is not None:
+        stem = os.path.join(cache_dir, 'sdf-{}'.format(key))
+        if os.path.exists(stem + '.npy') and os.path.exists(stem + '.yaml'):
+            grid = DistanceGrid.load(stem)
+        else:
+            grid = compute_sdf(polys, res=res, pad=pad)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # write under a private name, then move into place, so that
+            # concurrent processes never see a partial grid
+            tmp = '{}.{}'.format(stem, os.getpid())
+            grid.save(tmp)
+            os.rename(tmp + '.yaml', stem + '.yaml')
+            os.rename(tmp + '.npy', stem + '.npy')
+    else:
+        grid = compute_sdf(polys, res=res, pad=pad)
+    _sdf_cache[key] = grid
+    return grid
+#}}}
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : An occupancy map shared between concurrent spawner processes.
+
+Each population is spawned by its own process, which picks positions
+without knowing about the others; populations that share an arena could
+then overlap.  A SharedOccupancyMap is a grid held in a memory-mapped file
+(in the logdir of the run) that records every agent position reserved so
+far.  Spawners draw candidate positions in a batch, as usual, and then
+reserve them in one short critical section under an exclusive file lock,
+keeping only those at least `min_sep` from every agent already placed (by
+any process).  The spawners thus run concurrently, and only the
+reservations are serialised.
+
+The grid is the same as the one used in placement.py: cells of side
+min_sep/sqrt(2), each holding at most one position, so a test only
+inspects a 5x5 block of cells.
+
+Files are `<stem>.npy` (the grid) and `<stem>.yaml` (its origin, cell size
+and separation), as for sdf.DistanceGrid. exec_sim_timed creates the map,
+and passes the stem to the spawners in the environment variable
+ASSISI_OCCUPANCY_MAP.
+
+Example usage (in a spawner):
+
+    occ = SharedOccupancyMap.from_env()
+    bee_poses = gen_population((bl, tr), n, label, seed=seed, trans=trans,
+                               zone=zone, occupancy=occ)
+
+'''
+
+from contextlib import contextmanager
+from math import pi, sqrt
+import fcntl
+import os
+import numpy as np
+
+from zones import RectZone, sample_in_zone, to_world, zone_from_dict
+from transforms import Transformation
+from specfile import read_spec
+
+ENV_VAR = 'ASSISI_OCCUPANCY_MAP'
+
+
+#{{{ SharedOccupancyMap
+class SharedOccupancyMap(object):
+    '''
+    reserved agent positions (world coordinates) in a memory-mapped grid;
+    open an existing map with `SharedOccupancyMap(stem)`, or make one with
+    `create`.
+    '''
+    def __init__(self, stem):
+        import yaml
+        self.stem = stem
+        with open(stem + '.yaml') as f:
+            meta = yaml.safe_load(f)
+        self.x0, self.y0 = [float(v) for v in meta['origin']]
+        self.cell = float(meta['cell'])
+        self.min_sep = float(meta['min_sep'])
+        self.min_sep2 = self.min_sep * self.min_sep
+        self.grid = np.load(stem + '.npy', mmap_mode='r+')
+        self.shape = self.grid.shape[:2]
+
+    @classmethod
+    def create(cls, stem, bl, tr, min_sep=1.5, pad=None):
+        '''
+        make an empty map covering `bl`..`tr` (plus `pad`, by default
+        min_sep) for agents `min_sep` apart; any existing map is replaced.
+        '''
+        if pad is None:
+            pad = min_sep
+        cell = min_sep / sqrt(2.0)
+        x0, y0 = bl[0] - pad, bl[1] - pad
+        nx = int((tr[0] + pad - x0) / cell) + 1
+        ny = int((tr[1] + pad - y0) / cell) + 1
+        grid = np.lib.format.open_memmap(stem + '.npy', mode='w+',
+                                         dtype=np.float32, shape=(nx, ny, 2))
+        grid[:] = np.nan
+        grid.flush()
+        del grid
+        import yaml
+        meta = {'origin': [float(x0), float(y0)], 'cell': float(cell),
+                'min_sep': float(min_sep), 'shape': [nx, ny]}
+        with open(stem + '.yaml', 'w') as f:
+            yaml.safe_dump(meta, f, default_flow_style=False)
+        return cls(stem)
+
+    @classmethod
+    def from_env(cls):
+        ''' the map named by ASSISI_OCCUPANCY_MAP, or None if unset '''
+        stem = os.environ.get(ENV_VAR)
+        if not stem:
+            return None
+        return cls(stem)
+
+    @contextmanager
+    def locked(self):
+        ''' hold an exclusive lock on the map (across processes) '''
+        with open(self.stem + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _cells(self, xy):
+        i = np.floor((xy[:, 0] - self.x0) / self.cell).astype(int)
+        j = np.floor((xy[:, 1] - self.y0) / self.cell).astype(int)
+        return i, j
+
+    def reserve(self, xy, limit=None):
+        '''
+        atomically reserve the (N, 2+) world positions `xy`, in order: each
+        is accepted if it is at least min_sep from all positions reserved
+        before (by any process), up to `limit` acceptances.  Positions
+        outside the map cannot be checked, and are refused.
+
+        Returns a boolean array of the positions accepted.
+        '''
+        xy = np.asarray(xy, dtype=float).reshape(len(xy), -1)[:, :2]
+        ok = np.zeros(len(xy), dtype=bool)
+        if limit is None:
+            limit = len(xy)
+        ci, cj = self._cells(xy)
+        nx, ny = self.shape
+        inside = (ci >= 0) & (ci < nx) & (cj >= 0) & (cj < ny)
+        g = self.grid
+        n_ok = 0
+        with self.locked(), np.errstate(invalid='ignore'):
+            for k in np.flatnonzero(inside):
+                if n_ok >= limit:
+                    break
+                i, j = ci[k], cj[k]
+                if not np.isnan(g[i, j, 0]):
+                    continue
+                blk = g[max(i-2, 0):i+3, max(j-2, 0):j+3].reshape(-1, 2)
+                d2 = ((blk - xy[k])**2).sum(axis=1)
+                if np.any(d2 < self.min_sep2): # (NaN compares False)
+                    continue
+                g[i, j] = xy[k]
+                ok[k] = True
+                n_ok += 1
+            g.flush()
+        return ok
+
+    def release(self, xy):
+        ''' free the reservations at the (N, 2+) positions `xy` '''
+        xy = np.asarray(xy, dtype=float).reshape(len(xy), -1)[:, :2]
+        ci, cj = self._cells(xy)
+        nx, ny = self.shape
+        g = self.grid
+        with self.locked():
+            for i, j in zip(ci, cj):
+                if 0 <= i < nx and 0 <= j < ny:
+                    g[i, j] = np.nan
+            g.flush()
+
+    def occupied(self):
+        ''' (N, 2) array of all reserved positions '''
+        flat = np.asarray(self.grid).reshape(-1, 2)
+        return flat[~np.isnan(flat[:, 0])].astype(float)
+
+    def clear(self):
+        with self.locked():
+            self.grid[:] = np.nan
+            self.grid.flush()
+
+    def __str__(self):
+        return "SharedOccupancyMap {} ({}x{} cells, min_sep {:.3f})".format(
+            self.stem, self.shape[0], self.shape[1], self.min_sep)
+
+    def __repr__(self):
+        return self.__str__()
+#}}}
+
+#{{{ sampling against the map
+def sample_with_map(zone, n, occ, trans=None, ctr=(0.0, 0.0), rng=None,
+                    theta_rng=(0, 2*pi), exclusions=None, max_attempts=30):
+    '''
+    draw `n` poses within `zone` (arena frame; placed into the world by
+    `trans` about `ctr`), reserving each in the SharedOccupancyMap `occ`.
+    `exclusions` are discs (x, y, r) in world coordinates.  Candidates are
+    drawn in blocks outside the lock; if more than `max_attempts` * n are
+    used up, the reservations made are released and a RuntimeError raised.
+
+    Returns an (n, 3) array of world poses.
+    '''
+    if rng is None:
+        rng = np.random
+    n = int(n)
+    out = np.empty((n, 3))
+    if n == 0:
+        return out
+    if exclusions is not None and len(exclusions):
+        exclusions = np.asarray(exclusions, dtype=float).reshape(-1, 3)
+    else:
+        exclusions = None
+
+    got = 0
+    budget = max_attempts * n
+    used = 0
+    while got < n:
+        if used >= budget:
+            occ.release(out[:got])
+            raise RuntimeError(
+                "[E] reserved only {} of {} agents in {}".format(got, n, occ))
+        m = min(max(2 * (n - got), 64), budget - used)
+        used += m
+        cand = to_world(sample_in_zone(zone, m, rng=rng, theta_rng=theta_rng),
+                        trans, ctr)
+        if exclusions is not None:
+            d2 = ((cand[:, None, :2] - exclusions[None, :, :2])**2).sum(axis=2)
+            cand = cand[np.all(d2 >= exclusions[None, :, 2]**2, axis=1)]
+        ok = occ.reserve(cand, limit=n - got)
+        k = int(ok.sum())
+        out[got:got+k] = cand[ok]
+        got += k
+    return out
+#}}}
+
+#{{{ setup
+def spec_world_bounds(fnames):
+    '''
+    bounding box ((min_x, min_y), (max_x, max_y)), in world coordinates, of
+    the valid zones of all the bounds specs `fnames`
+    '''
+    pts = []
+    for fname in fnames:
+        spec = read_spec(fname)
+        bl, tr = spec['base_bl'], spec['base_tr']
+        zone = zone_from_dict(spec.get('zone')) or RectZone(bl, tr)
+        (x0, y0), (x1, y1) = zone.bbox()
+        t = spec['trans']
+        ctr = (0.5 * (bl[0] + tr[0]), 0.5 * (bl[1] + tr[1]))
+        corners = np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+        pts.append(to_world(corners, Transformation(t['dx'], t['dy'], t['theta']), ctr))
+    if not pts:
+        raise ValueError("[E] no bounds specs given")
+    pts = np.vstack(pts)
+    return tuple(pts.min(axis=0)), tuple(pts.max(axis=0))
+
+def create_for_specs(stem, fnames, min_sep=1.5):
+    ''' create a map covering all of the bounds specs `fnames` '''
+    bl, tr = spec_world_bounds(fnames)
+    return SharedOccupancyMap.create(stem, bl, tr, min_sep=min_sep)
+#}}}
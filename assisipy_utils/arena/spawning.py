@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Batched spawning of many objects over one simulator connection.
+
+A `SpawnBatch` collects the walls of any number of arenas (and optionally
+CASUs, bees, or other objects), and then sends them all through a single
+`sim.Control` handle in one burst: there is no per-arena connection set-up
+and no waiting between messages.  The time taken by each spawn call is
+recorded, so that the set-up cost can be inspected.
+
+Example usage:
+
+    batch = SpawnBatch()
+    batch.add_arena(A1)
+    batch.add_arena(A2, merge_tol=0.1)
+    batch.add_bees(poses, label='popln1')
+    report = batch.send(sim.Control())
+    print report
+
+'''
+
+import time
+
+from constructors import ORIGIN
+
+
+#{{{ SpawnReport
+class SpawnReport(object):
+    '''
+    timing record of a batch spawn: per-object durations (in seconds) and
+    the wall-clock time of the whole burst.
+    '''
+    def __init__(self):
+        self.timings = [] # (name, seconds)
+        self.total   = 0.0
+
+    def __len__(self):
+        return len(self.timings)
+
+    def slowest(self, n=5):
+        ''' return the n slowest (name, seconds) pairs '''
+        return sorted(self.timings, key=lambda t: t[1], reverse=True)[:n]
+
+    def __str__(self):
+        n = len(self.timings)
+        if n == 0:
+            return "SpawnReport: no objects spawned"
+        durs = [d for (_, d) in self.timings]
+        return ("SpawnReport: {} objects in {:.3f}s (mean {:.2f}ms, max {:.2f}ms)"
+                .format(n, self.total, 1e3 * sum(durs) / n, 1e3 * max(durs)))
+
+    def __repr__(self):
+        return self.__str__()
+#}}}
+
+#{{{ SpawnBatch
+class SpawnBatch(object):
+    '''
+    collect spawn requests, then send them all over one connection.
+    '''
+    def __init__(self):
+        self.items = [] # (obj_type, name, pose, kwargs)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, obj_type, name, pose, **kwargs):
+        ''' queue one object; arguments as for `sim.Control.spawn` '''
+        self.items.append((obj_type, name, tuple(pose), kwargs))
+
+    def add_arena(self, arena, offset=0, merge_tol=None):
+        '''
+        queue all wall segments of `arena` (a BaseArena), named and
+        coloured exactly as `arena.spawn` would do.
+        '''
+        for label, pts in arena.spawn_specs(offset=offset, merge_tol=merge_tol):
+            self.add('Physical', label, ORIGIN, polygon=pts,
+                     color=arena.color, height=arena.height)
+
+    def add_casus(self, casu_poses):
+        ''' queue CASUs, given as a sequence of (name, (x, y, yaw)) '''
+        for name, pose in casu_poses:
+            self.add('Casu', name, pose)
+
+    def add_bees(self, poses, label='popln', obj_type='Bee', names=None):
+        '''
+        queue agents at `poses`: a sequence of (x, y, yaw), or of (Point, yaw)
+        as returned by `gen_valid_bee_positions`.  If `names` is not given,
+        agents are named "<label>-Bee-NNN".
+        '''
+        if names is None:
+            names = ['{}-Bee-{:03d}'.format(label, i) for i in xrange(len(poses))]
+        for name, pose in zip(names, poses):
+            if hasattr(pose[0], 'x'):
+                pose = (pose[0].x, pose[0].y, pose[1])
+            self.add(obj_type, name, [float(v) for v in pose])
+
+    def send(self, simctrl, burst=0, pause=0.0, verb=False):
+        '''
+        send all queued spawn requests through `simctrl`, back-to-back.
+
+        If `burst` > 0, pause for `pause` seconds after every `burst`
+        messages (this can help if the simulator drops messages when
+        flooded). Returns a SpawnReport.
+        '''
+        report = SpawnReport()
+        t_start = time.time()
+        for i, (obj_type, name, pose, kwargs) in enumerate(self.items):
+            t0 = time.time()
+            simctrl.spawn(obj_type, name, pose, **kwargs)
+            report.timings.append((name, time.time() - t0))
+            if verb:
+                print "[I] spawned {} '{}'".format(obj_type, name)
+            if burst > 0 and pause > 0 and (i + 1) % burst == 0:
+                time.sleep(pause)
+        report.total = time.time() - t_start
+        if verb:
+            print "[I] {}".format(report)
+
+        return report
+#}}}
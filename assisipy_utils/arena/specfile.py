@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Reading and writing arena bounds specs, in yaml or binary form.
+
+The bounds spec (base_bl, base_tr, trans, and optionally zone and seed)
+was written as yaml only.  It can now also be written as a binary file: an
+uncompressed numpy `.npz` archive, which additionally holds the full wall
+geometry.  Reading it needs no yaml parser (yaml is only imported when a
+yaml spec is read or written).
+
+`read_spec` detects the format from the file contents (a zip archive
+starts with 'PK'), so the filename extension does not matter; `read_reqs`,
+`read_zone` and `read_seed` all go through it.
+
+Existing specs can be converted with
+
+    assisi_arena_spec valid.arena valid-bin.arena
+
+'''
+
+import argparse
+import copy
+import os
+import numpy as np
+
+from polyset import PolySet
+
+SPEC_VERSION = 1
+_ZIP_MAGIC = 'PK'
+
+# zone parameters, as stored in the binary format
+_ZONE_FIELDS = {
+    'rect'         : lambda d: [d['bl'][0], d['bl'][1], d['tr'][0], d['tr'][1]],
+    'rounded_rect' : lambda d: [d['ax'], d['ay'], d['r'], d.get('cx', 0.0), d.get('cy', 0.0)],
+}
+
+
+#{{{ format detection
+def spec_format(fname):
+    ''' return 'npz' or 'yaml', from the first bytes of the file '''
+    with open(fname, 'rb') as f:
+        head = f.read(2)
+    return 'npz' if head == _ZIP_MAGIC else 'yaml'
+#}}}
+
+#{{{ zones <-> arrays
+def _zone_to_arr(zone):
+    if zone is None:
+        return '', np.zeros(0)
+    return zone['kind'], np.array(_ZONE_FIELDS[zone['kind']](zone), dtype=float)
+
+def _zone_from_arr(kind, p):
+    p = [float(v) for v in p]
+    if kind == 'rect':
+        return {'kind': kind, 'bl': p[0:2], 'tr': p[2:4]}
+    elif kind == 'rounded_rect':
+        return {'kind': kind, 'ax': p[0], 'ay': p[1], 'r': p[2],
+                'cx': p[3], 'cy': p[4]}
+    return None
+#}}}
+
+#{{{ writing
+def write_spec(fname, spec, fmt='yaml'):
+    '''
+    write the bounds `spec`, a dict with keys base_bl, base_tr, trans
+    ({dx, dy, theta}) and optionally zone (dict), seed, walls (PolySet).
+    `fmt` is 'yaml' (walls are not written) or 'npz'.
+    '''
+    if fmt == 'yaml':
+        import yaml
+        d = dict((k, v) for (k, v) in spec.items()
+                 if k != 'walls' and v is not None)
+        with open(fname, 'w') as f:
+            yaml.safe_dump(d, f, default_flow_style=False)
+    elif fmt == 'npz':
+        tr = spec['trans']
+        walls = spec.get('walls')
+        if walls is None:
+            walls = PolySet()
+        seed = spec.get('seed')
+        kind, zp = _zone_to_arr(spec.get('zone'))
+        # (written via a file object, so that no '.npz' suffix is added)
+        with open(fname, 'wb') as f:
+            np.savez(f,
+                     version=np.array([SPEC_VERSION]),
+                     bounds=np.array(list(spec['base_bl']) + list(spec['base_tr']), dtype=float),
+                     trans=np.array([tr['dx'], tr['dy'], tr['theta']], dtype=float),
+                     zone_kind=np.array(kind),
+                     zone_params=zp,
+                     seed=np.array([-1 if seed is None else int(seed)], dtype=np.int64),
+                     verts=walls.verts,
+                     offsets=walls.offsets)
+    else:
+        raise ValueError("[E] unknown spec format '{}'".format(fmt))
+#}}}
+
+#{{{ reading
+_spec_cache = {}
+
+def read_spec(fname):
+    '''
+    read a bounds spec in either format, returning a dict as for
+    `write_spec` (walls is None for yaml specs). Results are memoised while
+    the file is unchanged, so repeated reads (read_reqs, read_zone, ...)
+    only parse it once; each call returns its own copy.
+    '''
+    st = os.stat(fname)
+    key = (os.path.abspath(fname), st.st_mtime, st.st_size)
+    if key in _spec_cache:
+        return copy.deepcopy(_spec_cache[key])
+
+    if spec_format(fname) == 'npz':
+        spec = _read_npz(fname)
+    else:
+        import yaml
+        with open(fname) as f:
+            spec = yaml.safe_load(f)
+        spec.setdefault('zone', None)
+        spec.setdefault('seed', None)
+        spec['walls'] = None
+    _spec_cache[key] = spec
+    return copy.deepcopy(spec)
+
+def _read_npz(fname):
+    with np.load(fname) as z:
+        ver = int(z['version'][0])
+        if ver > SPEC_VERSION:
+            raise ValueError("[E] spec {} has version {}; at most {} understood".format(
+                fname, ver, SPEC_VERSION))
+        b = z['bounds'].tolist()
+        t = z['trans'].tolist()
+        seed = int(z['seed'][0])
+        spec = {
+            'base_bl': b[0:2],
+            'base_tr': b[2:4],
+            'trans'  : {'dx': t[0], 'dy': t[1], 'theta': t[2]},
+            'zone'   : _zone_from_arr(str(z['zone_kind']), z['zone_params']),
+            'seed'   : None if seed < 0 else seed,
+            'walls'  : PolySet(z['verts'], z['offsets']),
+        }
+    return spec
+#}}}
+
+#{{{ conversion
+def convert_spec(src, dst, fmt='npz'):
+    ''' rewrite the bounds spec `src` as `dst`, in format `fmt` '''
+    spec = read_spec(src)
+    write_spec(dst, spec, fmt=fmt)
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'convert an arena bounds spec between yaml and binary (npz) formats')
+    parser.add_argument('src', type=str)
+    parser.add_argument('dst', type=str)
+    parser.add_argument('-f', '--fmt', type=str, default='npz',
+                        choices=['npz', 'yaml'])
+    args = parser.parse_args()
+
+    convert_spec(args.src, args.dst, fmt=args.fmt)
+    print "[I] wrote {} spec {} (from {} {})".format(
+        args.fmt, args.dst, spec_format(args.src), args.src)
+
+if __name__ == '__main__':
+    main()
+#}}}
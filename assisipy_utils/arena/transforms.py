@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from math import sin, cos
+import numpy as np
 
 def translate_point(p, dx=0, dy=0):
     ''' translate point by the delta position dx, dy'''
@@ -48,31 +49,44 @@ def rotate_point_about_other(p, other, theta=0):
     #P = translate_point(P, -tx, -ty)
     #print "point at origin: ({:.3f}, {:.3f})".format(P.x, P.y)
     # then rotate it by theta degrees
-    Q = Point()
-    Q.x = (tx * cos(theta)) - (ty * sin(theta)) + other.x
-    Q.y = (tx * sin(theta)) + (ty * cos(theta)) + other.y
-    ## now translate back
-    #R = translate_point(Q, tx, ty)
-    #print "rotated : ({:.3f}, {:.3f})".format(Q.x, Q.y)
-    return Q
+    c, s = cos(theta), sin(theta)
+    return Point((tx * c) - (ty * s) + other.x,
+                 (tx * s) + (ty * c) + other.y)
+
+def _rotate_cs(p, other, c, s):
+    ''' as rotate_point_about_other, with cos/sin of the angle precomputed '''
+    tx = p.x - other.x
+    ty = p.y - other.y
+    return Point((tx * c) - (ty * s) + other.x,
+                 (tx * s) + (ty * c) + other.y)
 
 def rotate_polygon(poly, ctr, theta):
     ''' return a sequence of points rotated about the position 'ctr' '''
-    return [rotate_point_about_other(p, ctr, theta) for p in poly]
+    c, s = cos(theta), sin(theta)
+    return [_rotate_cs(p, ctr, c, s) for p in poly]
+
+def _is_polyset(poly_group):
+    ''' duck-type check for the array-backed polyset.PolySet container '''
+    return hasattr(poly_group, 'verts') and hasattr(poly_group, 'offsets')
 
 def rotate_group_about_ctr(poly_group, theta, ctr=None):
     ''' find the centre of the group and rotate all elements about the ctr'''
+    if _is_polyset(poly_group):
+        return poly_group.rotated(theta, ctr=ctr)
     # find centre of all points in the group into one list,
     if ctr is None:
         ctr = find_ctr_seq([item for sublist in poly_group for item in sublist])
+    c, s = cos(theta), sin(theta)
     rotated_poly_group = []
     for poly in poly_group:
-        r_seg = [ rotate_point_about_other(p, ctr, theta) for p in poly]
+        r_seg = [ _rotate_cs(p, ctr, c, s) for p in poly]
         rotated_poly_group.append(r_seg)
 
     return rotated_poly_group
 
 def translate_group(poly_group, dx=0, dy=0):
+    if _is_polyset(poly_group):
+        return poly_group.translated(dx=dx, dy=dy)
     return [translate_seq(seg, dx=dx, dy=dy) for seg in poly_group]
 
 
@@ -83,7 +97,13 @@ def apply_transform_to_group(poly_group, trans):
 
     the rotation is applied first, about the centre of the group, and then
     the whole rotated group is translated.
+
+    `poly_group` can be a list of point sequences, or a polyset.PolySet (in
+    which case the transform is applied to all vertices in one operation, and
+    a PolySet is returned).
     '''
+    if _is_polyset(poly_group):
+        return poly_group.transformed(trans)
     return (translate_group(
         rotate_group_about_ctr(poly_group, trans.theta),
         dx=trans.dx, dy=trans.dy)
@@ -108,11 +128,20 @@ class Point(object):
     '''
     simple 3d point container/representation allows addition of positions
     and not much more'''
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x=0, y=0, z=0):
         self.x = x
         self.y = y
         self.z = z
 
+    # slotted classes need explicit state handling for pickle protocols < 2
+    def __getstate__(self):
+        return (self.x, self.y, self.z)
+
+    def __setstate__(self, state):
+        self.x, self.y, self.z = state
+
     def abs(self):
         ''' return magnitude of length of vector from origin'''
         return (self.x**2 + self.y**2 + self.z**2 )**0.5
@@ -140,16 +169,112 @@ class Point(object):
 class Transformation(object):
     '''
     simple container object to consistently store parameters relating
-    to a transformation
+    to a transformation: a rotation by `theta` radians followed by a
+    translation by (dx, dy).
+
+    The cos/sin of the rotation are computed once, when theta is set.
+    Transformations can be chained with `compose` and reversed with
+    `inverse`; in both cases rotations are taken about the origin, so that
+    a chain of placements collapses into a single transformation.
     '''
+    __slots__ = ('dx', 'dy', '_theta', '_cos', '_sin')
+
     def __init__(self, dx=0, dy=0, theta=0):
         self.dx      = float(dx)
         self.dy      = float(dy)
         self.theta   = float(theta)
 
+    def _get_theta(self):
+        return self._theta
+
+    def _set_theta(self, theta):
+        self._theta = float(theta)
+        self._cos = cos(self._theta)
+        self._sin = sin(self._theta)
+
+    theta = property(_get_theta, _set_theta)
+
+    def __getstate__(self):
+        return (self.dx, self.dy, self._theta)
+
+    def __setstate__(self, state):
+        self.dx, self.dy, self.theta = state
+
+    def rot_matrix(self):
+        ''' 2x2 rotation matrix (column-vector convention) '''
+        c, s = self._cos, self._sin
+        return np.array([[c, -s], [s, c]])
+
+    def matrix(self, ctr=None):
+        '''
+        3x3 homogeneous matrix for rotation about `ctr` (a Point or (x, y);
+        the origin by default) followed by the translation.
+        '''
+        c, s = self._cos, self._sin
+        cx, cy = _xy(ctr)
+        return np.array([
+            [c, -s, cx - c * cx + s * cy + self.dx],
+            [s,  c, cy - s * cx - c * cy + self.dy],
+            [0., 0., 1.]])
+
+    def apply_to_array(self, xy, ctr=None):
+        '''
+        apply to an (N, 2) array of positions, or an (N, 3) array of poses
+        (x, y, yaw) in which case theta is added to the yaw. Rotation is
+        about `ctr` (the origin by default). Returns a new array.
+        '''
+        xy = np.asarray(xy, dtype=float)
+        cx, cy = _xy(ctr)
+        out = np.array(xy, copy=True)
+        x = xy[..., 0] - cx
+        y = xy[..., 1] - cy
+        out[..., 0] = (x * self._cos) - (y * self._sin) + cx + self.dx
+        out[..., 1] = (x * self._sin) + (y * self._cos) + cy + self.dy
+        if xy.shape[-1] > 2:
+            out[..., 2] += self._theta
+        return out
+
+    def apply_to_point(self, p, ctr=None):
+        ''' apply to a single Point, returning a new Point '''
+        cx, cy = _xy(ctr)
+        x = p.x - cx
+        y = p.y - cy
+        return Point((x * self._cos) - (y * self._sin) + cx + self.dx,
+                     (x * self._sin) + (y * self._cos) + cy + self.dy, p.z)
+
+    def compose(self, other):
+        '''
+        return the single Transformation equivalent to applying self, then
+        `other` (both about the origin).
+        '''
+        c, s = other._cos, other._sin
+        return Transformation(
+            dx=(c * self.dx) - (s * self.dy) + other.dx,
+            dy=(s * self.dx) + (c * self.dy) + other.dy,
+            theta=self._theta + other._theta)
+
+    def inverse(self):
+        ''' return the Transformation that undoes this one '''
+        c, s = self._cos, self._sin
+        return Transformation(
+            dx=-((c * self.dx) + (s * self.dy)),
+            dy=-((-s * self.dx) + (c * self.dy)),
+            theta=-self._theta)
+
     def __str__(self):
         s =  "Transformation: Rotate by {:{fmt}} and translate by ({:{fmt}}, {:{fmt}})".format(self.theta, self.dx, self.dy,
                                          fmt='6.3f')
         return s
 
+    def __repr__(self):
+        return self.__str__()
+
+def _xy(ctr):
+    ''' unpack an optional centre of rotation, given as Point or pair '''
+    if ctr is None:
+        return 0.0, 0.0
+    if hasattr(ctr, 'x'):
+        return ctr.x, ctr.y
+    return ctr[0], ctr[1]
+
 #}}}
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Author   : Rob Mills, BioISI, FCUL.
+         : ASSISIbf project
+
+Abstract : Valid zones for placing agents inside an arena.
+
+A zone describes the region in which agents can be placed, in the arena's
+own (untransformed) frame.  Zones support vectorised hit tests
+(`contains`), batched rejection sampling (`sample_in_zone`) and closed-form
+`area`, `perimeter` and `centroid`, and can be written to / read from the
+bounds spec as a small dictionary.
+
+Two zones are provided:
+- RectZone: an axis-aligned rectangle (the original `bl_bound`/`tr_bound`)
+- RoundedRectZone: all points within distance `r` of a rectangle with
+  half-extents (ax, ay). This covers the interior of the stadium (ay=0),
+  circle (ax=ay=0) and rounded-rectangle arenas exactly.
+
+'''
+
+from math import pi
+import numpy as np
+
+from transforms import Transformation
+
+
+#{{{ zone classes
+class RectZone(object):
+    ''' axis-aligned rectangle, from bottom-left `bl` to top-right `tr` '''
+    kind = 'rect'
+
+    def __init__(self, bl, tr):
+        self.bl = (float(bl[0]), float(bl[1]))
+        self.tr = (float(tr[0]), float(tr[1]))
+
+    def contains(self, xy):
+        ''' boolean array: which of the (N, 2+) positions are in the zone '''
+        xy = np.asarray(xy, dtype=float)
+        x, y = xy[..., 0], xy[..., 1]
+        return ((x >= self.bl[0]) & (x <= self.tr[0]) &
+                (y >= self.bl[1]) & (y <= self.tr[1]))
+
+    def bbox(self):
+        return self.bl, self.tr
+
+    def area(self):
+        return (self.tr[0] - self.bl[0]) * (self.tr[1] - self.bl[1])
+
+    def perimeter(self):
+        return 2.0 * ((self.tr[0] - self.bl[0]) + (self.tr[1] - self.bl[1]))
+
+    def centroid(self):
+        return (0.5 * (self.bl[0] + self.tr[0]), 0.5 * (self.bl[1] + self.tr[1]))
+
+    def to_dict(self):
+        return {'kind': self.kind, 'bl': list(self.bl), 'tr': list(self.tr)}
+
+    def outline(self, n=None):
+        ''' boundary of the zone as a (4, 2) array (anticlockwise) '''
+        (x0, y0), (x1, y1) = self.bl, self.tr
+        return np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+
+    def __str__(self):
+        return "RectZone from ({:.3f}, {:.3f}) to ({:.3f}, {:.3f})".format(
+            self.bl[0], self.bl[1], self.tr[0], self.tr[1])
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class RoundedRectZone(object):
+    '''
+    points within distance `r` of the rectangle centred at (cx, cy) with
+    half-extents (ax, ay).  Special cases are a circle (ax = ay = 0) and a
+    stadium (ay = 0).
+    '''
+    kind = 'rounded_rect'
+
+    def __init__(self, ax, ay, r, cx=0.0, cy=0.0):
+        self.ax = float(ax)
+        self.ay = float(ay)
+        self.r  = float(r)
+        self.cx = float(cx)
+        self.cy = float(cy)
+        if min(self.ax, self.ay, self.r) < 0:
+            raise ValueError("[E] zone dimensions must be non-negative")
+
+    def contains(self, xy):
+        ''' boolean array: which of the (N, 2+) positions are in the zone '''
+        xy = np.asarray(xy, dtype=float)
+        dx = np.maximum(np.abs(xy[..., 0] - self.cx) - self.ax, 0.0)
+        dy = np.maximum(np.abs(xy[..., 1] - self.cy) - self.ay, 0.0)
+        return (dx * dx + dy * dy) <= self.r * self.r
+
+    def bbox(self):
+        hx, hy = self.ax + self.r, self.ay + self.r
+        return (self.cx - hx, self.cy - hy), (self.cx + hx, self.cy + hy)
+
+    def area(self):
+        ''' the rectangle, its sides pushed out by r, and four quarter discs '''
+        return (4.0 * self.ax * self.ay + 4.0 * self.r * (self.ax + self.ay) +
+                pi * self.r ** 2)
+
+    def perimeter(self):
+        return 4.0 * (self.ax + self.ay) + 2.0 * pi * self.r
+
+    def centroid(self):
+        return (self.cx, self.cy)
+
+    def shrunk(self, k):
+        '''
+        return the zone shrunk by a margin `k` on all sides (if k exceeds
+        the corner radius, the straight sides absorb the remainder)
+        '''
+        if k <= self.r:
+            return RoundedRectZone(self.ax, self.ay, self.r - k, self.cx, self.cy)
+        rem = k - self.r
+        return RoundedRectZone(max(self.ax - rem, 0.0), max(self.ay - rem, 0.0),
+                               0.0, self.cx, self.cy)
+
+    def to_dict(self):
+        return {'kind': self.kind, 'ax': self.ax, 'ay': self.ay, 'r': self.r,
+                'cx': self.cx, 'cy': self.cy}
+
+    def outline(self, n=64):
+        '''
+        boundary of the zone as a (k, 2) array (anticlockwise), with `n`
+        points around the full turn of the corners
+        '''
+        q = max(int(n) // 4, 1)
+        pts = []
+        for i, (sx, sy) in enumerate([(1, 1), (-1, 1), (-1, -1), (1, -1)]):
+            th = np.linspace(i * pi / 2, (i + 1) * pi / 2, q + 1)
+            pts.append(np.column_stack([
+                self.cx + sx * self.ax + self.r * np.cos(th),
+                self.cy + sy * self.ay + self.r * np.sin(th)]))
+        return np.concatenate(pts, axis=0)
+
+    def __str__(self):
+        return "RoundedRectZone: r={:.3f} about rect +/-({:.3f}, {:.3f}) at ({:.3f}, {:.3f})".format(
+            self.r, self.ax, self.ay, self.cx, self.cy)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def interior_zone(ax, ay, r, margin=0.0):
+    '''
+    construct the RoundedRectZone for an interior bounded by corner arcs of
+    (inner) radius `r` centred at (+/-ax, +/-ay), shrunk by `margin`.
+    Negative values (corners that overlap, or walls thicker than the corner
+    radius) are folded into the other dimensions so that the zone never
+    extends past the walls.
+    '''
+    if r < 0:
+        ax, ay, r = ax + r, ay + r, 0.0
+    if ax < 0:
+        r, ax = r + ax, 0.0
+    if ay < 0:
+        r, ay = r + ay, 0.0
+    return RoundedRectZone(max(ax, 0.0), max(ay, 0.0), max(r, 0.0)).shrunk(margin)
+
+def zone_from_dict(d):
+    ''' reconstruct a zone from the dictionary written by `to_dict` '''
+    if d is None:
+        return None
+    kind = d.get('kind')
+    if kind == RectZone.kind:
+        return RectZone(d['bl'], d['tr'])
+    elif kind == RoundedRectZone.kind:
+        return RoundedRectZone(d['ax'], d['ay'], d['r'],
+                               d.get('cx', 0.0), d.get('cy', 0.0))
+    raise ValueError("[E] unknown zone kind '{}'".format(kind))
+#}}}
+
+#{{{ frames
+def to_world(xy, trans, ctr=(0.0, 0.0)):
+    '''
+    map (N, 2) positions or (N, 3) poses from the arena frame to the world,
+    rotating about `ctr` (as gen_valid_bee_positions does) then translating.
+    '''
+    if trans is None:
+        return np.array(xy, dtype=float)
+    return trans.apply_to_array(xy, ctr=ctr)
+
+def to_local(xy, trans, ctr=(0.0, 0.0)):
+    ''' inverse of `to_world` '''
+    xy = np.array(xy, dtype=float)
+    if trans is None:
+        return xy
+    xy[..., 0] -= trans.dx
+    xy[..., 1] -= trans.dy
+    return Transformation(theta=-trans.theta).apply_to_array(xy, ctr=ctr)
+#}}}
+
+#{{{ sampling
+def sample_in_zone(zone, n, rng=None, theta_rng=(0, 2*pi), max_rounds=100):
+    '''
+    draw `n` poses (x, y, yaw), uniformly within `zone` (in the zone's
+    frame), by batched rejection sampling: oversized blocks of candidates
+    are drawn from the bounding box and filtered in one pass, until enough
+    are accepted.
+
+    `rng` is a numpy RandomState/Generator (default: the numpy global RNG).
+    Returns an (n, 3) array.
+    '''
+    if rng is None:
+        rng = np.random
+    n = int(n)
+    out = np.empty((n, 3))
+    if n == 0:
+        return out
+    (x0, y0), (x1, y1) = zone.bbox()
+    got = 0
+    p_acc = 1.0 # running estimate of the acceptance rate
+    for _ in xrange(max_rounds):
+        need = n - got
+        m = int(need / max(p_acc, 1e-3) * 1.2) + 16
+        xy = np.empty((m, 2))
+        xy[:, 0] = rng.uniform(x0, x1, m)
+        xy[:, 1] = rng.uniform(y0, y1, m)
+        ok = xy[zone.contains(xy)]
+        p_acc = max(len(ok), 1) / float(m)
+        k = min(len(ok), need)
+        out[got:got+k, :2] = ok[:k]
+        got += k
+        if got >= n:
+            break
+    else:
+        raise RuntimeError("[E] could not sample {} positions in zone {}".format(n, zone))
+
+    out[:, 2] = rng.uniform(theta_rng[0], theta_rng[1], n)
+    return out
+#}}}
@@ -8,6 +8,7 @@ composite arena with barrier.
 
 from assisipy import sim
 from assisipy_utils import arena
+from assisipy_utils.arena.scene import Scene
 
 
 if __name__ == '__main__':
@@ -30,9 +31,13 @@ if __name__ == '__main__':
     c1 = "casu-001", (-9, +4.5, yaw)
     c3 = "casu-003", (+9, +4.5, yaw)
 
-    # spawn each of the CASU objects
+    # collect the arenas and CASUs, and check the layout before spawning
+    S = Scene()
+    S.add_arena(A)
+    S.add_arena(A2)
     for cname, cpos in [c5, c4, c2, c1, c3]:
-        simctrl.spawn('Casu', cname, cpos)
+        S.add_casu(cname, cpos)
+    for a, b in S.overlaps():
+        print "[W] {} overlaps {}".format(a, b)
 
-    A.spawn(simctrl)
-    A2.spawn(simctrl)
+    S.spawn_all(simctrl)
@@ -26,8 +26,11 @@ if __name__ == '__main__':
     T2= arena.Transformation(dx=8.75, dy=-4.75)
     A2.transform(T2)
 
-    rendering.render_arena(A.segs, ax=ax, fc='0.5')
-    rendering.render_arena(A2.segs, ax=ax, fc='r')
+    # all wall segments of both arenas are drawn as a single collection
+    R = rendering.ArenaRenderer(ax)
+    R.add_arena(A, fc='0.5', zone=True)
+    R.add_arena(A2, fc='r')
+    R.draw()
 
     yaw = pi
     casu_poses = []
@@ -38,7 +41,7 @@ if __name__ == '__main__':
     # special setup, with only 5 - remove the last one
     del casu_poses[4]
 
-    rendering.render_CASUs(casu_poses, ax=ax)
+    R.set_casus(casu_poses)
 
 
     ax.set_xlim(-20, +20)
@@ -37,9 +37,9 @@ if __name__ == '__main__':
     c1 = "casu-001", (9, -9, yaw)
 
 
-    # spawn each of the CASU objects
-    for cname, cpos in [c6, c3, c4, c1]:
-        simctrl.spawn('Casu', cname, cpos)
+    # collect all of the objects, to spawn them in one burst
+    batch = arena.SpawnBatch()
+    batch.add_casus([c6, c3, c4, c1])
 
     # define an arena wall object
     Al = arena.StadiumArena(ww=0.5, label_stub='arena-63')
@@ -49,9 +49,12 @@ if __name__ == '__main__':
     # (centre of 4/1)
     Tr = arena.Transformation(dx=+9.0, dy=-4.5, theta=pi/2.0)
     Al.transform(Tl)
-    Al.spawn(simctrl)
+    batch.add_arena(Al)
     Ar.transform(Tr)
     # since we didnt#
-    Ar.spawn(simctrl, )#offset=100)
+    batch.add_arena(Ar, )#offset=100)
+
+    report = batch.send(simctrl)
+    print report
 
     pass
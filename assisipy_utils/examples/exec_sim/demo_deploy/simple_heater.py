@@ -6,6 +6,7 @@
 
 from assisipy import casu
 import argparse
+import sys
 import time
 
 
@@ -24,6 +25,9 @@ if __name__ == '__main__':
         c.set_temp(args.temp)
         r = (args.temp - 25.0) / (45.0 - 25.0)
         c.set_diagnostic_led_rgb(r=r, g=0.1, b=0.1)
+    # (exec_sim_timed moves on once this appears; see calib_ready_marker)
+    print "[I] {} calibrated".format(args.rtc)
+    sys.stdout.flush()
 
     # wait until interrupt
     try:
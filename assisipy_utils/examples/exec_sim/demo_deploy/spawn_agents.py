@@ -22,9 +22,17 @@ if __name__ == '__main__':
     parser.add_argument('-l', '--label', type=str, default='popln1-')
     parser.add_argument('-e', '--exec-script', type=str, required=True,
                         help='name of script to execute for each bee in `bee-file`')
+    parser.add_argument('-s', '--min-sep', type=float, default=None,
+                        help='minimum separation between bees (e.g. bee length)')
+    parser.add_argument('-c', '--casu-file', type=str, default=None,
+                        help='deployment .arena file; bees are kept clear of its CASUs')
+    parser.add_argument('-pa', '--pub-addr', type=str, default='tcp://localhost:5556',
+                        help='publish address (where the simulator listens for commands)')
+    parser.add_argument('-sa', '--sub-addr', type=str, default='tcp://localhost:5555',
+                        help='subscribe address (where the simulator emits)')
     args = parser.parse_args()
 
-    simctrl = sim.Control()
+    simctrl = sim.Control(pub_addr=args.pub_addr, sub_addr=args.sub_addr)
 
     obj_file = None
     if args.obj_listing is not None:
@@ -33,11 +41,22 @@ if __name__ == '__main__':
 
     # find out where the bees can go
     bl, tr, trans =arena.read_reqs(args.arena_file)
-    bee_poses = arena.gen_valid_bee_positions((bl, tr), n=args.num_bees, trans=trans)
+    zone = arena.read_zone(args.arena_file)
+    seed = arena.read_seed(args.arena_file) # same poses on every re-run
+    excl = None
+    if args.casu_file is not None:
+        excl = arena.casu_exclusions(args.casu_file, radius=2.0)
+    # when run by exec_sim_timed, populations are spawned concurrently and
+    # share an occupancy map (None otherwise)
+    occ = arena.SharedOccupancyMap.from_env()
+    bee_poses = arena.gen_population((bl, tr), args.num_bees, args.label,
+                                     seed=seed, trans=trans, zone=zone,
+                                     min_sep=args.min_sep, exclusions=excl,
+                                     occupancy=occ)
 
     if args.num_bees > 0:
-        for i, pts in enumerate(bee_poses):
-            pose = pts[0].x, pts[0].y, pts[1]
+        batch = arena.SpawnBatch()
+        for i, pose in enumerate(map(tuple, bee_poses.tolist())):
         #for i in range(1, args.num_bees+1):
             name = '{}-Bee-{:03d}'.format(args.label, i)
             if i < args.num_bees / 2:
@@ -48,17 +67,18 @@ if __name__ == '__main__':
             #pose = (random.uniform(-4, 4), random.uniform(-4, 4),
             #        2*pi*random.random())
 
-            simctrl.spawn('Bee', name, pose)
-            print 'Spawned bee', name
+            batch.add('Bee', name, pose)
             if obj_file:
                 s = specs.gen_spec_str(name, 'Bee', pose,
                                        args.exec_script, conf,
-                                       'tcp://localhost:5556',
-                                       'tcp://localhost:5555',
+                                       args.pub_addr,
+                                       args.sub_addr,
                                        )
 
                 obj_file.write(s + "\n")
 
+        # spawn the whole population in one burst
+        batch.send(simctrl, verb=True)
 
     if obj_file:
         obj_file.close()
@@ -9,6 +9,7 @@ A simple example of assisilib usage, spawning two oval arenas
 
 from assisipy import sim
 from assisipy_utils import arena
+from assisipy_utils.arena.cache import cached_arena
 import argparse
 
 from numpy import deg2rad
@@ -20,6 +21,12 @@ if __name__ == '__main__':
     parser.add_argument('-t', '--theta_deg', type=float, default=0.0)
     parser.add_argument('-l', '--label', type=str, default='popln1-')
     parser.add_argument('-o', '--output', type=str, default='valid.arena')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the populations (default: fresh)')
+    parser.add_argument('-pa', '--pub-addr', type=str, default='tcp://localhost:5556',
+                        help='publish address (where the simulator listens for commands)')
+    parser.add_argument('-sa', '--sub-addr', type=str, default='tcp://localhost:5555',
+                        help='subscribe address (where the simulator emits)')
     args = parser.parse_args()
 
     # in the 9-CASU arena of V3 casus, the centres are 9cm apart, centred at 5
@@ -31,16 +38,20 @@ if __name__ == '__main__':
     #
 
     # define an arena wall object
-    A = arena.StadiumArena(ww=0.5, label_stub=args.label+"-arena")
+    # (geometry is reused across runs if ASSISI_ARENA_CACHE names a directory)
+    A = cached_arena(arena.StadiumArena, ww=0.5, label_stub=args.label+"-arena")
     T = arena.Transformation(dx=args.x, dy=args.y, theta=float(deg2rad(args.theta_deg)))
     A.transform(T)
     posns_to_write = [x for sublist in A.get_valid_zone() for x in sublist]
 
-    A.write_bounds_spec(args.output)
+    seed = args.seed if args.seed is not None else arena.new_seed()
+    A.write_bounds_spec(args.output, seed=seed)
 
     print "[I] wrote specification to {}".format(args.output)
 
-    # now we have a definition, we can spawn the wall segments
-    simctrl = sim.Control()
-    A.spawn(simctrl)
+    # now we have a definition, we can spawn the wall segments (in one burst)
+    simctrl = sim.Control(pub_addr=args.pub_addr, sub_addr=args.sub_addr)
+    batch = arena.SpawnBatch()
+    batch.add_arena(A)
+    print "[I] walls: {}".format(batch.send(simctrl))
 
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Run a campaign of repeats of one simulation configuration concurrently.
+
+Each repeat is a separate `exec_sim_timed` process, with its own playground
+on a pair of freshly allocated pub/sub ports; these are passed on with
+`--sim-host`, so the playground, sim.py, the spawners and the object
+listings all use them (as for SIM_HOST in the config).  At most `workers`
+repeats run at once, and the rest are queued.
+
+A repeat whose logdir holds the completion marker written by exec_sim_timed
+is skipped, so an interrupted campaign resumes by running the same command
+again; an incomplete logdir is overwritten.
+
+With `warm` > 1, each process runs up to `warm` consecutive repeats in one
+playground (exec_sim_timed --warm-reps), resetting only the agents between
+them.
+
+The output of each repeat, and a summary (ports, exit status, duration),
+go to `<logbase>/<project>-<label>_campaign/`.
+
+Example usage:
+
+    assisi_campaign -c demo.conf -l sim_ -r 0 20 -j 4
+
+The CASU controllers take their simulator addresses from the deployment
+(.arena file), not from `--sim-host`. So if any CASU in the deployment has
+a controller, each process gets its own copy of the deployment directory,
+next to the original (so that relative paths out of it still resolve), in
+which the .arena file gives the CASUs the ports of its playground, and a
+fresh message port each; it is passed on with `--deploy-dir`, and removed
+when the process finishes.
+
+Rob Mills - BioISI, FCUL & ASSISIbf
+
+'''
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+import yaml
+
+import mgmt_utils as utils
+from exec_sim_timed import COMPLETE_MARKER, logdir_for
+from probes import parse_tcp_addr
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_TOOL = 'exec_sim_timed'
+
+
+#{{{ ports
+def free_ports(n, host=DEFAULT_HOST):
+    '''
+    `n` distinct TCP ports that are free on `host`, as assigned by the OS
+    (all are bound at once, so they differ, and then released)
+    '''
+    socks = []
+    try:
+        for i in xrange(n):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind((host, 0))
+            socks.append(sock)
+        return [s.getsockname()[1] for s in socks]
+    finally:
+        for s in socks:
+            s.close()
+
+class PortAllocator(object):
+    '''
+    hands out pairs of free ports, never giving out a port that is held by
+    a repeat still running (its playground may not have bound it yet)
+    '''
+    def __init__(self, host=DEFAULT_HOST):
+        self.host = host
+        self.held = set()
+
+    def allocate(self, n=2, attempts=20):
+        for i in xrange(attempts):
+            ports = free_ports(n, self.host)
+            if not self.held.intersection(ports):
+                self.held.update(ports)
+                return ports
+        raise RuntimeError("[E] could not allocate {} free ports on {}".format(n, self.host))
+
+    def release(self, ports):
+        self.held.difference_update(ports)
+#}}}
+
+#{{{ deployment
+def load_deployment(config, project_root):
+    '''
+    the project file of the deployment, and its .dep and .arena files
+    (None if the project does not name them)
+    '''
+    depdir = os.path.join(project_root, config['DEPLOY_DIR'])
+    with open(os.path.join(depdir, config['PRJ_FILE'])) as f:
+        project = yaml.safe_load(f)
+    dep = arena = None
+    if project.get('dep') is not None:
+        with open(os.path.join(depdir, project['dep'])) as f:
+            dep = yaml.safe_load(f) or {}
+    if project.get('arena') is not None:
+        with open(os.path.join(depdir, project['arena'])) as f:
+            arena = yaml.safe_load(f) or {}
+    return project, dep, arena
+
+def casu_sim_addrs(config, project_root):
+    '''
+    the simulator addresses that the CASU controllers of the deployment
+    connect to: a set of (host, pub_port, sub_port), as for --sim-host
+    (the simulator publishes where the CASUs subscribe). Empty if no CASU
+    has a controller.
+    '''
+    project, dep, arena = load_deployment(config, project_root)
+    if dep is None or arena is None:
+        return set()
+
+    addrs = set()
+    for layer, casus in dep.items():
+        for name, spec in (casus or {}).items():
+            if not (spec or {}).get('controller'):
+                continue
+            c = arena.get(layer, {}).get(name, {})
+            if 'sub_addr' not in c or 'pub_addr' not in c:
+                continue
+            host, pp = parse_tcp_addr(c['sub_addr'])
+            _, sp = parse_tcp_addr(c['pub_addr'])
+            addrs.add((host, pp, sp))
+    return addrs
+
+def n_msg_addrs(config, project_root):
+    ''' the number of CASUs in the .arena file with a message address '''
+    project, dep, arena = load_deployment(config, project_root)
+    return sum(1 for casus in (arena or {}).values()
+               for c in (casus or {}).values() if 'msg_addr' in (c or {}))
+
+def copy_deployment(config, project_root, dst, host, ports):
+    '''
+    copy the deployment directory to `dst` (without deploy sandboxes), with
+    the CASUs of the .arena file connecting to the simulator on `host` at
+    `ports[0]` (its pub port) and `ports[1]` (its sub port), and listening
+    for messages on the remaining `ports`, in turn
+    '''
+    depdir = os.path.join(project_root, config['DEPLOY_DIR'])
+    if os.path.exists(dst): # left by an interrupted run
+        shutil.rmtree(dst)
+    shutil.copytree(depdir, dst, ignore=shutil.ignore_patterns(
+        '*_sandbox', '.deploy.lock', '*.pyc', '__pycache__'))
+
+    project, dep, arena = load_deployment(config, project_root)
+    if arena is None:
+        return
+    msg_ports = iter(ports[2:])
+    for layer in sorted(arena):
+        for name in sorted(arena[layer] or {}):
+            c = arena[layer][name] or {}
+            if 'sub_addr' in c:
+                c['sub_addr'] = "tcp://{}:{}".format(host, ports[0])
+            if 'pub_addr' in c:
+                c['pub_addr'] = "tcp://{}:{}".format(host, ports[1])
+            if 'msg_addr' in c:
+                _host, _ = parse_tcp_addr(c['msg_addr'])
+                c['msg_addr'] = "tcp://{}:{}".format(_host, next(msg_ports))
+    with open(os.path.join(dst, project['arena']), 'w') as f:
+        yaml.safe_dump(arena, f, default_flow_style=False)
+#}}}
+
+#{{{ campaign
+def is_complete(logdir):
+    return os.path.isfile(os.path.join(logdir, COMPLETE_MARKER))
+
+class Campaign(object):
+    '''
+    repeats `reps` of the run defined by `conf_file`, labelled `label`,
+    at most `workers` at a time (default: one per CPU)
+    '''
+    def __init__(self, conf_file, label, reps, workers=None, host=None,
+                 tool=DEFAULT_TOOL, extra_args=(), warm=1):
+        self.conf_file = os.path.abspath(os.path.expanduser(conf_file))
+        self.label = label
+        self.reps = list(reps)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.tool = tool
+        self.extra_args = list(extra_args)
+        self.warm = max(int(warm), 1)
+
+        with open(self.conf_file) as f:
+            self.config = yaml.safe_load(f)
+        if host is None:
+            host = (self.config.get('SIM_HOST') or {}).get('addr', DEFAULT_HOST)
+        self.ports = PortAllocator(host)
+
+        # CASU controllers connect to the addresses in the deployment, so
+        # each process gets a copy of it, re-addressed to its own ports
+        self.project_root = os.path.dirname(self.conf_file)
+        self.own_deployment = bool(casu_sim_addrs(self.config, self.project_root))
+        self.n_msg = 0
+        if self.own_deployment:
+            self.n_msg = n_msg_addrs(self.config, self.project_root)
+
+        _cd = "{}-{}_campaign".format(self.config['PRJ_FILE'].split('.')[0], label)
+        self.campaign_dir = os.path.join(
+            os.path.expanduser(self.config['logbase']), _cd)
+        self.results = {} # rpt -> dict
+
+    def disp_msg(self, msg, level='I'):
+        now = datetime.datetime.now()
+        print "#[{}] {} > {}".format(level, now.strftime("%H:%M:%S"), msg)
+        sys.stdout.flush()
+
+    def pending(self):
+        ''' the repeats without a complete logdir '''
+        return [r for r in self.reps
+                if not is_complete(logdir_for(self.config, self.label, r))]
+
+    def jobs(self, pending):
+        ''' split the `pending` repeats into runs of up to `warm` consecutive ones '''
+        J = []
+        for r in pending:
+            if J and r == J[-1][-1] + 1 and len(J[-1]) < self.warm:
+                J[-1].append(r)
+            else:
+                J.append([r])
+        return J
+
+    def _deploy_dir(self, reps):
+        ''' the copy of the deployment directory for the process running `reps` '''
+        depdir = os.path.normpath(os.path.join(self.project_root, self.config['DEPLOY_DIR']))
+        return "{}.{}rpt{}".format(depdir, self.label, reps[0])
+
+    def _command(self, reps, ports):
+        cmd = [self.tool, '-c', self.conf_file, '-l', self.label,
+               '-r', str(reps[0]),
+               '--sim-host', "{}:{}:{}".format(self.ports.host, ports[0], ports[1])]
+        if self.own_deployment:
+            cmd += ['--deploy-dir', self._deploy_dir(reps)]
+        if len(reps) > 1:
+            cmd += ['--warm-reps', str(len(reps))]
+        if any(os.path.exists(logdir_for(self.config, self.label, r)) for r in reps):
+            cmd.append('--allow-overwrite') # left by an interrupted run
+        return cmd + self.extra_args
+
+    def _start(self, reps):
+        ports = self.ports.allocate(2 + self.n_msg)
+        if self.own_deployment:
+            copy_deployment(self.config, self.project_root, self._deploy_dir(reps),
+                            self.ports.host, ports)
+        cmd = self._command(reps, ports)
+        outf = open(os.path.join(self.campaign_dir, "rpt{}.log".format(reps[0])), 'w')
+        self.disp_msg("rpt {} on ports {}: {}".format(
+            ",".join(str(r) for r in reps), ports[:2], " ".join(cmd)))
+        # (in their own session: ctrl-c is forwarded once, by `run`)
+        p = subprocess.Popen(cmd, stdout=outf, stderr=subprocess.STDOUT,
+                             close_fds=True, preexec_fn=os.setsid)
+        return {'proc': p, 'ports': ports, 'outf': outf, 'start': time.time()}
+
+    def _finish(self, reps, job, rc):
+        job['outf'].close()
+        self.ports.release(job['ports'])
+        if self.own_deployment: # (archived by the run, if selected)
+            shutil.rmtree(self._deploy_dir(reps), ignore_errors=True)
+        for rpt in reps:
+            complete = is_complete(logdir_for(self.config, self.label, rpt))
+            self.results[rpt] = {
+                'pub_port' : job['ports'][0], 'sub_port' : job['ports'][1],
+                'returncode' : rc, 'complete' : complete, 'first_rpt' : reps[0],
+                'duration_s' : round(time.time() - job['start'], 2),
+            }
+            level = 'I' if complete else 'W'
+            self.disp_msg("rpt {} finished ({}), exit status {}".format(
+                rpt, "complete" if complete else "incomplete", rc), level=level)
+
+    def write_summary(self):
+        _fn = os.path.join(self.campaign_dir, 'campaign.yaml')
+        with open(_fn, 'w') as f:
+            yaml.safe_dump({'conf': self.conf_file, 'label': self.label,
+                            'reps': self.reps, 'results': self.results},
+                           f, default_flow_style=False)
+
+    def run(self, poll=0.5):
+        '''
+        run all pending repeats; blocks until all are finished, and returns
+        the list of those that did not complete. On ctrl-c, the running
+        repeats shut down (and remain incomplete).
+        '''
+        utils.mkdir_p(self.campaign_dir)
+        _fn = os.path.join(self.campaign_dir, 'campaign.yaml')
+        if os.path.isfile(_fn): # keep the results of an earlier (resumed) run
+            with open(_fn) as f:
+                self.results.update((yaml.safe_load(f) or {}).get('results') or {})
+        pending = self.pending()
+        skipped = len(self.reps) - len(pending)
+        if skipped:
+            self.disp_msg("skipping {} completed repeats".format(skipped))
+        queue = self.jobs(pending)
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(running) < self.workers:
+                    reps = tuple(queue.pop(0))
+                    running[reps] = self._start(reps)
+                for reps, job in running.items():
+                    rc = job['proc'].poll()
+                    if rc is not None:
+                        self._finish(reps, job, rc)
+                        del running[reps]
+                time.sleep(poll)
+        except KeyboardInterrupt:
+            self.disp_msg("campaign interrupted -- waiting for {} running repeats".format(
+                len(running)), level='W')
+            for reps, job in running.items():
+                if job['proc'].poll() is None:
+                    try:
+                        job['proc'].send_signal(signal.SIGINT)
+                    except OSError:
+                        pass
+            for reps, job in running.items():
+                self._finish(reps, job, job['proc'].wait())
+        finally:
+            self.write_summary()
+        return self.pending()
+#}}}
+
+def main():
+    parser = argparse.ArgumentParser(description=
+        'run repeats of a simulation concurrently, each with its own playground')
+    parser.add_argument('-c', '--conf', type=str, required=True)
+    parser.add_argument('-l', '--label', type=str, default='sim_')
+    parser.add_argument('-r', '--reps', type=int, nargs=2, required=True,
+                        metavar=('FIRST', 'LAST'), help='range of repeats (inclusive)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='repeats run at once (default: number of CPUs)')
+    parser.add_argument('--host', type=str, default=None,
+                        help='address for the playgrounds (default: SIM_HOST addr, or {})'.format(DEFAULT_HOST))
+    parser.add_argument('-w', '--warm', type=int, default=1,
+                        help='repeats run in turn in one playground (default 1: a new playground each)')
+    parser.add_argument('--tool', type=str, default=DEFAULT_TOOL)
+    parser.add_argument('--verb', type=int, default=0)
+    args = parser.parse_args()
+
+    C = Campaign(args.conf, args.label, xrange(args.reps[0], args.reps[1] + 1),
+                 workers=args.workers, host=args.host, tool=args.tool,
+                 extra_args=['--verb', str(args.verb)] if args.verb else [],
+                 warm=args.warm)
+    incomplete = C.run()
+    if incomplete:
+        C.disp_msg("{} repeats incomplete: {}".format(len(incomplete), incomplete), level='W')
+        sys.exit(1)
+    C.disp_msg("all {} repeats complete; results in {}".format(
+        len(C.reps), os.path.expanduser(C.config['logbase'])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Streaming capture of the output of a stage's subprocess.
+
+Reading a subprocess's stdout/stderr only when it has finished (`wait` then
+`communicate`) holds all of it in memory, and deadlocks once a pipe buffer
+fills up.  A StageCapture instead drains both pipes as output arrives (in
+a background thread, with `select` and non-blocking reads), writing each
+line, with a timestamp, to the stage logs `<stage>.<pid>.stdout` and
+`<stage>.<pid>.stderr`.  The stderr entries (runs of lines separated by
+blank lines, as counted by mgmt_utils.chunk_text_by_blankline) and any
+mention of an error are counted as they arrive, so nothing is buffered
+beyond a partial line.  The stderr log is only created if there is
+output.
+
+Example usage:
+
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         shell=True)
+    cap = StageCapture(p, stagelogdir, 'deploy')
+    rc = cap.join()
+    print cap.summary()
+
+Rob Mills - BioISI, FCUL & ASSISIbf
+
+'''
+
+import datetime
+import errno
+import fcntl
+import os
+import select
+import threading
+
+CHUNK = 65536
+
+
+def _stamp():
+    return datetime.datetime.now().strftime("%H:%M:%S.%f")[:-3]
+
+class _Stream(object):
+    ''' one pipe, split into lines and written to a (lazily opened) file '''
+    def __init__(self, pipe, fname, eager=False, on_line=None):
+        self.pipe = pipe
+        self.fd = pipe.fileno()
+        fl = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+        self.fname = fname
+        self.f = open(fname, 'w') if eager else None
+        self.on_line = on_line
+        self.partial = ''
+        self.n_lines = 0
+
+    def _write(self, line):
+        if self.f is None:
+            self.f = open(self.fname, 'w')
+        # (blank lines are kept blank: they separate entries)
+        self.f.write("{} {}\n".format(_stamp(), line) if line else "\n")
+        self.n_lines += 1
+        if self.on_line is not None:
+            self.on_line(line)
+
+    def feed(self, data):
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self._write(line)
+        if self.f is not None:
+            self.f.flush()
+
+    def close(self):
+        if self.partial:
+            self._write(self.partial)
+            self.partial = ''
+        if self.f is not None:
+            self.f.close()
+        self.pipe.close()
+
+class StageCapture(object):
+    '''
+    capture the stdout and stderr (both subprocess.PIPE) of `proc` into
+    files in `stagelogdir`, named `<stem>.stdout`/`.stderr` with `stem`
+    defaulting to `<stagename>.<pid>`. `echo(stagename, line)`, if given,
+    is called for each line of stderr.
+    '''
+    def __init__(self, proc, stagelogdir, stagename, stem=None, echo=None):
+        self.proc = proc
+        self.stagename = stagename
+        if stem is None:
+            stem = "{}.{}".format(stagename, proc.pid)
+        self.n_entries = 0 # runs of non-blank lines in stderr
+        self.has_error = False
+        self._in_entry = False
+        self.echo = echo
+        self.out = _Stream(proc.stdout, os.path.join(stagelogdir, stem + '.stdout'),
+                           eager=True)
+        self.err = _Stream(proc.stderr, os.path.join(stagelogdir, stem + '.stderr'),
+                           on_line=self._count)
+        self.returncode = None
+        self._thread = threading.Thread(target=self._pump,
+                                        name="capture-{}".format(stagename))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _count(self, line):
+        if len(line) == 0:
+            self._in_entry = False
+            return
+        if not self._in_entry:
+            self.n_entries += 1
+            self._in_entry = True
+        if not self.has_error and "error" in line.lower():
+            self.has_error = True
+        if self.echo is not None:
+            self.echo(self.stagename, line)
+
+    def _pump(self):
+        streams = {self.out.fd: self.out, self.err.fd: self.err}
+        try:
+            while streams:
+                try:
+                    ready, _, _ = select.select(list(streams), [], [])
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                for fd in ready:
+                    try:
+                        data = os.read(fd, CHUNK)
+                    except OSError as e:
+                        if e.errno in (errno.EAGAIN, errno.EINTR):
+                            continue
+                        raise
+                    if data:
+                        streams[fd].feed(data)
+                    else: # EOF
+                        del streams[fd]
+        finally:
+            self.out.close()
+            self.err.close()
+
+    def join(self):
+        ''' wait for all output and the process to finish; returns its exit status '''
+        while self._thread.is_alive():
+            self._thread.join(0.5) # (a timeout, so ctrl-c is delivered)
+        self.returncode = self.proc.wait()
+        return self.returncode
+
+    @property
+    def level(self):
+        return 'E' if self.has_error else 'W'
+
+    def summary(self):
+        return "{} warning/error entries in '{}' stage".format(
+            self.n_entries, self.stagename)
@@ -28,8 +28,14 @@ Major parts of code following Aug 2015 setup
 import yaml, os, argparse, sys
 import shutil
 import subprocess, signal
+import fcntl
 import datetime, time
+import threading
 import mgmt_utils as utils
+import probes
+import stages
+import supervisor
+import capture
 
 from assisipy_utils import tool_version
 
@@ -52,6 +58,20 @@ SEVERITY = {
     'E' : _C_ERR,
 }
 
+# default simulator addresses (when SIM_HOST is not given in the config)
+DEFAULT_SIM_ADDRS = ('tcp://localhost:5555', 'tcp://localhost:5556')
+
+# what to do when a persistent process exits during the run (see
+# supervisor.py); overridden by `supervise` in the config
+DEFAULT_POLICIES = {
+    'simulator' : 'abort',
+    'casus'     : 'continue',
+    'handlers'  : 'continue',
+}
+
+# written into the logdir once a run has finished (see campaign.py)
+COMPLETE_MARKER = 'run_complete'
+
 # checks
 CHECK_FAILED_FATAL = 1
 CHECK_FAILED_WARN  = 3
@@ -78,9 +98,19 @@ class FakeProc(object):
         pass
     def wait(self):
         pass
+    def poll(self):
+        return None
+    def communicate(self):
+        return "", ""
 
 def wrapped_subproc(do=True, *args, **kwargs):
-    ''' either call subprocess, or ignore (with warning msg) if do is false'''
+    '''
+    either call subprocess, or ignore (with warning msg) if do is false.
+    By default the child does not inherit other open files: stages run
+    concurrently, and a long-lived child that held the pipes of another
+    stage's subprocess would block that stage's `communicate`.
+    '''
+    kwargs.setdefault('close_fds', True)
     if do:
         p1 = subprocess.Popen(*args, **kwargs)
     else:
@@ -126,6 +156,21 @@ def check_files_exist(file_dict, report=False):
 
     return e
 
+def logdir_for(config, label, rpt):
+    ''' the logdir of repeat `rpt` of a run labelled `label` '''
+    _ld = "{}-{}_rpt{}".format(
+            config['PRJ_FILE'].split('.')[0], label, rpt)
+    logbase = os.path.expanduser(config['logbase'])
+    return os.path.join(logbase, _ld)
+
+def parse_sim_host(spec):
+    ''' split 'addr:pub:sub' into a SIM_HOST dict '''
+    try:
+        addr, pp, sp = spec.rsplit(':', 2)
+        return {'addr': addr, 'pub': int(pp), 'sub': int(sp)}
+    except ValueError:
+        raise ValueError("[F] sim host should be addr:pub_port:sub_port, not '{}'".format(spec))
+
 def chunker(seq, size):
     '''
     return an iterator over the sequence with `size` elements in each slice
@@ -149,14 +194,19 @@ class SimHandler(object):
         '''
 
         self.initialised_ok = False
+        # output from stages running concurrently
+        self._io_lock = threading.RLock()
         # store params
         self.label = label
-        self.conf_file   = conf_file
+        # (absolute, since the wd changes before later repeats archive it)
+        self.conf_file   = os.path.abspath(conf_file)
         self.rpt         = rpt
         self.expt_type   = "simulation"
         self.allow_overwrite = kwargs.get('allow_overwrite', False)
         self.dry_run = kwargs.get('dry_run', False)
         self.verb    = kwargs.get('verb', 0)
+        self._sim_host = kwargs.get('sim_host', None) # overrides SIM_HOST
+        self._deploy_dir = kwargs.get('deploy_dir', None) # overrides DEPLOY_DIR
         self._ignore_precheck_errors = kwargs.get('ignore_precheck', False)
 
         self._deployed = False
@@ -170,12 +220,24 @@ class SimHandler(object):
         for key in ['agents',] :
             v = self.config.get(key, {})
             if v is None: self.config[key] = {}
+        if self._deploy_dir is not None:
+            # (relative to the project root, or absolute)
+            self.config['DEPLOY_DIR'] = self._deploy_dir
 
         # extract additional config requirements, with defaults
         self.pg_cfg_file = self.config.get('playground_config', None)
         #self.pg_cfg_file = self.config.get('playground_config', 'config/Playground.cfg')
         self.sim_sec = int(float(self.config['simulation_runtime_mins']) * 60.)
         self.calib_timeout = int(self.config.get("calib_timeout", 20))
+        # readiness: stages proceed as soon as these are seen (see probes.py)
+        self.sim_ready_timeout = float(self.config.get("sim_ready_timeout", 10.0))
+        self.calib_ready_marker = self.config.get("calib_ready_marker", None)
+        self.calib_ready_file   = self.config.get("calib_ready_file", None)
+        # supervision of the persistent processes while the simulation runs
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(self.config.get("supervise", None) or {})
+        self.max_restarts = int(self.config.get("supervise_max_restarts", 3))
+        self.progress_interval = float(self.config.get("progress_interval", 30.0))
 
         # user scripts -- if not defined in conf file, this section will be skipped
         self.TOOL_EXEC_AGENTS = self.config.get("tool_exec_agents", None)
@@ -186,6 +248,7 @@ class SimHandler(object):
         self.TOOL_CASU_SPAWN   = "sim.py"
         self.TOOL_DEPLOY       = self.config.get("DEPLOY_TOOL", "deploy.py")
         self.TOOL_COLLECT_LOGS = self.config.get("COLLECT_LOG_TOOL", "collect_data.py")
+        self.TOOL_RESET_POP    = self.config.get("RESET_POP_TOOL", "reset_simpop")
 
 
         self.ARCHIVE_BEHAV_SCRIPT = True
@@ -236,6 +299,11 @@ class SimHandler(object):
         # variables
         self.p_handles = []
         self.f_handles = []
+        self._persistent = set() # handles kept across warm repeats
+        self._pid_files = {}
+        self._proc_names = {} # handle -> name, for the supervisor
+        self._failed_spawns = {} # spawn stage -> non-zero exit status
+        self._occupancy_env = None
         self.coll_log_f_err = None
         self.coll_log_f_out = None
         self.cll_wd = None
@@ -258,6 +326,8 @@ class SimHandler(object):
         self.CUSTOM_ADDRS = False
         self.custom_subaddr = None
         self.custom_pubaddr = None
+        if self._sim_host is not None:
+            self.config['SIM_HOST'] = dict(self._sim_host)
         if "SIM_HOST" in self.config:
             ip = self.config['SIM_HOST'].get('addr')
             sp = self.config['SIM_HOST'].get('sub')
@@ -291,6 +361,33 @@ class SimHandler(object):
 
     #}}}
 
+    #{{{ readiness
+    def _sim_probes(self):
+        ''' TCP probes on the simulator pub/sub addresses '''
+        if self.CUSTOM_ADDRS:
+            addrs = (self.custom_pubaddr, self.custom_subaddr)
+        else:
+            addrs = DEFAULT_SIM_ADDRS
+        return [probes.TcpProbe(a, timeout=self.sim_ready_timeout) for a in addrs]
+
+    def wait_ready(self, _probes, what):
+        '''
+        block until all `_probes` are ready (or timed out); a timeout is
+        reported, but the run continues as it would have after a fixed wait.
+        '''
+        if not DO_TEST:
+            return None
+        self.disp_cmd_to_exec("wait for {}: {}".format(
+            what, ", ".join(p.name for p in _probes)))
+        rpt = probes.wait_ready(_probes)
+        if rpt.ok:
+            self.disp_msg("{} ready after {:.2f}s".format(what, rpt.elapsed))
+        else:
+            self.disp_msg("{} not ready after {:.2f}s (waiting on {})".format(
+                what, rpt.elapsed, ", ".join(rpt.pending)), level='W')
+        return rpt
+    #}}}
+
     #{{{ process management
     def get_pids(self):
         '''
@@ -301,11 +398,7 @@ class SimHandler(object):
         return pids
 
     def _check_and_mk_logdir(self):
-        _ld = "{}-{}_rpt{}".format(
-                self.config['PRJ_FILE'].split('.')[0],
-                self.label, self.rpt)
-        logbase = os.path.expanduser(self.config['logbase'])
-        logdir = os.path.join(logbase, _ld)
+        logdir = logdir_for(self.config, self.label, self.rpt)
         #logdir = os.path.join(self.config['logbase'], _ld)
 
         if os.path.exists(logdir):
@@ -370,6 +463,7 @@ class SimHandler(object):
         now_str = now_str.replace(' ','-').replace(':','-')
         with open(fn, 'w') as f:
             f.write("{}".format(now_str))
+        self._pid_files[p1.pid] = fn # (the procdir changes in warm repeats)
 
         f.close()
 
@@ -377,7 +471,7 @@ class SimHandler(object):
         '''
         when we close a process, remove the pid file
         '''
-        fn = os.path.join(self.procdir, "{}".format(p1.pid))
+        fn = self._pid_files.pop(p1.pid, os.path.join(self.procdir, "{}".format(p1.pid)))
         if os.path.exists(fn):
             os.remove(fn)
             self.disp_msg("removed PID file {}".format(p1.pid))
@@ -393,7 +487,7 @@ class SimHandler(object):
         self.disp_msg('Currently active processes are: {}'.format(_s_p))
         for pid in pids:
             # check whether there is a file corresponding to this still?
-            fn = os.path.join(self.procdir, "{}".format(pid))
+            fn = self._pid_files.get(pid, os.path.join(self.procdir, "{}".format(pid)))
             if not os.path.exists(fn):
                 self.disp_msg("file for {} does not exist!".format(pid), level='W')
                 w_cnt += 1
@@ -404,15 +498,18 @@ class SimHandler(object):
         return w_cnt
 
 
+    def _sandbox_dir(self):
+        ''' the sandbox made by the deploy tool '''
+        depdir = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
+        prj_name = os.path.splitext(os.path.basename(self.config['PRJ_FILE']))[0]
+        return os.path.join(depdir, prj_name + '_sandbox')
+
     def _arch_dep_sandbox(self):
         '''
         copy the sandbox made by deploy tool into archive.
         '''
         if self._deployed:
-            depdir = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
-            prj_name = os.path.splitext(os.path.basename(self.config['PRJ_FILE']))[0]
-            sandbox_dir = prj_name + '_sandbox'
-            src = os.path.join(depdir, sandbox_dir)
+            src = self._sandbox_dir()
             dst = os.path.join(self.archdir, "sandbox_dep")# sandbox_dir)
             #print _C_ERR + "[I] will copy \n\tfrom {}\n\tto {}  ".format(src, dst)
             try:
@@ -456,22 +553,33 @@ class SimHandler(object):
 
 
 
-    def close_active_processes(self, sig = signal.SIGINT):
+    def close_active_processes(self, sig = signal.SIGINT, keep_persistent=False):
         '''
-        terminate all active process handles with the signal `sig`
+        terminate all active process handles with the signal `sig` (except
+        the simulator, if `keep_persistent`)
         '''
         self.disp_msg("Closing down persistent procs")
         self.check_stillactive_pids()
 
+        kept = []
         for p in self.p_handles:
+            if keep_persistent and p in self._persistent:
+                kept.append(p)
+                continue
             self.disp_msg("\t pgkill -{} {}".format(sig, p.pid))
             if p.pid is not None:
-                os.killpg(p.pid, sig)
+                try:
+                    os.killpg(p.pid, sig)
+                except OSError as e: # (the whole group already exited)
+                    self.disp_msg("\t could not signal {}: {}".format(p.pid, e), level='W')
                 self._remove_pid_file(p)
+        self.p_handles = kept
 
 
     def cd(self, pth):
         ''' convenience wrapper for ch dir since used so frequently '''
+        if os.path.realpath(pth) == os.path.realpath(os.getcwd()):
+            return # (stages running concurrently all use the same wd)
         self.disp_cmd_to_exec("cd {}".format(pth))
         os.chdir(pth)
 
@@ -504,6 +612,43 @@ class SimHandler(object):
                 shutil.copy2(s, d)
 
     #{{{ process stage outputs
+    def start_capture(self, p2, stagename, stem=None):
+        '''
+        stream the output of `p2` (started with stdout and stderr as
+        subprocess.PIPE) into the stage logs, as it arrives; see capture.py.
+        Returns the capture, for `end_capture`.
+        '''
+        if isinstance(p2, FakeProc): # (nothing to stream)
+            out, err = p2.communicate()
+            self.write_stage_stdout_log(out, stagename, p2.pid)
+            self.process_stage_error_log(err, stagename, p2.pid)
+            return None
+        echo = None
+        if self.verb > 0:
+            def echo(stage, line):
+                with self._io_lock:
+                    print "{}:\t".format(stage), _C_WARNING + line + _C_ENDC
+        return capture.StageCapture(p2, self.stagelogdir, stagename,
+                                    stem=stem, echo=echo)
+
+    def end_capture(self, cap, required=False):
+        '''
+        wait for a capture (and its process) to finish, and report how many
+        warning/error entries it had in stderr. If `required` (the spawn
+        stages), a non-zero exit status is recorded, and the run is then
+        not marked complete.
+        '''
+        if cap is None:
+            return None
+        rc = cap.join()
+        if cap.n_entries:
+            self.disp_msg(cap.summary(), level=cap.level)
+        if required and rc:
+            self._failed_spawns[cap.stagename] = rc
+            self.disp_msg("'{}' stage exited with status {}".format(
+                cap.stagename, rc), level='E')
+        return rc
+
     def write_stage_stdout_log(self, out, stagename, this_pid):
         '''
         emit to file the standard output from a given stage
@@ -552,28 +697,43 @@ class SimHandler(object):
         else:
             pre = ""
             post = ""
-        print "#{}[{}]{} {} > {}{}{}".format(pre, level, post,
-            now.strftime("%H:%M:%S"), pre, msg, post)
-        sys.stdout.flush()
+        with self._io_lock:
+            print "#{}[{}]{} {} > {}{}{}".format(pre, level, post,
+                now.strftime("%H:%M:%S"), pre, msg, post)
+            sys.stdout.flush()
 
     def disp_cmd_to_exec(self, cmd, level='I', verb=False, bg=False, prestore=False):
         now = datetime.datetime.now()
         _bgs = ""
         if bg: _bgs = "&"
-        cmd_str = "#[{}] {} {:3} $  {} {}".format(
-            level, now.strftime("%H:%M:%S"), self._cmd_idx, cmd, _bgs)
-        print _C_TEST + cmd_str + _C_ENDC
-        if prestore:
-            self._pre_cmdlog.append(cmd_str)
-        else:
-            self._cmdlog.write(cmd_str + "\n")
-            #print _C_TEST + "#[{}] {} $  {} {}".format(level, now.strftime("%H:%M:%S"), cmd, _bgs) + _C_ENDC
-            sys.stdout.flush()
-        self._cmd_idx += 1
+        with self._io_lock:
+            cmd_str = "#[{}] {} {:3} $  {} {}".format(
+                level, now.strftime("%H:%M:%S"), self._cmd_idx, cmd, _bgs)
+            print _C_TEST + cmd_str + _C_ENDC
+            if prestore:
+                self._pre_cmdlog.append(cmd_str)
+            else:
+                self._cmdlog.write(cmd_str + "\n")
+                #print _C_TEST + "#[{}] {} $  {} {}".format(level, now.strftime("%H:%M:%S"), cmd, _bgs) + _C_ENDC
+                sys.stdout.flush()
+            self._cmd_idx += 1
 
     def done(self):
         if self._cmdlog is not None and self._cmdlog.closed is False:
             self._cmdlog.close()
+
+    def mark_complete(self):
+        '''
+        record that the run finished (a campaign then skips it), unless a
+        spawn stage failed. Returns True if marked.
+        '''
+        if self._failed_spawns:
+            self.disp_msg("not marking rpt {} complete: failed stages {}".format(
+                self.rpt, ", ".join(sorted(self._failed_spawns))), level='E')
+            return False
+        with open(os.path.join(self.logdir, COMPLETE_MARKER), 'w') as f:
+            f.write("{}\n".format(datetime.datetime.now()))
+        return True
     #}}}
 
     #{{{ validation
@@ -804,16 +964,30 @@ class SimHandler(object):
         '''
         This stage involves
         - starting the playground
-        - spawning CASUs
         - spawning walls
+        - spawning CASUs
         - deploying code to the CASUs (this transfers, does not start exec)
 
+        (in sequence; `run_stages` runs the independent parts concurrently)
         '''
 
         '''
         All p1 are nonblockign and returned
         all p2 are blocking and no handles kept.
         '''
+        self.launch_simulator()
+        for pop in self.config.get('agents', {}):
+            self.spawn_walls(pop)
+        self.spawn_casus()
+        self.deploy()
+
+        self.disp_msg("pre-calib setup complete.")
+
+    def launch_simulator(self):
+        '''
+        start the playground (non-blocking), and wait until it accepts
+        connections
+        '''
         wd = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
         self.cd(wd)
 
@@ -855,67 +1029,92 @@ class SimHandler(object):
         self._add_pid_file(p1)
         self.f_handles.append(f_simulator_stdout)
         self.f_handles.append(f_simulator_stderr)
+        self._persistent.update([p1, f_simulator_stdout, f_simulator_stderr])
+        self._proc_names[p1] = 'simulator'
 
-        # sleep a bit for simulator to launch before attempting to connect to it
-        self.disp_cmd_to_exec("sleep {}".format(2.0))
-        time.sleep(2.0)
+        # wait for simulator to accept connections before connecting to it
+        self.wait_ready(self._sim_probes(), "simulator")
 
-        #{{{ we spawn walls here for each population
-        _ag_data = self.config.get('agents', {})
-        for pop, data in _ag_data.items():
-        #for pop, data in self.config['agents'].items():
-            _ws = data.get('wall_spawner', None)
-            _spec = data.get('wall_spec', None)
-            if _ws is None:
-                if _spec is None: # nothing defined, OK but skip
-                    continue # skip to next population
-                else: # specfile defined, OK
-                    # we can continue, we just enter the spec into db. (another
-                    # popln or tool has (or will have) handled generating spec)
-
-                    data['arena_bounds_file'] = os.path.join(self.logdir, _spec)
-                    continue
-            else:
-                if _spec is not None: # BOTH defined -- clash
-                    raise RuntimeError, "[E] cannot proceed with BOTH a wall spawning progam and a specfile declared: conflicting config"
-                else: # spawner defined, specfile undef, OK, run it
-                    pass
+    #{{{ we spawn walls here for each population
+    def spawn_walls(self, pop):
+        '''
+        run the wall spawner of population `pop` (blocking), or just record
+        its wall_spec, if either is defined
+        '''
+        wd = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
+        self.cd(wd)
+        data = self.config['agents'][pop]
+        _ws = data.get('wall_spawner', None)
+        _spec = data.get('wall_spec', None)
+        if _ws is None:
+            if _spec is None: # nothing defined, OK but skip
+                return
+            else: # specfile defined, OK
+                # we can continue, we just enter the spec into db. (another
+                # popln or tool has (or will have) handled generating spec)
 
-            arena_bounds_file = os.path.join(
-                self.logdir, "{}-arenalims.arena".format(pop))
-            data['arena_bounds_file'] = arena_bounds_file
+                data['arena_bounds_file'] = os.path.join(self.logdir, _spec)
+                return
+        else:
+            if _spec is not None: # BOTH defined -- clash
+                raise RuntimeError, "[E] cannot proceed with BOTH a wall spawning progam and a specfile declared: conflicting config"
+            else: # spawner defined, specfile undef, OK, run it
+                pass
+
+        arena_bounds_file = os.path.join(
+            self.logdir, "{}-arenalims.arena".format(pop))
+        data['arena_bounds_file'] = arena_bounds_file
+
+        spwn_cmd = "{} -l {} -o {}".format(_ws, pop, arena_bounds_file)
+        # add in switches for custom addresses if defined (note that
+        # the HOST subaddr is the client/tool *pub* addr)
+        if self.CUSTOM_ADDRS:
+            spwn_cmd += " --pub-addr {} --sub-addr {} ".format(
+                self.custom_subaddr, self.custom_pubaddr)
+        self.disp_cmd_to_exec(spwn_cmd)
+        p2 = wrapped_subproc(DO_TEST, spwn_cmd, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, shell=True)
+        self.end_capture(self.start_capture(p2, "spawn_walls_{}".format(pop)),
+                         required=True)
+
+        if self.ARCHIVE_SPAWNER and _ws is not None:
+            if os.path.isfile(_ws):
+                pth = os.path.join(self.archdir, pop)
+                self.mkdir(pth)
+                self.copyfile(_ws, pth)
+    #}}}
 
-            spwn_cmd = "{} -l {} -o {}".format(_ws, pop, arena_bounds_file)
-            # add in switches for custom addresses if defined (note that
-            # the HOST subaddr is the client/tool *pub* addr)
-            if self.CUSTOM_ADDRS:
-                spwn_cmd += " --pub-addr {} --sub-addr {} ".format(
-                    self.custom_subaddr, self.custom_pubaddr)
-            self.disp_cmd_to_exec(spwn_cmd)
-            p2 = wrapped_subproc(DO_TEST, spwn_cmd, stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE, shell=True)
-            p2.wait()
+    #{{{ spawn the casus
+    def project_arena(self):
+        ''' the .arena file of the project (relative to DEPLOY_DIR), or None '''
+        pf = os.path.join(self.project_root, self.config['DEPLOY_DIR'], self.config['PRJ_FILE'])
+        with open(pf) as project_file:
+            project = yaml.safe_load(project_file)
+        return project.get('arena', None)
 
-            this_pid = p2.pid
-            out, err = p2.communicate()
-            _stage = "spawn_walls_{}".format(pop)
-            self.write_stage_stdout_log( out, _stage, this_pid)
-            self.process_stage_error_log(err, _stage, this_pid)
-
-            if self.ARCHIVE_SPAWNER and _ws is not None:
-                if os.path.isfile(_ws):
-                    pth = os.path.join(self.archdir, pop)
-                    self.mkdir(pth)
-                    self.copyfile(_ws, pth)
-        #}}}
-
-        #{{{ spawn the casus
+    def controlled_casus(self):
+        ''' names of the CASUs that have a controller in the project .dep file '''
+        wd = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
+        with open(os.path.join(wd, self.config['PRJ_FILE'])) as project_file:
+            project = yaml.safe_load(project_file)
+        if project.get('dep') is None:
+            return []
+        with open(os.path.join(wd, project['dep'])) as dep_file:
+            dep = yaml.safe_load(dep_file) or {}
+        names = []
+        for layer, casus in dep.items():
+            for name, spec in (casus or {}).items():
+                if (spec or {}).get('controller'):
+                    names.append(name)
+        return sorted(names)
+
+    def spawn_casus(self):
+        ''' spawn the CASUs of the project arena (blocking) '''
+        wd = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
+        self.cd(wd)
         #spwn_casus = "{} {}".format(self.TOOL_CASU_SPAWN, self.config['PRJ_FILE'])
         # TODO: until PR#39 is accepted, this needs to give the .arena file!
-        a_file = None
-        with open(self.config['PRJ_FILE']) as project_file:
-            project = yaml.safe_load(project_file)
-            a_file = project.get('arena', None)
+        a_file = self.project_arena()
 
         if a_file is not None:
             spwn_casus = "{} {}".format(self.TOOL_CASU_SPAWN, a_file)
@@ -932,17 +1131,9 @@ class SimHandler(object):
             p2 = wrapped_subproc(
                 DO_TEST, spwn_casus, shell=True,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,)
-            p2.wait()
-            this_pid = p2.pid
-            out, err = p2.communicate()
-            self.write_stage_stdout_log( out, "sim", this_pid)
-            self.process_stage_error_log(err, "sim", this_pid)
-
-        #}}}
+            self.end_capture(self.start_capture(p2, "sim"), required=True)
 
-        self.deploy()
-
-        self.disp_msg("pre-calib setup complete.")
+    #}}}
     #}}}
     #{{{ phys-only version for pre_calib_setup
     def phys_pre_calib_setup(self, ):
@@ -973,44 +1164,56 @@ class SimHandler(object):
         self.cd(wd)
         dply_cmd = "{} {}".format(self.TOOL_DEPLOY, self.config['PRJ_FILE'])
         self.disp_cmd_to_exec(dply_cmd)
-        p2 = wrapped_subproc(DO_TEST, dply_cmd, shell=True,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE, )
-
-        p2.wait()
-        this_pid = p2.pid
-        out, err = p2.communicate()
-        # rest goes to logfile.
-        self.write_stage_stdout_log( out, "deploy", this_pid)
-        self.process_stage_error_log(err, "deploy", this_pid)
-
-        self._deployed = True
-
-        self.disp_msg("deployment complete.")
-        if self.selected_archives.get('deploy_sandbox', False):
-            time.sleep(0.5)
-            self.disp_msg('attempting to archive the deployment config')
-            self._arch_dep_sandbox()
+        # the sandbox is shared by concurrent runs of the same project (in a
+        # campaign), so only one deploys at a time, and the sandbox is
+        # archived before the next one can rewrite it
+        with open(os.path.join(wd, '.deploy.lock'), 'a') as lockf:
+            fcntl.flock(lockf, fcntl.LOCK_EX)
+            try:
+                p2 = wrapped_subproc(DO_TEST, dply_cmd, shell=True,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, )
+                # rest goes to logfile.
+                self.end_capture(self.start_capture(p2, "deploy"))
+                self._deployed = True
+
+                self.disp_msg("deployment complete.")
+                if self.selected_archives.get('deploy_sandbox', False):
+                    self.wait_ready([probes.FileProbe(self._sandbox_dir(), timeout=5.0)],
+                                    "deploy sandbox")
+                    self.disp_msg('attempting to archive the deployment config')
+                    self._arch_dep_sandbox()
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
         pass
 
 
 
-    def calib_casus(self):
+    def calib_casus(self, append=False):
         '''
         for now not separated, so here we simply start the casu
         program with assisi run, and add the process handle to
         internal list.
-        Note: this stage also blocks for `calib_timeout`
+        Note: this stage also blocks, until the CASUs report ready or for at
+        most `calib_timeout`. Readiness is only observed if the config sets
+        `calib_ready_marker` (a regex matched against the CASU output, which
+        must appear on one distinct line per CASU with a controller in the
+        .dep file) or `calib_ready_file`; without either, it always waits
+        for the full `calib_timeout`.
+        If `append`, the output is added to the logs (of a restart).
         '''
         wd = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
         self.cd(wd)
 
         # non-blocking
         casu_cmd = "{} {}".format(self.TOOL_CASU_EXEC, self.config['PRJ_FILE'])
-        outf = open(os.path.join(self.logdir, "casu_stdout.log"), 'w')
+        mode = 'a' if append else 'w'
+        outf = open(os.path.join(self.logdir, "casu_stdout.log"), mode)
+        outf.seek(0, os.SEEK_END)
+        log_start = outf.tell() # (a restart only counts its own markers)
 
         # we can't know pid before the process is started; accept this one as-is
-        std_err_file = open(os.path.join(self.stagelogdir, "assisirun.stderr"), 'w')
+        std_err_file = open(os.path.join(self.stagelogdir, "assisirun.stderr"), mode)
 
         self.disp_cmd_to_exec(casu_cmd + "> {}".format(outf.name))
         p1 = wrapped_subproc(DO_TEST,  casu_cmd, stdout=outf, stderr=std_err_file,
@@ -1019,16 +1222,51 @@ class SimHandler(object):
         self._add_pid_file(p1)
         self.f_handles.append(outf)
         self.f_handles.append(std_err_file)
-
-        self.disp_cmd_to_exec("sleep {}".format(self.calib_timeout))
-        time.sleep(self.calib_timeout)
+        self._proc_names[p1] = 'casus'
+
+        _probes = []
+        if self.calib_ready_marker is not None:
+            n_casus = len(self.controlled_casus())
+            _probes.append(probes.LogMarkerProbe(
+                outf.name, self.calib_ready_marker, timeout=self.calib_timeout,
+                count=max(n_casus, 1), start=log_start))
+        if self.calib_ready_file is not None:
+            _probes.append(probes.FileProbe(
+                os.path.join(wd, self.calib_ready_file), timeout=self.calib_timeout))
+        if _probes:
+            self.wait_ready(_probes, "calibration")
+        else:
+            # nothing to observe; allow the full calibration time
+            self.disp_msg("no calib_ready_marker/calib_ready_file in config: " +
+                          "waiting the full calib_timeout ({}s)".format(self.calib_timeout))
+            self.disp_cmd_to_exec("sleep {}".format(self.calib_timeout))
+            time.sleep(self.calib_timeout)
         self.disp_msg("calibration done, ready to spawn agents")
 
 
+    def _setup_occupancy_map(self, bounds_files):
+        '''
+        create a shared occupancy map in the logdir, covering all arena
+        bounds, so that the agent spawners (run concurrently) keep their
+        agents `spawn_min_sep` apart (config; default 1.5, 0 to disable).
+        Returns the environment for the spawners.
+        '''
+        env = dict(os.environ)
+        min_sep = float(self.config.get('spawn_min_sep', 1.5) or 0)
+        if min_sep <= 0 or not bounds_files:
+            return env
+        from assisipy_utils.arena import sharedmap
+        stem = os.path.join(self.logdir, 'occupancy')
+        occ = sharedmap.create_for_specs(stem, bounds_files, min_sep=min_sep)
+        self.disp_msg("created {}".format(occ))
+        env[sharedmap.ENV_VAR] = stem
+        return env
+
     def init_agents(self, ):
         '''
         This stage spawns agents from all populations as defined in config.
-        The spawning is blocking.
+        The spawners of all populations run concurrently, sharing an
+        occupancy map (see `_setup_occupancy_map`); the stage is blocking.
         '''
         # this function does a bit more - it spawns the bees afterwards;
         # perhaps we should define spawn at a high level?
@@ -1036,9 +1274,13 @@ class SimHandler(object):
         self.cd(wd)
 
         spawn_count = 0
-
-        # we spawn all the agents for here for each population (blocking)
         _ag_data = self.config.get('agents', {})
+        env = self._setup_occupancy_map(
+            [d['arena_bounds_file'] for d in _ag_data.values()
+             if d.get('spawner') is not None and d.get('arena_bounds_file') is not None])
+        spawners = []
+
+        # we launch the spawners for all populations, then wait for them all
         for pop, data in _ag_data.items():
         #for pop, data in self.config['agents'].items():
             _as = data.get('spawner', None)
@@ -1071,22 +1313,23 @@ class SimHandler(object):
                     self.custom_subaddr, self.custom_pubaddr)
             self.disp_cmd_to_exec(spwn_cmd)
             p2 = wrapped_subproc(DO_TEST, spwn_cmd, stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE, shell=True)
-            p2.wait()
-            this_pid = p2.pid
-            out, err = p2.communicate()
-            _stage = "spawn_agents_{}".format(pop)
-            self.write_stage_stdout_log( out, _stage, this_pid)
-            self.process_stage_error_log(err, _stage, this_pid)
+                                 stderr=subprocess.PIPE, shell=True, env=env)
+            cap = self.start_capture(p2, "spawn_agents_{}".format(pop))
+            spawners.append((pop, data, cap))
+
+        # collect all spawners (waits for each to finish)
+        for pop, data, cap in spawners:
+            self.end_capture(cap, required=True)
             data['agents_spawned'] = True
             spawn_count += 1
 
         self.disp_msg("Agents spawned from {} populations. Ready to exec.".format(spawn_count))
 
-    def run_agents(self, ):
+    def run_agents(self, append=False):
         '''
         This assumes the requirement of executing hanlders for all agents from
         all populations. The exec is non-blocking.
+        If `append`, the output is added to the logs (of a restart).
         '''
 
         # execute all agent behaviour scripts
@@ -1121,7 +1364,7 @@ class SimHandler(object):
             #
             exec_listings.append( data['obj_listing'])
             # any archives then put into log folder
-            _archs = data.get('archives', [])
+            _archs = list(data.get('archives', []))
             if self.ARCHIVE_BEHAV_SCRIPT:
                 _archs += [_ab]
             for f in _archs:
@@ -1140,10 +1383,11 @@ class SimHandler(object):
             #
             # setup files for logging output.
             _stage = os.path.splitext(os.path.basename(self.TOOL_EXEC_AGENTS))[0]
+            mode = 'a' if append else 'w'
             f_stdout = open(
-                os.path.join( self.stagelogdir, "{}.stdout".format(_stage)), 'w')
+                os.path.join( self.stagelogdir, "{}.stdout".format(_stage)), mode)
             f_stderr = open(
-                os.path.join( self.stagelogdir, "{}.stderr".format(_stage)), 'w')
+                os.path.join( self.stagelogdir, "{}.stderr".format(_stage)), mode)
 
             self.disp_cmd_to_exec(agent_cmd, bg=True)
             p1 = wrapped_subproc(DO_TEST, agent_cmd, stdout=f_stdout,
@@ -1152,22 +1396,230 @@ class SimHandler(object):
             self._add_pid_file(p1)
             self.f_handles.append(f_stdout)
             self.f_handles.append(f_stderr)
+            self._proc_names[p1] = 'handlers'
+
+    #{{{ dependency graph of the stages
+    def stage_graph(self):
+        '''
+        the stages of a simulation run, with their dependencies:
+        - the walls and CASUs are spawned once the simulator is up;
+        - deployment needs nothing else, so proceeds alongside;
+        - calibration needs the CASUs spawned and the code deployed;
+        - agents are spawned within the walls, after calibration;
+        - the agent handlers start once the agents exist.
+        '''
+        G = stages.StageGraph()
+        G.add('simulator', self.launch_simulator)
+        walls = []
+        for pop in self.config.get('agents', {}):
+            _s = 'walls_{}'.format(pop)
+            G.add(_s, lambda pop=pop: self.spawn_walls(pop), deps=['simulator'])
+            walls.append(_s)
+        G.add('casus', self.spawn_casus, deps=['simulator'])
+        G.add('deploy', self.deploy)
+        G.add('calib', self.calib_casus, deps=['deploy', 'casus'])
+        G.add('agents', self.init_agents, deps=['calib'] + walls)
+        G.add('handlers', self.run_agents, deps=['agents'])
+        return G
+
+    def warm_stage_graph(self):
+        '''
+        the stages of a warm repeat, in which the simulator, CASUs and walls
+        are still running from the previous repeat (see `next_rep`):
+        - each population is reset (fresh poses), alongside
+        - the restart of the CASU controllers;
+        - the agent handlers start once both are done.
+        '''
+        G = stages.StageGraph()
+        resets = []
+        for pop, data in self.config.get('agents', {}).items():
+            if not data.get('agents_spawned', False):
+                continue
+            _s = 'reset_{}'.format(pop)
+            G.add(_s, lambda pop=pop: self.reset_agents(pop))
+            resets.append(_s)
+        G.add('calib', self.calib_casus)
+        G.add('handlers', self.run_agents, deps=['calib'] + resets)
+        return G
+
+    def run_stages(self, G=None):
+        '''
+        run all stages up to the start of the agent handlers (those of
+        `stage_graph`, unless another graph `G` is given), each as soon
+        as its dependencies are complete (at most `stage_workers` at a time,
+        from config; default no limit, and 1 runs them in sequence). The
+        timing of each stage and the critical path are written to
+        `stage_logs/stage_timing.yaml`.
+        '''
+        wd = os.path.join(self.project_root, self.config['DEPLOY_DIR'])
+        self.cd(wd)
+        if G is None:
+            G = self.stage_graph()
+        verb = self.disp_msg if self.verb > 0 else None
+        try:
+            G.run(max_workers=self.config.get('stage_workers', None), verb=verb)
+        finally:
+            rpt = G.last_report
+            if rpt is not None:
+                _fn = os.path.join(self.stagelogdir, 'stage_timing.yaml')
+                with open(_fn, 'w') as f:
+                    yaml.safe_dump(rpt.to_dict(), f, default_flow_style=False)
+                self.disp_msg(str(rpt))
+        self.disp_msg("all stages complete.")
+        return rpt
+    #}}}
+
+    #{{{ warm repeats
+    def rep_seed(self, pop):
+        '''
+        seed for the poses of population `pop` in this repeat, derived from
+        the config `seed` (default 0), so each repeat differs but can be
+        regenerated
+        '''
+        from assisipy_utils.arena.popgen import substream_seed
+        return substream_seed(self.config.get('seed', 0) or 0,
+                              "{}:rpt{}".format(pop, self.rpt))
+
+    def reset_agents(self, pop):
+        '''
+        move the (already spawned) agents of population `pop` to fresh poses
+        within their arena bounds, and write their new object listing into
+        the logdir of this repeat
+        '''
+        data = self.config['agents'][pop]
+        obj_listing = os.path.join(self.logdir, "{}-listing.csv".format(pop))
+        rst_cmd = "{} -ol {} -a {} --label {} --seed {} -o {}".format(
+            self.TOOL_RESET_POP, data['obj_listing'], data['arena_bounds_file'],
+            pop, self.rep_seed(pop), obj_listing)
+        min_sep = float(self.config.get('spawn_min_sep', 1.5) or 0)
+        if min_sep > 0:
+            rst_cmd += " -s {}".format(min_sep)
+        # keep clear of the CASUs, as the spawners do (see spawn_agents.py)
+        a_file = self.project_arena()
+        if a_file is not None:
+            rst_cmd += " -c {} --casu-radius {}".format(
+                a_file, float(self.config.get('spawn_casu_radius', 2.0)))
+        # add in switches for custom addresses if defined (note that
+        # the HOST subaddr is the client/tool *pub* addr)
+        if self.CUSTOM_ADDRS:
+            rst_cmd += " --pub-addr {} --sub-addr {} ".format(
+                self.custom_subaddr, self.custom_pubaddr)
+        self.disp_cmd_to_exec(rst_cmd)
+        p2 = wrapped_subproc(DO_TEST, rst_cmd, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, shell=True,
+                             env=self._occupancy_env)
+        self.end_capture(self.start_capture(p2, "reset_agents_{}".format(pop)),
+                         required=True)
+        data['obj_listing'] = obj_listing
+
+    def end_rep(self, expected_file_cnt=None):
+        '''
+        finish the current repeat, but keep the simulator (and so the CASUs,
+        walls and agents in it) running: stop the CASU controllers and agent
+        handlers, and collect the logs of this repeat.
+        '''
+        self.close_active_processes(keep_persistent=True)
+        self.disp_msg("Closing log files of rpt {}".format(self.rpt))
+        kept = []
+        for lf in self.f_handles:
+            if lf in self._persistent:
+                kept.append(lf)
+            else:
+                lf.close()
+        self.f_handles = kept
+        self.collect_logs(expected_file_cnt=expected_file_cnt)
+        self.done()
+        self.mark_complete()
+        self.disp_msg(_C_OKBLUE + "Results of rpt {} are in {}".format(
+            self.rpt, self.logdir) + _C_ENDC)
+
+    def next_rep(self, rpt):
+        '''
+        start repeat `rpt` in the running simulator: a new logdir, then
+        (with `run_stages(warm_stage_graph())`) reset agents and restart
+        the controllers.
+        '''
+        self.rpt = rpt
+        self._pre_cmdlog = []
+        # (failures of the walls, CASUs or first spawn of the agents carry
+        # over, since those persist into this repeat)
+        for stage in [k for k in self._failed_spawns if k.startswith('reset_agents_')]:
+            del self._failed_spawns[stage]
+        self._check_and_mk_logdir()
+        self._setup_dirs()
+        self._setup_cmdlog()
+        self._arch_depconf()
+        # the shared occupancy map is rebuilt for the new poses
+        _ag_data = self.config.get('agents', {})
+        self._occupancy_env = self._setup_occupancy_map(
+            [d['arena_bounds_file'] for d in _ag_data.values()
+             if d.get('agents_spawned') and d.get('arena_bounds_file') is not None])
+    #}}}
 
     def wait_for_expt(self):
         ''' logical rename for other non-simulation based users of this class'''
-        self.wait_for_sim()
+        return self.wait_for_sim()
+
+    def _supervised(self):
+        ''' name -> handle, of the persistent processes still running '''
+        return dict((self._proc_names[p], p) for p in self.p_handles
+                    if p in self._proc_names)
+
+    def _restart_proc(self, name):
+        '''
+        start the process `name` again (for the supervisor); returns the
+        new handle. The process group of the old one is interrupted first,
+        since its children (e.g. the per-bee handlers of run_multiagent)
+        can outlive it.
+        '''
+        old = self._supervised().get(name)
+        if old is not None:
+            if old.pid is not None:
+                self.disp_msg("\t pgkill -{} {}".format(signal.SIGINT, old.pid))
+                try:
+                    os.killpg(old.pid, signal.SIGINT)
+                except OSError as e: # (the whole group already exited)
+                    self.disp_msg("\t could not signal {}: {}".format(old.pid, e), level='W')
+            self.p_handles.remove(old)
+            self._remove_pid_file(old)
+        if name == 'casus':
+            self.calib_casus(append=True)
+        elif name == 'handlers':
+            self.run_agents(append=True)
+        else:
+            raise RuntimeError("[E] cannot restart {}".format(name))
+        return self._supervised()[name]
 
     def wait_for_sim(self):
         '''
-        blocking wait for the period defined in config.
+        blocking wait for the period defined in config, while supervising
+        the persistent processes: if one exits, the policy for it (config
+        `supervise`; see DEFAULT_POLICIES) is applied, which may end the run
+        early. A record of all exits is written to
+        `stage_logs/supervisor.yaml`.
+
+        Returns False if the run was aborted.
         '''
 
         now = datetime.datetime.now()
         fin = now + datetime.timedelta(0, self.sim_sec)
         self.disp_msg("running {} now,  for {}s. Expect completion at {}".format(
             self.expt_type, self.sim_sec, fin.strftime("%H:%M:%S") ), level='W')
-        time.sleep(self.sim_sec)
+        sup = supervisor.Supervisor(
+            self._supervised(), policies=self.policies,
+            restart=self._restart_proc, max_restarts=self.max_restarts,
+            progress_interval=self.progress_interval,
+            report=lambda msg, level: self.disp_msg(msg, level=level))
+        rpt = sup.run(self.sim_sec)
+        _fn = os.path.join(self.stagelogdir, 'supervisor.yaml')
+        with open(_fn, 'w') as f:
+            yaml.safe_dump(rpt.to_dict(), f, default_flow_style=False)
+        if rpt.aborted:
+            self.disp_msg("{} ended early after {:.1f}s: {}".format(
+                self.expt_type, rpt.elapsed, rpt.reason), level='E')
+            return False
         self.disp_msg("{} done".format(self.expt_type), level='W')
+        return True
 
 
     def close_logs(self):
@@ -1202,28 +1654,20 @@ class SimHandler(object):
         cll_cmd = "{} {} --logpath {}".format( self.TOOL_COLLECT_LOGS,
             self.config['PRJ_FILE'], self.logdir)
         self.disp_cmd_to_exec(cll_cmd)
-        # NOTE: the collect_data script generates quite a lot of output
-        #       and this causes problems with subprocess.PIPE for files!
-        #       If the output is too big, it hangs!!! and the files don't
-        #       even get retrieved! TERRIBLE NEWS!
-        # == So this workaround uses real unix files to write the data to. ==
-        # can't get the pid of the process itself until it has already
-        # started, so for now just use generic name (one run _should_ only have
-        # one log anyway)
+        # NOTE: the collect_data script generates quite a lot of output,
+        #       which hangs if read with communicate once it has finished;
+        #       the output is streamed into the logs as it arrives.
+        # one run _should_ only have one log anyway, so use generic name
         self.coll_log_f_err = os.path.join(self.stagelogdir, "{}.stderr".format("collect_logs"))
         self.coll_log_f_out = os.path.join(self.stagelogdir, "{}.stdout".format("collect_logs"))
         self.cll_wd = wd
         self.cll_cmd = cll_cmd
-        with open(self.coll_log_f_err, 'w') as _fe, open(self.coll_log_f_out, 'w') as _fo:
-            p2 = wrapped_subproc(DO_EXEC, cll_cmd,
-                                 #stdout=subprocess.PIPE,
-                                 #stderr=subprocess.PIPE,
-                                 stdout=_fo, stderr=_fe,
-                                 shell=True)
-            p2.wait() # execute command
-            #this_pid = p2.pid
-
-        #TODO:  display a summary; accumulate warnings and error count
+        p2 = wrapped_subproc(DO_EXEC, cll_cmd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             shell=True)
+        # (summary of warnings and error count)
+        self.end_capture(self.start_capture(p2, "collect_logs", stem="collect_logs"))
 
 
         # 2. check #files in log path
@@ -1273,6 +1717,13 @@ def main():
     parser.add_argument('--ignore-precheck', action='store_true')
     parser.add_argument('-S', '--dry-run', action='store_true')
     parser.add_argument('--verb', type=int, default=0,)
+    parser.add_argument('--sim-host', type=str, default=None,
+                        help='simulator addr:pub_port:sub_port (overrides SIM_HOST in config)')
+    parser.add_argument('--deploy-dir', type=str, default=None,
+                        help='deployment directory (overrides DEPLOY_DIR in config)')
+    parser.add_argument('--warm-reps', type=int, default=1,
+                        help='run this many repeats (from RPT), keeping the simulator, ' +
+                        'CASUs and walls alive and only resetting the agents between them')
     args = parser.parse_args()
     #
 
@@ -1290,7 +1741,9 @@ def main():
     cwd = os.getcwd()
     hdlr = SimHandler(conf_file=args.conf, label=args.label, rpt=args.rpt,
                       allow_overwrite=args.allow_overwrite, dry_run=args.dry_run,
-                      ignore_precheck=args.ignore_precheck, verb=args.verb)
+                      ignore_precheck=args.ignore_precheck, verb=args.verb,
+                      sim_host=parse_sim_host(args.sim_host) if args.sim_host else None,
+                      deploy_dir=args.deploy_dir)
     if args.dry_run:
         print _C_OKGREEN + "[I] all done with checks." + _C_ENDC
         return
@@ -1299,17 +1752,28 @@ def main():
         return
 
     try:
-
+        interrupted = False
         try:
-            hdlr.pre_calib_setup() # initialise: playground, deploy, walls
-            hdlr.calib_casus()     # connect and timeout calibration (blocking)
-            hdlr.init_agents()     # spawn agents
-            hdlr.run_agents()      # connect handlers to agents
+            # initialise (playground, walls, casus, deploy), calibrate,
+            # spawn agents and connect their handlers
+            hdlr.run_stages()
             if args.verb:
                 hdlr.disp_msg("PIDs of persistent procs are {}".format(hdlr.get_pids()))
 
-            hdlr.wait_for_sim()    # main part to exec simulation
+            ok = hdlr.wait_for_sim() # main part to exec simulation
+
+            # further repeats in the same simulator
+            for rpt in xrange(args.rpt + 1, args.rpt + args.warm_reps):
+                if not ok:
+                    break
+                hdlr.end_rep(expected_file_cnt=expected_file_cnt)
+                hdlr.next_rep(rpt)
+                hdlr.run_stages(hdlr.warm_stage_graph())
+                ok = hdlr.wait_for_sim()
+            if not ok:
+                interrupted = True # (not marked complete)
         except KeyboardInterrupt:
+            interrupted = True
             hdlr.disp_msg("simln interrupted -- shutting down")
 
 
@@ -1323,6 +1787,8 @@ def main():
         hdlr.disp_msg(_C_OKBLUE + "Results are in {}".format(hdlr.logdir) + _C_ENDC)
         hdlr.disp_msg("------------- -------------------- -------------")
         hdlr.done()
+        if not interrupted:
+            hdlr.mark_complete()
 
     finally:
         hdlr.disp_cmd_to_exec("stty sane", prestore=True)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Readiness probes, used to move on to the next stage of a run as soon as the
+previous one is ready, rather than after a fixed sleep.
+
+A probe is a cheap, repeatable check with a timeout:
+- TcpProbe: a TCP port accepts connections (e.g. the simulator pub/sub
+  addresses, `tcp://host:port`)
+- LogMarkerProbe: a line matching a pattern appears in a log file (read
+  incrementally, so repeated checks only read new output), or `count`
+  distinct such lines (e.g. one from each CASU)
+- FileProbe: a file (or directory) exists
+
+`wait_ready` polls a set of probes with exponential backoff between rounds
+(starting at `interval`, growing by `backoff` up to `max_interval`), and
+returns once all are ready or have timed out.
+
+Example usage:
+
+    rpt = wait_ready([TcpProbe('tcp://localhost:5555', timeout=10.0),
+                      LogMarkerProbe('casu_stdout.log', 'calibrated')])
+    if not rpt.ok:
+        print "[W] not ready:", rpt.pending
+
+Rob Mills - BioISI, FCUL & ASSISIbf
+
+'''
+
+import os
+import re
+import socket
+import time
+
+
+#{{{ probes
+class Probe(object):
+    ''' base class: subclasses implement `check`, returning True if ready '''
+    def __init__(self, name=None, timeout=10.0):
+        self.name = name or self.__class__.__name__
+        self.timeout = float(timeout)
+
+    def check(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        return "{} (timeout {:.1f}s)".format(self.name, self.timeout)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def parse_tcp_addr(addr):
+    ''' split 'tcp://host:port' (or 'host:port') into (host, port) '''
+    if '://' in addr:
+        addr = addr.split('://', 1)[1]
+    host, port = addr.rsplit(':', 1)
+    if host in ('*', ''):
+        host = 'localhost'
+    return host, int(port)
+
+class TcpProbe(Probe):
+    ''' ready when a TCP connection to `addr` (tcp://host:port) succeeds '''
+    def __init__(self, addr, timeout=10.0, connect_timeout=0.5, name=None):
+        super(TcpProbe, self).__init__(name or "tcp {}".format(addr), timeout)
+        self.host, self.port = parse_tcp_addr(addr)
+        self.connect_timeout = connect_timeout
+
+    def check(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(self.connect_timeout)
+        try:
+            s.connect((self.host, self.port))
+            return True
+        except (socket.error, socket.timeout):
+            return False
+        finally:
+            s.close()
+
+class LogMarkerProbe(Probe):
+    '''
+    ready when `count` distinct lines matching the regular expression
+    `marker` have appeared in the file `fname` (repeats of a line are only
+    counted once). Only output added since the last check is read, starting
+    from byte `start` (e.g. the end of a log that is appended to).
+    '''
+    def __init__(self, fname, marker, timeout=20.0, name=None, count=1, start=0):
+        super(LogMarkerProbe, self).__init__(
+            name or "marker '{}' x{} in {}".format(
+                marker, count, os.path.basename(fname)),
+            timeout)
+        self.fname = fname
+        self.marker = re.compile(marker)
+        self.count = int(count)
+        self._pos = start
+        self._partial = ''
+        self.found = [] # the distinct matching lines, in order seen
+
+    def check(self):
+        if len(self.found) >= self.count:
+            return True
+        try:
+            with open(self.fname) as f:
+                f.seek(self._pos)
+                data = f.read()
+                self._pos = f.tell()
+        except IOError:
+            return False
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop() # incomplete last line
+        for line in lines:
+            if self.marker.search(line) and line not in self.found:
+                self.found.append(line)
+        return len(self.found) >= self.count
+
+class FileProbe(Probe):
+    ''' ready when `fname` exists (with at least `min_size` bytes) '''
+    def __init__(self, fname, min_size=0, timeout=10.0, name=None):
+        super(FileProbe, self).__init__(
+            name or "file {}".format(os.path.basename(fname.rstrip('/'))), timeout)
+        self.fname = fname
+        self.min_size = min_size
+
+    def check(self):
+        if not os.path.exists(self.fname):
+            return False
+        if self.min_size and os.path.isfile(self.fname):
+            return os.path.getsize(self.fname) >= self.min_size
+        return True
+#}}}
+
+#{{{ waiting
+class ReadyReport(object):
+    ''' outcome of `wait_ready`: time each probe took to become ready '''
+    def __init__(self, probes, ready_at, elapsed):
+        self.probes   = probes
+        self.ready_at = ready_at # name -> seconds, or None if timed out
+        self.elapsed  = elapsed
+
+    @property
+    def ok(self):
+        return all(t is not None for t in self.ready_at.values())
+
+    @property
+    def pending(self):
+        return [p.name for p in self.probes if self.ready_at[p.name] is None]
+
+    def __str__(self):
+        s = "ReadyReport: {} of {} ready in {:.2f}s".format(
+            len(self.probes) - len(self.pending), len(self.probes), self.elapsed)
+        for p in self.probes:
+            t = self.ready_at[p.name]
+            s += "\n\t{:40s} {}".format(
+                p.name, "timed out" if t is None else "{:.2f}s".format(t))
+        return s
+
+    def __repr__(self):
+        return self.__str__()
+
+def wait_ready(probes, interval=0.05, backoff=1.5, max_interval=1.0,
+               clock=time.time, sleep=time.sleep):
+    '''
+    poll all `probes` until each is ready or past its own timeout. Between
+    rounds, sleep for `interval`, multiplied by `backoff` each round (up to
+    `max_interval`). Returns a ReadyReport.
+    '''
+    t0 = clock()
+    ready_at = dict((p.name, None) for p in probes)
+    pending = list(probes)
+    dt = interval
+    while pending:
+        now = clock() - t0
+        still = []
+        for p in pending:
+            if p.check():
+                ready_at[p.name] = clock() - t0
+            elif now < p.timeout:
+                still.append(p)
+        pending = still
+        if not pending:
+            break
+        # don't sleep past the last deadline
+        wait = min(dt, max(max(p.timeout for p in pending) - (clock() - t0), 0))
+        sleep(wait)
+        dt = min(dt * backoff, max_interval)
+    return ReadyReport(list(probes), ready_at, clock() - t0)
+#}}}
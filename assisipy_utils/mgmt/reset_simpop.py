@@ -6,6 +6,12 @@ simple tool to reset the position of all agents as per their original spec
 
 for all agents defined in an object listing file
 
+Alternatively, fresh poses are drawn within a circle (-x, -y, -r), or
+within the valid zone of a bounds spec (-a, as for the spawners; used by
+exec_sim_timed to reset the population between warm repeats), kept clear
+of the CASUs of a deployment .arena file (-c).  The new poses can be
+written to a new object listing (-o).
+
 '''
 
 import argparse
@@ -13,8 +19,38 @@ import argparse
 import specs
 from assisipy_utils import tool_version
 from assisipy import sim
-import random
-from math import pi, sin, cos
+from assisipy_utils.arena.popgen import substream, gen_population
+from assisipy_utils.arena import read_reqs, read_zone, SharedOccupancyMap, casu_exclusions
+import numpy as np
+from math import pi
+
+def spec_poses(arena_file, n, label, seed=None, min_sep=None, casu_file=None,
+               casu_radius=2.0):
+    '''
+    `n` fresh poses within the bounds spec `arena_file`, from the substream
+    of `seed` for `label` (and kept clear of the agents reserved in a shared
+    occupancy map, if one is set in the environment). If `casu_file` (a
+    deployment .arena file) is given, the poses are at least `casu_radius`
+    from its CASUs, as for the spawners.
+    '''
+    bl, tr, trans = read_reqs(arena_file)
+    zone = read_zone(arena_file)
+    excl = None
+    if casu_file is not None:
+        excl = casu_exclusions(casu_file, radius=casu_radius)
+    return gen_population((bl, tr), n, label, seed=seed, trans=trans,
+                          zone=zone, min_sep=min_sep, exclusions=excl,
+                          occupancy=SharedOccupancyMap.from_env())
+
+def write_listing(fname, agent_data, poses):
+    ''' write the object listing `agent_data`, with the new `poses` '''
+    with open(fname, 'w') as f:
+        specs.write_header(f)
+        for d, pose in zip(agent_data, poses):
+            f.write(specs.gen_spec_str(
+                d.get('name'), d.get('type'), tuple(pose),
+                d.get('exec_script'), d.get('conf'),
+                pub_addr=d.get('pub_addr'), sub_addr=d.get('sub_addr')) + "\n")
 
 def main():
     ''' execute the handler for all agents in one or many agent specification listings '''
@@ -30,6 +66,20 @@ def main():
                         help='override x,y,r to reset popln to random positions in a circle given by x,y, radius')
     parser.add_argument('-r', type=float, default=None,
                         help='override x,y,r to reset popln to random positions in a circle given by x,y, radius')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the override positions (reproducible resets)')
+    parser.add_argument('--label', type=str, default='reset',
+                        help='population label, selecting the random substream of `seed`')
+    parser.add_argument('-a', '--arena-file', type=str, default=None,
+                        help='reset popln to random positions within the zone of this bounds spec')
+    parser.add_argument('-s', '--min-sep', type=float, default=None,
+                        help='minimum separation for positions within the bounds spec')
+    parser.add_argument('-c', '--casu-file', type=str, default=None,
+                        help='deployment .arena file; positions within the bounds spec are kept clear of its CASUs')
+    parser.add_argument('--casu-radius', type=float, default=2.0,
+                        help='distance kept from each CASU (with -c)')
+    parser.add_argument('-o', '--out-listing', type=str, default=None,
+                        help='write the object listing with the new poses to this file')
 
     tool_version.ap_ver(parser) # attach package dev version to parser
     parser.add_argument('--verb', type=int, default=0,)
@@ -47,11 +97,28 @@ def main():
     _longest = len( max(a_names, key=lambda p: len(p)) )
 
 
+    if args.arena_file is not None:
+        override_pos = True
+        override_poses = spec_poses(args.arena_file, len(agent_data),
+                                    args.label, seed=args.seed,
+                                    min_sep=args.min_sep,
+                                    casu_file=args.casu_file,
+                                    casu_radius=args.casu_radius)
+    elif override_pos:
+        # all override poses in one draw, from the substream for this label
+        rng = substream(args.seed, args.label)
+        n = len(agent_data)
+        _r = args.r * rng.uniform(0.0, 1.0, n)
+        theta = rng.uniform(0.0, 2*pi, n)
+        override_poses = np.column_stack(
+            [_r * np.cos(theta) + args.x, _r * np.sin(theta) + args.y, theta])
+
     simctrl = None
-    if len(d):
+    poses = []
+    if len(agent_data):
         simctrl = sim.Control(pub_addr=args.pub_addr, sub_addr=args.sub_addr)
 
-        for d in agent_data:
+        for i, d in enumerate(agent_data):
             print "\t{:{fwid}} ({:4}): {:20}".format(
                 d.get('name'),
                 d.get('type'),
@@ -60,20 +127,19 @@ def main():
             )
             #print type(d.get('pose')) # seems ok
             if override_pos:
-                _r = args.r * random.random()
-                theta = 2*pi * random.random()
-                x = _r * cos(theta) + args.x
-                y = _r * sin(theta) + args.y
-                yaw = theta
-                pose = (x,y,yaw)
+                pose = tuple(override_poses[i].tolist())
 
             else:
                 pose = d.get('pose')
 
             simctrl.teleport(d.get('name'), pose)
+            poses.append(pose)
 
-    return agent_data
+    if args.out_listing is not None:
+        write_listing(args.out_listing, agent_data, poses)
+        print "[I] wrote object listing to {}".format(args.out_listing)
 
+    return agent_data
 
 if __name__ == '__main__':
    ad = main()
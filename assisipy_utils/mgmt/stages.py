@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+A small dependency-graph scheduler for the stages of a run.
+
+Stages are declared with the names of the stages they depend on; each
+stage starts (in its own thread) as soon as all of its dependencies have
+completed, so independent stages run concurrently.  If a stage raises, the
+stages that depend on it are skipped, the others run to completion, and the
+exception is then re-raised.
+
+The run is timed: the start/end of each stage, and the critical path --
+the chain of dependent stages that determined the total duration.
+
+Example usage:
+
+    G = StageGraph()
+    G.add('simulator', launch_sim)
+    G.add('walls', spawn_walls, deps=['simulator'])
+    G.add('deploy', deploy)
+    G.add('calib', calibrate, deps=['deploy', 'simulator'])
+    rpt = G.run()
+    print rpt
+
+Rob Mills - BioISI, FCUL & ASSISIbf
+
+'''
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+#{{{ report
+class StageReport(object):
+    '''
+    timing of a run of a StageGraph: for each stage, its status ('done',
+    'failed', 'skipped') and start/end (seconds from the start of the run).
+    '''
+    def __init__(self, deps):
+        self.deps   = deps # name -> list of dependencies
+        self.status = OrderedDict((n, 'pending') for n in deps)
+        self.start  = {}
+        self.end    = {}
+        self.errors = {}
+        self.total  = 0.0
+
+    def duration(self, name):
+        if name not in self.end:
+            return 0.0
+        return self.end[name] - self.start[name]
+
+    def critical_path(self):
+        '''
+        the chain of stages, each waiting on the last to finish of its
+        dependencies, that ends with the last stage to finish
+        '''
+        if not self.end:
+            return []
+        path = [max(self.end, key=self.end.get)]
+        while True:
+            deps = [d for d in self.deps[path[-1]] if d in self.end]
+            if not deps:
+                break
+            path.append(max(deps, key=self.end.get))
+        return path[::-1]
+
+    def to_dict(self):
+        return {
+            'total_s' : round(self.total, 3),
+            'critical_path' : self.critical_path(),
+            'stages' : dict((n, {
+                'status'  : self.status[n],
+                'deps'    : list(self.deps[n]),
+                'start_s' : round(self.start.get(n, -1.0), 3),
+                'end_s'   : round(self.end.get(n, -1.0), 3),
+            }) for n in self.deps),
+        }
+
+    def __str__(self):
+        s = "StageReport: {:.2f}s".format(self.total)
+        for n, st in self.status.items():
+            s += "\n\t{:24s} {:8s} {:7.2f}s -> {:7.2f}s ({:.2f}s)".format(
+                n, st, self.start.get(n, 0.0), self.end.get(n, 0.0),
+                self.duration(n))
+        cp = self.critical_path()
+        s += "\n\tcritical path: {} ({:.2f}s)".format(
+            " -> ".join(cp), sum(self.duration(n) for n in cp))
+        return s
+
+    def __repr__(self):
+        return self.__str__()
+#}}}
+
+#{{{ graph
+class StageGraph(object):
+    ''' named stages with dependencies; see `run` '''
+    def __init__(self):
+        self.stages = OrderedDict() # name -> (fn, deps)
+        self.last_report = None # also available if a stage raised
+
+    def add(self, name, fn, deps=()):
+        ''' add stage `name`, calling `fn()`, after all stages in `deps` '''
+        if name in self.stages:
+            raise ValueError("[E] duplicate stage '{}'".format(name))
+        for d in deps:
+            if d not in self.stages:
+                raise ValueError("[E] stage '{}' depends on unknown stage '{}'".format(name, d))
+        self.stages[name] = (fn, list(deps))
+
+    def run(self, max_workers=None, poll=0.1, clock=time.time, verb=None):
+        '''
+        run all stages, at most `max_workers` at a time (default: no
+        limit; 1 runs them one by one, in the order added). Blocks until
+        all are finished, and returns a StageReport; the first exception
+        raised by a stage is re-raised once the others are done.
+        `verb` is an optional function to report stage starts/ends.
+        '''
+        deps = OrderedDict((n, d) for (n, (_fn, d)) in self.stages.items())
+        rpt = StageReport(deps)
+        cond = threading.Condition()
+        running = {}
+        first_exc = []
+        t0 = clock()
+
+        def work(name, fn):
+            try:
+                fn()
+                st = 'done'
+            except BaseException:
+                st = 'failed'
+                with cond:
+                    rpt.errors[name] = sys.exc_info()
+                    if not first_exc:
+                        first_exc.append(sys.exc_info())
+            with cond:
+                rpt.end[name] = clock() - t0
+                rpt.status[name] = st
+                running.pop(name, None)
+                cond.notify_all()
+            if verb:
+                verb("stage {} {} after {:.2f}s".format(name, st, rpt.duration(name)))
+
+        with cond:
+            while True:
+                # skip stages whose dependencies failed
+                changed = True
+                while changed:
+                    changed = False
+                    for n, ds in deps.items():
+                        if rpt.status[n] == 'pending' and any(
+                                rpt.status[d] in ('failed', 'skipped') for d in ds):
+                            rpt.status[n] = 'skipped'
+                            changed = True
+                ready = [n for n, ds in deps.items() if rpt.status[n] == 'pending'
+                         and all(rpt.status[d] == 'done' for d in ds)]
+                for n in ready:
+                    if max_workers is not None and len(running) >= max_workers:
+                        break
+                    rpt.status[n] = 'running'
+                    rpt.start[n] = clock() - t0
+                    if verb:
+                        verb("stage {} started".format(n))
+                    th = threading.Thread(target=work, args=(n, self.stages[n][0]),
+                                          name="stage-{}".format(n))
+                    th.daemon = True
+                    running[n] = th
+                    th.start()
+                if not running:
+                    break
+                # (a timeout, so that KeyboardInterrupt is delivered)
+                cond.wait(poll)
+
+        rpt.total = clock() - t0
+        self.last_report = rpt
+        if first_exc:
+            et, ev, tb = first_exc[0]
+            raise et, ev, tb
+        return rpt
+#}}}
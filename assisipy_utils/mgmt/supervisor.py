@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Supervise the long-lived processes of a run for a fixed duration, instead
+of sleeping blindly through it.
+
+The supervisor sleeps in `select` on a self-pipe that is written to on
+SIGCHLD (via `signal.set_wakeup_fd`), so it wakes up as soon as a child
+exits -- and otherwise only to report progress.  Each process has a
+policy, applied when it exits before the end:
+- 'abort'    : the run ends early (e.g. the simulator died)
+- 'restart'  : the process is started again (by a callback), at most
+               `max_restarts` times, after which the run is aborted
+- 'continue' : the exit is logged, and the run goes on
+
+Every exit is recorded with its exit status and time.  The supervisor must
+run in the main thread (for the signal handler).
+
+Example usage:
+
+    sup = Supervisor({'simulator': p_sim, 'handlers': p_agents},
+                     policies={'simulator': 'abort', 'handlers': 'restart'},
+                     restart=lambda name: relaunch(name))
+    rpt = sup.run(600)
+    if rpt.aborted:
+        print rpt.reason
+
+Rob Mills - BioISI, FCUL & ASSISIbf
+
+'''
+
+import errno
+import fcntl
+import os
+import select
+import signal
+import time
+
+POLICIES = ('abort', 'restart', 'continue')
+
+
+#{{{ report
+class ExitEvent(object):
+    ''' a supervised process that exited: when, and with what status '''
+    def __init__(self, name, pid, returncode, t, action):
+        self.name = name
+        self.pid = pid
+        self.returncode = returncode
+        self.t = t # seconds from the start of supervision
+        self.action = action # policy applied
+
+    def to_dict(self):
+        return {'name': self.name, 'pid': self.pid,
+                'returncode': self.returncode, 't_s': round(self.t, 3),
+                'action': self.action}
+
+    def __str__(self):
+        return "{} (pid {}) exited with status {} after {:.1f}s: {}".format(
+            self.name, self.pid, self.returncode, self.t, self.action)
+
+class SupervisorReport(object):
+    def __init__(self, duration):
+        self.duration = duration
+        self.elapsed = 0.0
+        self.events = []
+        self.restarts = {}
+        self.aborted = False
+        self.reason = None
+
+    def to_dict(self):
+        return {'duration_s': self.duration, 'elapsed_s': round(self.elapsed, 3),
+                'aborted': self.aborted, 'reason': self.reason,
+                'restarts': dict(self.restarts),
+                'events': [e.to_dict() for e in self.events]}
+
+    def __str__(self):
+        s = "SupervisorReport: {:.1f}s of {:.1f}s{}".format(
+            self.elapsed, self.duration,
+            ", aborted: {}".format(self.reason) if self.aborted else "")
+        for e in self.events:
+            s += "\n\t{}".format(e)
+        return s
+
+    def __repr__(self):
+        return self.__str__()
+#}}}
+
+#{{{ supervisor
+class Supervisor(object):
+    '''
+    `procs` maps names to process handles (with `pid` and `poll()`, as
+    subprocess.Popen); `policies` maps names to one of POLICIES (else
+    `default`). `restart(name)` starts a process again and returns its new
+    handle. `report(msg, level)` is used for progress and exits.
+    '''
+    def __init__(self, procs, policies=None, default='continue', restart=None,
+                 max_restarts=3, progress_interval=30.0, report=None,
+                 clock=time.time):
+        self.procs = dict(procs)
+        self.policies = dict(policies or {})
+        for name, pol in self.policies.items() + [('default', default)]:
+            if pol not in POLICIES:
+                raise ValueError("[E] unknown policy '{}' for {}; use one of {}".format(
+                    pol, name, ", ".join(POLICIES)))
+        self.default = default
+        self.restart = restart
+        self.max_restarts = max_restarts
+        self.progress_interval = progress_interval
+        self.report = report
+        self.clock = clock
+
+    def _say(self, msg, level='I'):
+        if self.report is not None:
+            self.report(msg, level)
+
+    def policy(self, name):
+        return self.policies.get(name, self.default)
+
+    def _handle_exit(self, name, p, rc, rpt, t):
+        ''' apply the policy for `name`; returns False if the run must end '''
+        action = self.policy(name)
+        del self.procs[name]
+        if action == 'restart':
+            n = rpt.restarts.get(name, 0)
+            if self.restart is None or n >= self.max_restarts:
+                action = 'abort'
+            else:
+                rpt.restarts[name] = n + 1
+        ev = ExitEvent(name, p.pid, rc, t, action)
+        rpt.events.append(ev)
+        self._say(str(ev), level='E' if action == 'abort' else 'W')
+        if action == 'abort':
+            rpt.aborted = True
+            rpt.reason = "{} exited (status {})".format(name, rc)
+            return False
+        if action == 'restart':
+            # the restart runs with the signal handling of the caller: with
+            # our handler, a child exiting would cut short its sleeps (py2
+            # does not resume time.sleep after a handled signal)
+            self._release_signals()
+            try:
+                self.procs[name] = self.restart(name)
+            except Exception as e:
+                rpt.aborted = True
+                rpt.reason = "could not restart {}: {}".format(name, e)
+                self._say(rpt.reason, level='E')
+                return False
+            finally:
+                self._take_signals()
+        return True
+
+    def _check(self, rpt, t):
+        for name, p in sorted(self.procs.items()):
+            rc = p.poll()
+            if rc is not None:
+                if not self._handle_exit(name, p, rc, rpt, t):
+                    return False
+        return True
+
+    def _take_signals(self):
+        '''
+        wake on SIGCHLD, via the wakeup fd; keeps the previous handler and
+        wakeup fd for `_release_signals`
+        '''
+        # a handler is needed for the signal to be delivered (and so for
+        # the wakeup fd to be written)
+        self._old_handler = signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        # don't interrupt other system calls; select returns regardless
+        signal.siginterrupt(signal.SIGCHLD, False)
+        self._old_wakeup = signal.set_wakeup_fd(self._wfd)
+
+    def _release_signals(self):
+        ''' put back the SIGCHLD handler and wakeup fd of the caller '''
+        signal.set_wakeup_fd(self._old_wakeup)
+        old = self._old_handler
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL if old is None else old)
+
+    def run(self, duration):
+        '''
+        supervise for `duration` seconds, or until a process with the
+        'abort' policy exits. Returns a SupervisorReport.
+        '''
+        rpt = SupervisorReport(duration)
+        t0 = self.clock()
+        rfd, wfd = os.pipe()
+        for fd in (rfd, wfd):
+            fl = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+        self._wfd = wfd
+        self._take_signals()
+        try:
+            next_progress = self.progress_interval
+            while True:
+                t = self.clock() - t0
+                # (also catches exits before we started listening)
+                if not self._check(rpt, t):
+                    break
+                t = self.clock() - t0 # (a restart takes time)
+                if t >= duration:
+                    break
+                wait = duration - t
+                if self.progress_interval:
+                    if t >= next_progress:
+                        self._say("{:.0f}s of {:.0f}s; running: {}".format(
+                            t, duration, ", ".join(sorted(self.procs)) or "none"))
+                        next_progress += self.progress_interval
+                    wait = min(wait, max(next_progress - t, 0))
+                try:
+                    r, _, _ = select.select([rfd], [], [], wait)
+                except select.error as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+                    r = [rfd]
+                if r:
+                    try:
+                        while os.read(rfd, 512):
+                            pass
+                    except OSError as e:
+                        if e.errno != errno.EAGAIN:
+                            raise
+        finally:
+            self._release_signals()
+            os.close(rfd)
+            os.close(wfd)
+        rpt.elapsed = self.clock() - t0
+        return rpt
+#}}}
@@ -49,10 +49,15 @@ console_scripts = [
     ['exec_sim_timed  = assisipy_utils.mgmt.exec_sim_timed:main'],
     ['exec_phys_timed = assisipy_utils.mgmt.exec_physonly_timed:main'],
     ['run_multiagent  = assisipy_utils.mgmt.run_multiagent:main'],
+    ['reset_simpop    = assisipy_utils.mgmt.reset_simpop:main'],
     ['test_assisi_dep = assisipy_utils.validate.test_conn:main'],
     ['layout_assisi_nbg = assisipy_utils.validate.draw_casu_graph:main'],
     ['show_assisi_dep_test = assisipy_utils.validate.show_conntest_results:main'],
-    ['assisi_stop_all = assisipy_utils.mgmt.stopper:main']
+    ['assisi_stop_all = assisipy_utils.mgmt.stopper:main'],
+    ['assisi_arena_spec = assisipy_utils.arena.specfile:main'],
+    ['assisi_arena_bench = assisipy_utils.arena.bench:main'],
+    ['assisi_arena_layout = assisipy_utils.arena.layout:main'],
+    ['assisi_campaign = assisipy_utils.mgmt.campaign:main'],
 ]
 
 
@@ -86,7 +91,7 @@ setup(
 
     # Run-time dependencies (will be installed by pip)
     #install_requires = ['assisipy >=0.9'], # working with dev version so disable req for now
-    install_requires = [],
+    install_requires = ['numpy'],
 
     entry_points     = {
         'console_scripts': console_scripts,